@@ -0,0 +1,148 @@
+"""
+Affiliate Analytics - Aggregated program summaries and leaderboard snapshots
+Summaries come from one $group over the owner's affiliates, program ids are
+cached per owner, and leaderboards are stored as snapshots that are rebuilt
+when a conversion is recorded.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from database import (
+    affiliate_programs_collection,
+    affiliates_collection,
+    affiliate_leaderboards_collection
+)
+
+# Program creation/deletion on other workers is picked up after at most this many seconds
+PROGRAM_IDS_CACHE_TTL = int(os.getenv('AFFILIATE_PROGRAM_IDS_CACHE_TTL', 60))
+MAX_CACHED_OWNERS = 5000
+# Entries kept per leaderboard snapshot; larger limits are computed live
+LEADERBOARD_SIZE = 100
+# Snapshots also expire, so status changes and clicks show up without a conversion
+LEADERBOARD_MAX_AGE = int(os.getenv('AFFILIATE_LEADERBOARD_MAX_AGE', 300))
+
+COUNTERS = (
+    "total_clicks",
+    "total_conversions",
+    "total_revenue",
+    "total_commissions",
+    "pending_commissions",
+    "paid_commissions"
+)
+
+LEADERBOARD_FIELDS = {
+    '_id': 0, 'id': 1, 'first_name': 1, 'last_name': 1, 'email': 1,
+    'total_clicks': 1, 'total_conversions': 1, 'total_revenue': 1, 'total_commissions': 1
+}
+
+
+class ProgramIndex:
+    """Program ids per owner, so owner-wide queries don't load every program"""
+
+    def __init__(self, ttl: int = PROGRAM_IDS_CACHE_TTL):
+        self.ttl = ttl
+        self._owners = {}  # owner_id -> (loaded_at, [program ids])
+
+    def program_ids(self, owner_id: str) -> List[str]:
+        entry = self._owners.get(owner_id)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            if len(self._owners) >= MAX_CACHED_OWNERS:
+                self._owners = {}
+            ids = [p["id"] for p in affiliate_programs_collection.find({"user_id": owner_id}, {'_id': 0, 'id': 1})]
+            entry = self._owners[owner_id] = (time.monotonic(), ids)
+        return entry[1]
+
+    def invalidate(self, owner_id: str):
+        self._owners.pop(owner_id, None)
+
+
+program_index = ProgramIndex()
+
+
+def program_filter(owner_id: str, program_id: Optional[str] = None) -> dict:
+    """Affiliate filter for one program, or every program of the owner"""
+    if program_id:
+        return {"program_id": program_id}
+    return {"program_id": {"$in": program_index.program_ids(owner_id)}}
+
+
+def summarize(query: dict) -> dict:
+    """Affiliate counts per status and counter sums, in one aggregation"""
+    group = {"_id": "$status", "count": {"$sum": 1}}
+    for counter in COUNTERS:
+        group[counter] = {"$sum": f"${counter}"}
+
+    summary = {"status_counts": {}, **{counter: 0 for counter in COUNTERS}}
+    for row in affiliates_collection.aggregate([{"$match": query}, {"$group": group}]):
+        summary["status_counts"][row["_id"]] = row["count"]
+        for counter in COUNTERS:
+            summary[counter] += row[counter]
+    return summary
+
+
+# ---------- Leaderboards ----------
+
+def _leaderboard_key(owner_id: str, program_id: Optional[str]) -> str:
+    return f"{owner_id}:{program_id or '*'}"
+
+
+def compute_leaderboard(owner_id: str, program_id: Optional[str], limit: int) -> List[dict]:
+    """Top approved affiliates by revenue"""
+    query = {**program_filter(owner_id, program_id), "status": "approved"}
+    affiliates = affiliates_collection.find(query, LEADERBOARD_FIELDS).sort("total_revenue", -1).limit(limit)
+
+    return [
+        {
+            "rank": i,
+            "affiliate_id": affiliate["id"],
+            "name": f"{affiliate['first_name']} {affiliate['last_name']}",
+            "email": affiliate["email"],
+            "total_clicks": affiliate.get("total_clicks", 0),
+            "total_conversions": affiliate.get("total_conversions", 0),
+            "total_revenue": round(affiliate.get("total_revenue", 0.0), 2),
+            "total_commissions": round(affiliate.get("total_commissions", 0.0), 2)
+        }
+        for i, affiliate in enumerate(affiliates, 1)
+    ]
+
+
+def refresh_leaderboard(owner_id: str, program_id: Optional[str] = None) -> List[dict]:
+    """Rebuild and store a leaderboard snapshot"""
+    entries = compute_leaderboard(owner_id, program_id, LEADERBOARD_SIZE)
+    affiliate_leaderboards_collection.replace_one(
+        {'_id': _leaderboard_key(owner_id, program_id)},
+        {
+            'owner_id': owner_id,
+            'program_id': program_id,
+            'entries': entries,
+            'updated_at': datetime.utcnow()
+        },
+        upsert=True
+    )
+    return entries
+
+
+def get_leaderboard(owner_id: str, program_id: Optional[str] = None, limit: int = 10) -> List[dict]:
+    """Leaderboard from its snapshot, rebuilding it when missing or stale"""
+    if limit > LEADERBOARD_SIZE:
+        return compute_leaderboard(owner_id, program_id, limit)
+
+    snapshot = affiliate_leaderboards_collection.find_one({
+        '_id': _leaderboard_key(owner_id, program_id),
+        'updated_at': {'$gt': datetime.utcnow() - timedelta(seconds=LEADERBOARD_MAX_AGE)}
+    })
+    entries = snapshot['entries'] if snapshot else refresh_leaderboard(owner_id, program_id)
+    return entries[:limit]
+
+
+def on_conversion(owner_id: str, program_id: str):
+    """Rebuild the program's and the owner-wide leaderboards after a conversion"""
+    refresh_leaderboard(owner_id, program_id)
+    refresh_leaderboard(owner_id)
+
+
+def invalidate_leaderboards(owner_id: str):
+    """Drop an owner's snapshots (e.g. after an affiliate's status changes)"""
+    affiliate_leaderboards_collection.delete_many({'owner_id': owner_id})
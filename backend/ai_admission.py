@@ -0,0 +1,235 @@
+"""
+AI Admission Control - Keeps AI load from degrading the rest of the API
+Every LLM call passes through a per-tenant token bucket, a global concurrency
+limit with a bounded, deadline-aware wait queue, and a per-call timeout.
+Failures surface as typed AIError subclasses instead of error strings.
+"""
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 16))
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', 64))
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT_SECONDS', 10))
+AI_CALL_TIMEOUT = float(os.getenv('AI_CALL_TIMEOUT_SECONDS', 90))
+AI_TENANT_RATE_PER_MINUTE = float(os.getenv('AI_TENANT_RATE_PER_MINUTE', 30))
+AI_TENANT_BURST = int(os.getenv('AI_TENANT_BURST', 10))
+# Idle (full) buckets are pruned once this many tenants are tracked
+MAX_TRACKED_TENANTS = 10000
+
+
+class AIError(Exception):
+    """Base class for AI generation failures"""
+    status_code = 500
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIRateLimited(AIError):
+    """The tenant has used up its AI request budget"""
+    status_code = 429
+
+
+class AIOverloaded(AIError):
+    """Too many AI requests are queued to serve this one in time"""
+    status_code = 503
+
+
+class AITimeout(AIError):
+    """The provider didn't answer within the call timeout"""
+    status_code = 504
+
+
+class AIProviderError(AIError):
+    """The provider call failed"""
+    status_code = 502
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int = AI_MAX_CONCURRENCY,
+        max_queue: int = AI_MAX_QUEUE,
+        queue_timeout: float = AI_QUEUE_TIMEOUT,
+        call_timeout: float = AI_CALL_TIMEOUT,
+        tenant_rate_per_minute: float = AI_TENANT_RATE_PER_MINUTE,
+        tenant_burst: int = AI_TENANT_BURST
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.tenant_rate = tenant_rate_per_minute / 60
+        self.tenant_burst = tenant_burst
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.waiting = 0
+        self.in_flight = 0
+        self.counters = {
+            'admitted': 0,
+            'rate_limited': 0,
+            'overloaded': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'completed': 0
+        }
+        self.max_queue_depth = 0
+        # Exponentially weighted moving averages, in seconds
+        self.avg_latency = 0.0
+        self.avg_queue_wait = 0.0
+
+    @staticmethod
+    def _ewma(current: float, sample: float, weight: float = 0.2) -> float:
+        return sample if current == 0 else current + weight * (sample - current)
+
+    def _bucket(self, tenant_id: str) -> TokenBucket:
+        bucket = self._buckets.get(tenant_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_TENANTS:
+                self._buckets = {key: b for key, b in self._buckets.items() if not b.full}
+            bucket = self._buckets[tenant_id] = TokenBucket(self.tenant_rate, self.tenant_burst)
+        return bucket
+
+    def _reject(self, counter: str, error: AIError, bucket: Optional[TokenBucket] = None):
+        self.counters[counter] += 1
+        if bucket:
+            bucket.refund()
+        raise error
+
+    async def _wait_for_slot(self, bucket: Optional[TokenBucket]):
+        """Queue for a concurrency slot, rejecting requests that can't get one before their deadline"""
+        if self.waiting >= self.max_queue:
+            self._reject('overloaded', AIOverloaded(
+                "AI service is busy, please try again shortly", retry_after=self.queue_timeout
+            ), bucket)
+        # Don't queue a request that can't be started before its deadline
+        expected_wait = self.avg_latency * (self.waiting + 1) / self.max_concurrency
+        if expected_wait > self.queue_timeout:
+            self._reject('overloaded', AIOverloaded(
+                "AI service is busy, please try again shortly", retry_after=expected_wait
+            ), bucket)
+
+        self.waiting += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.waiting)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject('overloaded', AIOverloaded(
+                "AI service is busy, please try again shortly", retry_after=self.queue_timeout
+            ), bucket)
+        finally:
+            self.waiting -= 1
+            self.avg_queue_wait = self._ewma(self.avg_queue_wait, time.monotonic() - queued_at)
+
+    @asynccontextmanager
+    async def admit(self, tenant_id: Optional[str] = None):
+        """Hold one slot of AI capacity for the duration of the block"""
+        bucket = None
+        if tenant_id:
+            bucket = self._bucket(tenant_id)
+            wait = bucket.take()
+            if wait:
+                self._reject('rate_limited', AIRateLimited(
+                    "AI request limit reached, please try again shortly", retry_after=wait
+                ))
+
+        if self._semaphore.locked():
+            await self._wait_for_slot(bucket)
+        else:
+            await self._semaphore.acquire()  # A slot is free; this doesn't block
+
+        self.counters['admitted'] += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def run(
+        self,
+        tenant_id: Optional[str],
+        call: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None
+    ) -> T:
+        """
+        Run an AI call under admission control
+
+        Raises:
+            AIRateLimited, AIOverloaded, AITimeout or AIProviderError
+        """
+        async with self.admit(tenant_id):
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(call(), timeout or self.call_timeout)
+            except asyncio.TimeoutError:
+                self.counters['timeouts'] += 1
+                raise AITimeout("AI provider timed out")
+            except AIError:
+                self.counters['errors'] += 1
+                raise
+            except Exception as e:
+                self.counters['errors'] += 1
+                raise AIProviderError(f"AI provider error: {str(e)}") from e
+            finally:
+                self.avg_latency = self._ewma(self.avg_latency, time.monotonic() - started)
+
+            self.counters['completed'] += 1
+            return result
+
+    def snapshot(self) -> dict:
+        """Current load and counters, for monitoring"""
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "avg_latency_ms": round(self.avg_latency * 1000, 1),
+            "avg_queue_wait_ms": round(self.avg_queue_wait * 1000, 1),
+            "tracked_tenants": len(self._buckets),
+            **self.counters
+        }
+
+
+ai_admission = AdmissionController()
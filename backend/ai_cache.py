@@ -0,0 +1,114 @@
+"""
+AI Response Cache - Content-addressed cache for LLM completions
+Completions are keyed by a hash of (provider, model, system message, prompt,
+parameters) and stored in Mongo with a TTL, behind a small in-process LRU so
+repeat generations from the same worker never leave the process.
+"""
+
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+from database import ai_response_cache_collection
+import logging
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 1000))
+# Completions larger than this aren't worth holding in memory or Mongo
+AI_CACHE_MAX_BYTES = 512 * 1024
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share an entry"""
+    return " ".join((text or "").split())
+
+
+def make_cache_key(
+    provider: str,
+    model: str,
+    system_message: str,
+    prompt: str,
+    params: Optional[dict] = None
+) -> str:
+    """Hash a generation request into a stable cache key"""
+    material = json.dumps(
+        [provider, model, _normalize(system_message), _normalize(prompt), params or {}],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    def __init__(self, ttl: int = AI_CACHE_TTL, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expires_at monotonic, text)
+        self._hot = OrderedDict()
+
+    def _remember(self, key: str, text: str, ttl: float):
+        self._hot[key] = (time.monotonic() + ttl, text)
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.max_entries:
+            self._hot.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a completion, in memory first and then in Mongo"""
+        cached = self._hot.get(key)
+        if cached:
+            expires_at, text = cached
+            if expires_at > time.monotonic():
+                self._hot.move_to_end(key)
+                return text
+            del self._hot[key]
+
+        try:
+            doc = ai_response_cache_collection.find_one(
+                {'_id': key, 'expires_at': {'$gt': datetime.utcnow()}},
+                {'text': 1, 'expires_at': 1}
+            )
+        except Exception as e:
+            logger.warning(f"AI cache lookup failed: {str(e)}")
+            return None
+
+        if not doc:
+            return None
+
+        remaining = (doc['expires_at'] - datetime.utcnow()).total_seconds()
+        self._remember(key, doc['text'], remaining)
+        ai_response_cache_collection.update_one({'_id': key}, {'$inc': {'hits': 1}})
+        return doc['text']
+
+    def set(self, key: str, text: str, provider: str = None, model: str = None):
+        """Store a completion under its key"""
+        if len(text.encode('utf-8')) > AI_CACHE_MAX_BYTES:
+            return
+
+        self._remember(key, text, self.ttl)
+        now = datetime.utcnow()
+        try:
+            ai_response_cache_collection.update_one(
+                {'_id': key},
+                {
+                    '$set': {
+                        'text': text,
+                        'provider': provider,
+                        'model': model,
+                        'created_at': now,
+                        'expires_at': now + timedelta(seconds=self.ttl)
+                    },
+                    '$setOnInsert': {'hits': 0}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {str(e)}")
+
+
+ai_response_cache = AIResponseCache()
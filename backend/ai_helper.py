@@ -8,27 +8,156 @@ from dotenv import load_dotenv
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 import asyncio
 import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from ai_cache import ai_response_cache, make_cache_key
+from ai_admission import ai_admission
 
 load_dotenv()
 
 EMERGENT_LLM_KEY = os.getenv('EMERGENT_LLM_KEY')
 
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful AI assistant."
+LANDING_PAGE_SECTIONS = ('HEADLINE', 'SUBHEADLINE', 'BODY', 'CTA')
+WEBSITE_PAGES = (
+    ('home', "Home page (hero section, about, services/products, testimonials, CTA)"),
+    ('about', "About page (company story, mission, team)"),
+    ('services', "Services/Products page (detailed offerings)"),
+    ('contact', "Contact page (contact form, location, social links)"),
+    ('blog', "Blog page structure")
+)
+
+# Cap on simultaneous LLM calls per provider from this worker
+MAX_CONCURRENCY_PER_PROVIDER = int(os.getenv('AI_MAX_CONCURRENCY_PER_PROVIDER', 8))
+
+_provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+# Completions currently being generated, by tenant and request hash (single-flight)
+_in_flight: Dict[Tuple[Optional[str], str], asyncio.Future] = {}
+
+
+def provider_semaphore(provider: str) -> asyncio.Semaphore:
+    semaphore = _provider_semaphores.get(provider)
+    if semaphore is None:
+        semaphore = _provider_semaphores[provider] = asyncio.Semaphore(MAX_CONCURRENCY_PER_PROVIDER)
+    return semaphore
+
+
+async def gather_or_cancel(coroutines: Iterable[Awaitable]) -> list:
+    """asyncio.gather that cancels the remaining tasks as soon as one fails"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Let them unwind (releasing admission and provider slots) before re-raising
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class SectionParser:
+    """
+    Incremental parser for labelled AI output ("HEADLINE: ...", "BODY: ...")
+    Chunks can be fed as they stream in; every completed line is attributed
+    to the section it belongs to.
+    """
+    
+    def __init__(self, labels, multiline=()):
+        """
+        Args:
+            labels: Section labels, without the trailing colon
+            multiline: Sections (lowercase) that keep the lines following their label
+        """
+        self.labels = labels
+        self.multiline = set(multiline)
+        self.result = {label.lower(): "" for label in labels}
+        self.current = None
+        self._buffer = ""
+    
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Consume a chunk and return the (section, text) pieces it completed"""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        updates = [self._parse_line(line) for line in lines]
+        return [update for update in updates if update]
+    
+    def close(self) -> List[Tuple[str, str]]:
+        """Flush the final, unterminated line"""
+        line, self._buffer = self._buffer, ""
+        update = self._parse_line(line)
+        return [update] if update else []
+    
+    def _parse_line(self, line: str) -> Optional[Tuple[str, str]]:
+        for label in self.labels:
+            if line.startswith(f"{label}:"):
+                self.current = label.lower()
+                text = line[len(label) + 1:].strip()
+                self.result[self.current] = text
+                return self.current, text
+        
+        if line.strip() and self.current in self.multiline:
+            text = '\n' + line.strip()
+            self.result[self.current] += text
+            return self.current, text
+        return None
+
+
 class AIHelper:
     """Helper class for AI-powered features"""
     
-    def __init__(self, provider="openai", model="gpt-4o-mini"):
+    def __init__(
+        self,
+        provider="openai",
+        model="gpt-4o-mini",
+        use_cache: bool = True,
+        regenerate: bool = False,
+        stream_client: Optional[Callable[[str, str], AsyncIterator[str]]] = None,
+        tenant_id: Optional[str] = None
+    ):
         """
         Initialize AI Helper
         
         Args:
             provider: "openai", "anthropic", or "gemini"
             model: Model name (default: gpt-4o-mini)
+            use_cache: Serve and store completions in the AI response cache
+            regenerate: Skip cached completions and overwrite them with fresh ones
+            stream_client: Optional callable (prompt, system_message) returning an async
+                iterator of text chunks, used by stream_text instead of the LLM
+                (e.g. a fake local stream in tests)
+            tenant_id: Tenant whose AI request budget LLM calls are charged to
         """
         self.provider = provider
         self.model = model
         self.api_key = EMERGENT_LLM_KEY
-        
-    async def generate_text(self, prompt: str, system_message: str = "You are a helpful AI assistant.") -> str:
+        self.use_cache = use_cache
+        self.regenerate = regenerate
+        self.stream_client = stream_client
+        self.tenant_id = tenant_id
+    
+    def _new_chat(self, system_message: str) -> LlmChat:
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=str(uuid.uuid4()),
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+    
+    def _request_key(self, prompt: str, system_message: str) -> str:
+        return make_cache_key(self.provider, self.model, system_message, prompt)
+    
+    def _cache_lookup(self, prompt: str, system_message: str) -> Tuple[Optional[str], Optional[str]]:
+        """Get (cache key, cached text) for a generation; both None when caching is off"""
+        if not self.use_cache:
+            return None, None
+        cache_key = self._request_key(prompt, system_message)
+        if self.regenerate:
+            return cache_key, None
+        return cache_key, ai_response_cache.get(cache_key)
+    
+    def _cache_store(self, cache_key: Optional[str], text: str):
+        if cache_key and text:
+            ai_response_cache.set(cache_key, text, self.provider, self.model)
+    
+    async def generate_text(self, prompt: str, system_message: str = DEFAULT_SYSTEM_MESSAGE) -> str:
         """
         Generate text using LLM
         
@@ -38,20 +167,104 @@ class AIHelper:
             
         Returns:
             Generated text
+            
+        Raises:
+            AIError: The request was rejected by admission control, timed out or failed
         """
+        cache_key, cached = self._cache_lookup(prompt, system_message)
+        if cached is not None:
+            return cached
+        
+        text = await self._complete_once(prompt, system_message)
+        self._cache_store(cache_key, text)
+        return text
+    
+    async def _complete_once(self, prompt: str, system_message: str) -> str:
+        """Run a completion, sharing the result with the same tenant's identical requests in flight"""
+        # Keyed per tenant so one tenant's admission rejection never reaches another
+        key = (self.tenant_id, self._request_key(prompt, system_message))
+        pending = _in_flight.get(key)
+        while pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise  # This request was cancelled
+                # The request we were waiting on was cancelled; run (or join) it again
+                pending = _in_flight.get(key)
+        
+        future = asyncio.get_running_loop().create_future()
+        _in_flight[key] = future
         try:
-            chat = LlmChat(
-                api_key=self.api_key,
-                session_id=str(uuid.uuid4()),
-                system_message=system_message
-            ).with_model(self.provider, self.model)
+            text = await self._complete(prompt, system_message)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # Followers re-raise it; don't log it as unretrieved
+            raise
+        finally:
+            del _in_flight[key]
+    
+    async def _complete(self, prompt: str, system_message: str) -> str:
+        async def call() -> str:
+            async with provider_semaphore(self.provider):
+                user_message = UserMessage(text=prompt)
+                response = await self._new_chat(system_message).send_message(user_message)
+            return response.text if hasattr(response, 'text') else str(response)
+        
+        return await ai_admission.run(self.tenant_id, call)
+    
+    async def generate_many(self, requests: List[Tuple[str, str]]) -> List[str]:
+        """
+        Generate several independent completions concurrently
+        
+        Args:
+            requests: (prompt, system message) pairs
             
-            user_message = UserMessage(text=prompt)
-            response = await chat.send_message(user_message)
+        Returns:
+            Generated texts, in request order
+        """
+        return await gather_or_cancel(
+            self.generate_text(prompt, system_message) for prompt, system_message in requests
+        )
+    
+    async def _stream_completion(self, prompt: str, system_message: str) -> AsyncIterator[str]:
+        if self.stream_client:
+            async with ai_admission.admit(self.tenant_id), provider_semaphore(self.provider):
+                async for chunk in self.stream_client(prompt, system_message):
+                    yield chunk
+            return
+        
+        # LlmChat only hands back whole completions, so relay it as one chunk
+        yield await self._complete_once(prompt, system_message)
+    
+    async def stream_text(self, prompt: str, system_message: str = DEFAULT_SYSTEM_MESSAGE) -> AsyncIterator[str]:
+        """
+        Generate text using LLM, yielding chunks as they arrive
+        
+        Args:
+            prompt: User prompt
+            system_message: System message for context
             
-            return response.text if hasattr(response, 'text') else str(response)
-        except Exception as e:
-            return f"Error generating text: {str(e)}"
+        Yields:
+            Generated text chunks
+        """
+        cache_key, cached = self._cache_lookup(prompt, system_message)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        async for chunk in self._stream_completion(prompt, system_message):
+            if chunk:
+                chunks.append(chunk)
+                yield chunk
+        
+        self._cache_store(cache_key, "".join(chunks))
     
     async def generate_email_copy(self, topic: str, tone: str = "professional") -> str:
         """
@@ -69,6 +282,15 @@ class AIHelper:
         
         return await self.generate_text(prompt, system_message)
     
+    def blog_post_prompt(self, title: str, keywords: list = None) -> Tuple[str, str]:
+        """Build the (prompt, system message) for a blog post"""
+        system_message = "You are an expert content writer. Create engaging, SEO-friendly blog posts."
+        keywords_str = ", ".join(keywords) if keywords else ""
+        prompt = f"Write a blog post with title: {title}"
+        if keywords_str:
+            prompt += f"\nInclude these keywords: {keywords_str}"
+        return prompt, system_message
+    
     async def generate_blog_post(self, title: str, keywords: list = None) -> str:
         """
         Generate blog post content
@@ -80,13 +302,7 @@ class AIHelper:
         Returns:
             Generated blog post
         """
-        system_message = "You are an expert content writer. Create engaging, SEO-friendly blog posts."
-        keywords_str = ", ".join(keywords) if keywords else ""
-        prompt = f"Write a blog post with title: {title}"
-        if keywords_str:
-            prompt += f"\nInclude these keywords: {keywords_str}"
-        
-        return await self.generate_text(prompt, system_message)
+        return await self.generate_text(*self.blog_post_prompt(title, keywords))
     
     async def generate_funnel_suggestions(self, business_type: str, goal: str) -> str:
         """
@@ -158,18 +374,8 @@ class AIHelper:
         headlines = [line.strip() for line in response.split('\n') if line.strip() and any(c.isdigit() for c in line[:3])]
         return headlines[:5] if headlines else [response]
     
-    async def generate_landing_page_copy(self, product: str, target_audience: str, benefits: list) -> dict:
-        """
-        Generate complete landing page copy
-        
-        Args:
-            product: Product or service name
-            target_audience: Target audience description
-            benefits: List of key benefits
-            
-        Returns:
-            Dict with headline, subheadline, body, and CTA
-        """
+    def landing_page_prompt(self, product: str, target_audience: str, benefits: list) -> Tuple[str, str]:
+        """Build the (prompt, system message) for landing page copy"""
         system_message = "You are an expert landing page copywriter. Create high-converting copy."
         benefits_str = "\n".join([f"- {b}" for b in benefits])
         
@@ -189,39 +395,31 @@ HEADLINE: [headline]
 SUBHEADLINE: [subheadline]
 BODY: [body copy]
 CTA: [call to action]"""
+        return prompt, system_message
+    
+    async def generate_landing_page_copy(self, product: str, target_audience: str, benefits: list) -> dict:
+        """
+        Generate complete landing page copy
         
-        response = await self.generate_text(prompt, system_message)
-        
-        # Parse response
-        result = {
-            "headline": "",
-            "subheadline": "",
-            "body": "",
-            "cta": ""
-        }
-        
-        lines = response.split('\n')
-        current_section = None
-        content = []
-        
-        for line in lines:
-            if line.startswith('HEADLINE:'):
-                current_section = 'headline'
-                result['headline'] = line.replace('HEADLINE:', '').strip()
-            elif line.startswith('SUBHEADLINE:'):
-                current_section = 'subheadline'
-                result['subheadline'] = line.replace('SUBHEADLINE:', '').strip()
-            elif line.startswith('BODY:'):
-                current_section = 'body'
-                result['body'] = line.replace('BODY:', '').strip()
-            elif line.startswith('CTA:'):
-                current_section = 'cta'
-                result['cta'] = line.replace('CTA:', '').strip()
-            elif line.strip() and current_section:
-                if current_section == 'body':
-                    result['body'] += '\n' + line.strip()
+        Args:
+            product: Product or service name
+            target_audience: Target audience description
+            benefits: List of key benefits
+            
+        Returns:
+            Dict with headline, subheadline, body, and CTA
+        """
+        response = await self.generate_text(*self.landing_page_prompt(product, target_audience, benefits))
         
-        return result
+        parser = self.landing_page_parser()
+        parser.feed(response)
+        parser.close()
+        return parser.result
+    
+    @staticmethod
+    def landing_page_parser() -> SectionParser:
+        """Parser for the HEADLINE/SUBHEADLINE/BODY/CTA sections of landing page copy"""
+        return SectionParser(LANDING_PAGE_SECTIONS, multiline=('body',))
     
     async def generate_social_media_posts(self, topic: str, platforms: list = None) -> dict:
         """
@@ -237,26 +435,14 @@ CTA: [call to action]"""
         if not platforms:
             platforms = ['twitter', 'facebook', 'linkedin']
         
+        # One completion per platform, generated concurrently
         system_message = "You are a social media expert. Create engaging, platform-optimized posts."
-        prompt = f"Create social media posts about: {topic}\n\nGenerate posts optimized for: {', '.join(platforms)}\n\nFormat as:\nPLATFORM: [post content]"
-        
-        response = await self.generate_text(prompt, system_message)
-        
-        result = {}
-        lines = response.split('\n')
-        current_platform = None
-        
-        for line in lines:
-            for platform in platforms:
-                if platform.upper() in line.upper():
-                    current_platform = platform
-                    result[platform] = line.split(':', 1)[1].strip() if ':' in line else ""
-                    break
-            else:
-                if current_platform and line.strip():
-                    result[current_platform] += ' ' + line.strip()
+        posts = await self.generate_many([
+            (f"Create a {platform} post about: {topic}\n\nReturn only the post content.", system_message)
+            for platform in platforms
+        ])
         
-        return result
+        return {platform: post.strip() for platform, post in zip(platforms, posts)}
     
     async def generate_webinar_outline(self, topic: str, duration_minutes: int = 60) -> dict:
         """
@@ -288,17 +474,8 @@ Format each section with estimated time allocation."""
             "outline": response
         }
     
-    async def generate_course_curriculum(self, course_title: str, target_level: str = "beginner") -> dict:
-        """
-        Generate course curriculum structure
-        
-        Args:
-            course_title: Title of the course
-            target_level: Target skill level (beginner, intermediate, advanced)
-            
-        Returns:
-            Structured curriculum with modules and lessons
-        """
+    def course_curriculum_prompt(self, course_title: str, target_level: str = "beginner") -> Tuple[str, str]:
+        """Build the (prompt, system message) for a course curriculum"""
         system_message = "You are an instructional design expert. Create comprehensive course curricula."
         prompt = f"""Create a detailed curriculum for a {target_level}-level course titled: {course_title}
 
@@ -309,8 +486,20 @@ Structure:
 - Estimated time per module
 
 Format as a structured outline."""
+        return prompt, system_message
+    
+    async def generate_course_curriculum(self, course_title: str, target_level: str = "beginner") -> dict:
+        """
+        Generate course curriculum structure
         
-        response = await self.generate_text(prompt, system_message)
+        Args:
+            course_title: Title of the course
+            target_level: Target skill level (beginner, intermediate, advanced)
+            
+        Returns:
+            Structured curriculum with modules and lessons
+        """
+        response = await self.generate_text(*self.course_curriculum_prompt(course_title, target_level))
         
         return {
             "title": course_title,
@@ -640,16 +829,8 @@ Format as numbered list with brief explanations."""
     
     # ==================== WEBSITE BUILDER AI FEATURES ====================
     
-    async def generate_complete_website(self, business_info: dict) -> dict:
-        """
-        Generate a complete website structure with pages and content
-        
-        Args:
-            business_info: Dict with business_type, industry, description, target_audience
-            
-        Returns:
-            Complete website structure with pages
-        """
+    def website_page_prompt(self, business_info: dict, page_brief: str) -> Tuple[str, str]:
+        """Build the (prompt, system message) for one page of a complete website"""
         system_message = "You are a professional web designer and content strategist. Create complete, professional websites."
         
         business_type = business_info.get('business_type', 'general business')
@@ -657,36 +838,64 @@ Format as numbered list with brief explanations."""
         description = business_info.get('description', '')
         target_audience = business_info.get('target_audience', 'general audience')
         
-        prompt = f"""Create a complete website structure for:
+        prompt = f"""Create the {page_brief} of a website for:
 Business Type: {business_type}
 Industry: {industry}
 Description: {description}
 Target Audience: {target_audience}
 
-Provide a comprehensive website with:
-1. Home page (hero section, about, services/products, testimonials, CTA)
-2. About page (company story, mission, team)
-3. Services/Products page (detailed offerings)
-4. Contact page (contact form, location, social links)
-5. Blog page structure
-
-For each page, provide:
+Provide:
 - Page title and URL
 - Hero headline and subheadline
 - Main content sections with actual content
 - Call-to-action text
 
 Format as structured JSON-like output with clear sections."""
+        return prompt, system_message
+    
+    async def iter_website_pages(self, business_info: dict) -> AsyncIterator[Tuple[str, str]]:
+        """Generate every website page concurrently, yielding (page, content) as each one finishes"""
+        async def generate_page(page: str, page_brief: str) -> Tuple[str, str]:
+            return page, await self.generate_text(*self.website_page_prompt(business_info, page_brief))
         
-        response = await self.generate_text(prompt, system_message)
-        
+        tasks = [asyncio.ensure_future(generate_page(page, brief)) for page, brief in WEBSITE_PAGES]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                yield await next_page
+        finally:
+            # A failed page, or a consumer that stops early, cancels the pages still generating
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    @staticmethod
+    def website_result(business_info: dict, pages: Dict[str, str]) -> dict:
+        """Assemble generated pages into the complete website structure"""
+        ordered = [page for page, _ in WEBSITE_PAGES if page in pages]
         return {
             "business_info": business_info,
-            "website_structure": response,
-            "pages_count": 5,
+            "website_structure": "\n\n".join(f"## {page.title()} Page\n{pages[page]}" for page in ordered),
+            "pages": {page: pages[page] for page in ordered},
+            "pages_count": len(ordered),
             "generated_at": "now"
         }
     
+    async def generate_complete_website(self, business_info: dict) -> dict:
+        """
+        Generate a complete website structure with pages and content
+        
+        Each page is generated by its own concurrent completion, so this takes
+        as long as the slowest page.
+        
+        Args:
+            business_info: Dict with business_type, industry, description, target_audience
+            
+        Returns:
+            Complete website structure with pages
+        """
+        pages = {page: content async for page, content in self.iter_website_pages(business_info)}
+        return self.website_result(business_info, pages)
+    
     async def generate_website_section(self, section_type: str, context: dict) -> dict:
         """
         Generate a specific website section with content
@@ -723,6 +932,21 @@ Format clearly with labeled sections."""
             "context": context
         }
     
+    async def generate_website_sections(self, section_types: list, context: dict) -> list:
+        """
+        Generate several website sections concurrently
+        
+        Args:
+            section_types: Types of sections, in page order
+            context: Context information shared by every section
+            
+        Returns:
+            Section structures, in the order requested
+        """
+        return await gather_or_cancel(
+            self.generate_website_section(section_type, context) for section_type in section_types
+        )
+    
     async def generate_color_scheme(self, brand_info: dict) -> dict:
         """
         Generate a harmonious color scheme for a website
@@ -0,0 +1,195 @@
+"""
+Blog Feeds - RSS 2.0 and Atom feeds built once per change
+A user's feed is rendered to bytes on first request after a post is created,
+edited, published or deleted, and served from memory with an ETag and
+Last-Modified, so polling feed readers get a 304 without any database work.
+Concurrent rebuilds of the same feed share one load; a TTL picks up changes
+made on other workers.
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+from fastapi import Request, Response
+from database import users_collection, blog_posts_collection
+from http_cache import make_etag, http_date, cached_response
+
+BLOG_FEED_BASE_URL = os.getenv('BLOG_FEED_BASE_URL', 'https://yourblog.com').rstrip('/')
+BLOG_FEED_SIZE = 20
+# Changes made on other workers are picked up after at most this many seconds
+BLOG_FEED_CACHE_TTL = float(os.getenv('BLOG_FEED_CACHE_TTL_SECONDS', 300))
+MAX_CACHED_FEEDS = 1000
+CACHE_CONTROL = "public, max-age=300"
+
+MEDIA_TYPES = {
+    'rss': "application/rss+xml; charset=utf-8",
+    'atom': "application/atom+xml; charset=utf-8"
+}
+
+FeedKey = Tuple[str, str]  # (user_id, format)
+
+
+class Feed:
+    __slots__ = ('body', 'etag', 'last_modified', 'media_type', 'built_at')
+
+    def __init__(self, body: bytes, last_modified: datetime, media_type: str):
+        self.body = body
+        self.etag = make_etag(body)
+        self.last_modified = last_modified
+        self.media_type = media_type
+        self.built_at = time.monotonic()
+
+    def respond(self, request: Request) -> Response:
+        return cached_response(
+            request, self.body, self.etag,
+            media_type=self.media_type,
+            cache_control=CACHE_CONTROL,
+            last_modified=self.last_modified
+        )
+
+
+def post_url(post: dict) -> str:
+    return f"{BLOG_FEED_BASE_URL}/blog/{post.get('slug', '')}"
+
+
+def _text(tag: str, value) -> str:
+    return f"<{tag}>{escape(str(value or ''))}</{tag}>"
+
+
+def render_rss(title: str, posts: List[dict], last_modified: datetime) -> str:
+    items = []
+    for post in posts:
+        parts = [
+            _text('title', post.get('title')),
+            _text('link', post_url(post)),
+            _text('description', post.get('excerpt')),
+            f'<guid isPermaLink="true">{escape(post_url(post))}</guid>'
+        ]
+        if post.get('published_at'):
+            parts.append(_text('pubDate', http_date(post['published_at'])))
+        items.append(f"<item>{''.join(parts)}</item>")
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0"><channel>'
+        f"{_text('title', title)}"
+        f"{_text('link', BLOG_FEED_BASE_URL)}"
+        f"{_text('description', 'Latest blog posts')}"
+        f"{_text('language', 'en-us')}"
+        f"{_text('lastBuildDate', http_date(last_modified))}"
+        f"{''.join(items)}"
+        '</channel></rss>\n'
+    )
+
+
+def _atom_date(value: datetime) -> str:
+    return value.replace(microsecond=0).isoformat() + 'Z'
+
+
+def render_atom(title: str, posts: List[dict], last_modified: datetime) -> str:
+    entries = []
+    for post in posts:
+        updated = post.get('updated_at') or post.get('published_at') or last_modified
+        parts = [
+            _text('id', post_url(post)),
+            _text('title', post.get('title')),
+            f"<link href={quoteattr(post_url(post))}/>",
+            _text('updated', _atom_date(updated)),
+            _text('summary', post.get('excerpt'))
+        ]
+        if post.get('published_at'):
+            parts.append(_text('published', _atom_date(post['published_at'])))
+        entries.append(f"<entry>{''.join(parts)}</entry>")
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        f"{_text('id', BLOG_FEED_BASE_URL + '/')}"
+        f"{_text('title', title)}"
+        f"<link href={quoteattr(BLOG_FEED_BASE_URL)}/>"
+        f"{_text('updated', _atom_date(last_modified))}"
+        f"{''.join(entries)}"
+        '</feed>\n'
+    )
+
+
+RENDERERS = {'rss': render_rss, 'atom': render_atom}
+
+
+def build_feed(user_id: str, format: str) -> Optional[Feed]:
+    """Render a user's latest published posts; None if the user doesn't exist"""
+    user = users_collection.find_one(
+        {'id': user_id},
+        {'_id': 0, 'full_name': 1, 'updated_at': 1, 'created_at': 1, 'blog_feed_changed_at': 1}
+    )
+    if not user:
+        return None
+
+    posts = list(blog_posts_collection.find(
+        {'user_id': user_id, 'status': 'published'},
+        {'_id': 0, 'title': 1, 'slug': 1, 'excerpt': 1, 'published_at': 1, 'updated_at': 1}
+    ).sort('published_at', -1).limit(BLOG_FEED_SIZE))
+
+    # Stored with the data, so every worker reports the same Last-Modified, and it moves
+    # forward when a post is deleted or unpublished too
+    timestamps = [user.get('blog_feed_changed_at'), user.get('updated_at') or user.get('created_at')]
+    timestamps += [post.get('updated_at') or post.get('published_at') for post in posts]
+    last_modified = max((t for t in timestamps if isinstance(t, datetime)), default=datetime(1970, 1, 1))
+
+    title = f"{user.get('full_name', '')}'s Blog"
+    xml = RENDERERS[format](title, posts, last_modified)
+    return Feed(xml.encode('utf-8'), last_modified, MEDIA_TYPES[format])
+
+
+class BlogFeedCache:
+    def __init__(self):
+        self._feeds: "OrderedDict[FeedKey, Feed]" = OrderedDict()
+        self._loading: Dict[FeedKey, asyncio.Future] = {}
+        # Bumped on every invalidation, so builds that started earlier aren't stored
+        self._versions: Dict[str, int] = {}
+
+    async def get(self, user_id: str, format: str = 'rss') -> Optional[Feed]:
+        """A user's feed in "rss" or "atom" format; None if the user doesn't exist"""
+        key = (user_id, format)
+        feed = self._feeds.get(key)
+        if feed is not None and time.monotonic() - feed.built_at < BLOG_FEED_CACHE_TTL:
+            self._feeds.move_to_end(key)
+            return feed
+
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        future = self._loading[key] = asyncio.get_running_loop().create_future()
+        version = self._versions.get(user_id, 0)
+        try:
+            # Blocking reads, keep them off the event loop
+            feed = await asyncio.to_thread(build_feed, user_id, format)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't log it as never retrieved
+            raise
+        else:
+            future.set_result(feed)
+            if feed is not None and self._versions.get(user_id, 0) == version:
+                self._feeds[key] = feed
+                self._feeds.move_to_end(key)
+                if len(self._feeds) > MAX_CACHED_FEEDS:
+                    self._feeds.popitem(last=False)
+        finally:
+            self._loading.pop(key, None)
+        return feed
+
+    def invalidate(self, user_id: str):
+        """Rebuild a user's feeds on their next request (after a post or profile change)"""
+        users_collection.update_one({'id': user_id}, {'$set': {'blog_feed_changed_at': datetime.utcnow()}})
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        for format in RENDERERS:
+            self._feeds.pop((user_id, format), None)
+
+
+blog_feeds = BlogFeedCache()
@@ -0,0 +1,155 @@
+"""
+Cart Pricing - Server-side price resolution and totals for carts and checkout
+Every product (and variant) in a cart is resolved with one $in query, active
+coupons are cached per store, and totals are computed with Decimal from the
+stored prices rather than the prices a client sent.
+"""
+
+import os
+import time
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional
+from database import products_collection, product_variants_collection, coupons_collection
+
+TAX_RATE = Decimal('0.10')  # 10% tax (configurable)
+CENT = Decimal('0.01')
+# Coupon edits on other workers are picked up after at most this many seconds
+COUPON_CACHE_TTL = int(os.getenv('COUPON_CACHE_TTL', 60))
+MAX_CACHED_STORES = 1000
+
+PRODUCT_FIELDS = {'_id': 0, 'id': 1, 'user_id': 1, 'name': 1, 'price': 1, 'status': 1, 'featured_image': 1}
+VARIANT_FIELDS = {'_id': 0, 'id': 1, 'product_id': 1, 'name': 1, 'price': 1, 'image_url': 1}
+
+EMPTY_TOTALS = {"subtotal": 0, "tax": 0, "discount": 0, "total": 0}
+
+
+def to_decimal(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def to_money(value: Decimal) -> float:
+    return float(value.quantize(CENT, rounding=ROUND_HALF_UP))
+
+
+class CouponCache:
+    """Active coupons per store, keyed by code"""
+
+    def __init__(self, ttl: int = COUPON_CACHE_TTL):
+        self.ttl = ttl
+        self._stores = {}  # store_id -> (loaded_at, {code: coupon})
+
+    def get(self, store_id: str, code: str) -> Optional[dict]:
+        entry = self._stores.get(store_id)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            if len(self._stores) >= MAX_CACHED_STORES:
+                self._stores = {}
+            coupons = coupons_collection.find({"user_id": store_id, "status": "active"}, {'_id': 0})
+            entry = self._stores[store_id] = (time.monotonic(), {c['code']: c for c in coupons})
+        return entry[1].get(code)
+
+    def invalidate(self, store_id: str):
+        """Drop a store's coupons after one of them is written"""
+        self._stores.pop(store_id, None)
+
+
+coupon_cache = CouponCache()
+
+
+def coupon_discount(coupon: Optional[dict], subtotal: Decimal) -> Decimal:
+    """Discount a coupon gives on a subtotal (zero if expired or below its minimum)"""
+    if not coupon:
+        return Decimal(0)
+    if coupon.get("expires_at") and coupon["expires_at"] < datetime.utcnow():
+        return Decimal(0)
+    if coupon.get("minimum_purchase") and subtotal < to_decimal(coupon["minimum_purchase"]):
+        return Decimal(0)
+
+    if coupon["discount_type"] == "percentage":
+        discount = subtotal * to_decimal(coupon["discount_value"]) / 100
+        if coupon.get("maximum_discount"):
+            discount = min(discount, to_decimal(coupon["maximum_discount"]))
+    else:  # fixed
+        discount = to_decimal(coupon["discount_value"])
+    return discount
+
+
+class PricedCart:
+    """Cart items repriced from the catalog, with their totals"""
+
+    def __init__(self, items: List[dict], products: Dict[str, dict], missing: List[str], totals: dict):
+        self.items = items
+        self.products = products
+        self.missing = missing
+        self.totals = totals
+
+    @property
+    def store_owner_id(self) -> Optional[str]:
+        # Assumes all items come from the same store
+        for item in self.items:
+            product = self.products.get(item["product_id"])
+            if product:
+                return product.get("user_id")
+        return None
+
+
+def price_cart(items: List[dict], coupon_code: Optional[str] = None) -> PricedCart:
+    """
+    Reprice cart items from the stored products and variants and compute totals
+
+    Args:
+        items: Cart items (dicts with product_id, variant_id and quantity)
+        coupon_code: Coupon to apply, if any
+
+    Returns:
+        PricedCart; items whose product no longer exists are left out and
+        their product ids listed in `missing`
+    """
+    if not items:
+        return PricedCart([], {}, [], dict(EMPTY_TOTALS))
+
+    product_ids = list({item["product_id"] for item in items})
+    products = {
+        p["id"]: p for p in products_collection.find({"id": {"$in": product_ids}}, PRODUCT_FIELDS)
+    }
+    variant_ids = list({item["variant_id"] for item in items if item.get("variant_id")})
+    variants = {
+        v["id"]: v for v in product_variants_collection.find({"id": {"$in": variant_ids}}, VARIANT_FIELDS)
+    } if variant_ids else {}
+
+    priced_items = []
+    missing = []
+    subtotal = Decimal(0)
+    for item in items:
+        product = products.get(item["product_id"])
+        if not product:
+            missing.append(item["product_id"])
+            continue
+
+        variant = variants.get(item.get("variant_id"))
+        if variant and variant.get("product_id") != product["id"]:
+            variant = None
+        price = variant["price"] if variant and variant.get("price") is not None else product["price"]
+
+        priced_items.append({
+            **item,
+            "price": price,
+            "product_name": product["name"],
+            "product_image": item.get("product_image") or product.get("featured_image")
+        })
+        subtotal += to_decimal(price) * item["quantity"]
+
+    cart = PricedCart(priced_items, products, missing, {})
+
+    tax = subtotal * TAX_RATE
+    discount = Decimal(0)
+    if coupon_code and cart.store_owner_id:
+        discount = coupon_discount(coupon_cache.get(cart.store_owner_id, coupon_code), subtotal)
+
+    cart.totals = {
+        "subtotal": to_money(subtotal),
+        "tax": to_money(tax),
+        "discount": to_money(discount),
+        "total": to_money(subtotal + tax - discount)
+    }
+    return cart
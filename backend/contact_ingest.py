@@ -0,0 +1,194 @@
+"""
+Contact Ingestion - One atomic upsert per captured lead
+Every public lead-capture path (forms, funnels, webinars, courses, checkout)
+creates or updates its CRM contact through here: a single upsert on
+(user_id, email) that sets the submitted fields, merges tags and custom
+fields, and only fills defaults when the contact is new. Concurrent public
+submissions are coalesced into one bulk_write per batch window. A unique
+index on (user_id, email), built at startup, keeps concurrent upserts from
+creating two contacts (existing duplicates are merged by the one-off
+merge_duplicate_contacts.py migration).
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+from database import contacts_collection
+
+logger = logging.getLogger(__name__)
+
+# Submissions arriving within this window share one bulk_write (0 writes each one directly)
+CONTACT_BATCH_WINDOW = float(os.getenv('CONTACT_BATCH_WINDOW_MS', 10)) / 1000
+CONTACT_BATCH_SIZE = 100
+
+CONTACT_EMAIL_INDEX = 'user_id_1_email_1'
+
+
+def new_contact_defaults(now: datetime) -> dict:
+    return {
+        'id': str(uuid.uuid4()),
+        'status': 'lead',
+        'score': 0,
+        'tags': [],
+        'segments': [],
+        'custom_fields': {},
+        'engagement_count': 0,
+        'created_at': now
+    }
+
+
+def _field_key(name: str) -> str:
+    # Public form keys become field paths; keep them from addressing other fields
+    return str(name).replace('.', '_').lstrip('$') or '_'
+
+
+def contact_update(
+    fields: Optional[dict] = None,
+    on_insert: Optional[dict] = None,
+    tags: Iterable[str] = (),
+    custom_fields: Optional[dict] = None
+) -> dict:
+    """
+    Build the upsert for one lead
+
+    Args:
+        fields: Values written to new and existing contacts
+        on_insert: Values only used when the contact is created
+        tags: Tags added to the contact's existing tags
+        custom_fields: Custom fields merged into the existing ones
+    """
+    now = datetime.utcnow()
+    updates = {**(fields or {}), 'updated_at': now}
+    for name, value in (custom_fields or {}).items():
+        updates[f'custom_fields.{_field_key(name)}'] = value
+
+    insert = {**new_contact_defaults(now), **(on_insert or {})}
+    # Paths written by $set or $addToSet can't also appear in $setOnInsert
+    for path in updates:
+        insert.pop(path.split('.')[0], None)
+    tags = list(dict.fromkeys(tags))
+    if tags:
+        insert.pop('tags', None)
+
+    update = {'$set': updates, '$setOnInsert': insert}
+    if tags:
+        update['$addToSet'] = {'tags': {'$each': tags}}
+    return update
+
+
+def upsert_contact(user_id: str, email: str, session=None, **lead) -> str:
+    """Create or update a contact in one round-trip; returns its id"""
+    contact = contacts_collection.find_one_and_update(
+        {'user_id': user_id, 'email': email},
+        contact_update(**lead),
+        projection={'id': 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    return contact['id']
+
+
+def ensure_unique_contact_email() -> bool:
+    """Make the (user_id, email) index unique; returns whether it is"""
+    index = contacts_collection.index_information().get(CONTACT_EMAIL_INDEX)
+    if index and index.get('unique'):
+        return True
+
+    try:
+        if index:
+            contacts_collection.drop_index(CONTACT_EMAIL_INDEX)
+        contacts_collection.create_index(
+            [('user_id', 1), ('email', 1)],
+            name=CONTACT_EMAIL_INDEX,
+            unique=True,
+            partialFilterExpression={'email': {'$type': 'string'}}
+        )
+        return True
+    except OperationFailure as e:
+        logger.warning(
+            f"Contacts are not yet unique per (user_id, email): {str(e)}. "
+            "Run `python merge_duplicate_contacts.py --apply` to merge the existing duplicates."
+        )
+        # Keep (user_id, email) lookups indexed until then
+        contacts_collection.create_index([('user_id', 1), ('email', 1)], name=CONTACT_EMAIL_INDEX)
+        return False
+
+
+class ContactIngestor:
+    """Coalesces concurrent contact upserts into batched bulk writes"""
+
+    def __init__(self, batch_window: float = CONTACT_BATCH_WINDOW, batch_size: int = CONTACT_BATCH_SIZE):
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._batch: List[Tuple[Tuple[str, str], dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def ingest(self, user_id: str, email: str, **lead) -> str:
+        """Create or update a contact (see contact_update for the lead fields); returns its id"""
+        if self.batch_window <= 0:
+            return await asyncio.to_thread(upsert_contact, user_id, email, **lead)
+
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append(((user_id, email), contact_update(**lead), future))
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._on_timer)
+        return await future
+
+    def _on_timer(self):
+        self._timer = None
+        self._flush_batch()
+
+    def _flush_batch(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list):
+        try:
+            ids = await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Error upserting contacts: {str(e)}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, _, future in batch:
+            if not future.done():
+                future.set_result(ids[key])
+
+    @staticmethod
+    def _write(batch: list) -> Dict[Tuple[str, str], str]:
+        """Apply a batch in order; returns the contact id per (user_id, email)"""
+        result = contacts_collection.bulk_write([
+            UpdateOne({'user_id': user_id, 'email': email}, update, upsert=True)
+            for (user_id, email), update, _ in batch
+        ], ordered=True)
+
+        ids = {}
+        for index in result.upserted_ids:
+            key, update, _ = batch[index]
+            ids.setdefault(key, update['$setOnInsert']['id'])
+
+        # Contacts that already existed need one read for their ids
+        existing = list({key for key, _, _ in batch if key not in ids})
+        if existing:
+            for contact in contacts_collection.find(
+                {'$or': [{'user_id': user_id, 'email': email} for user_id, email in existing]},
+                {'_id': 0, 'id': 1, 'user_id': 1, 'email': 1}
+            ):
+                ids.setdefault((contact['user_id'], contact['email']), contact['id'])
+        return ids
+
+
+contact_ingestor = ContactIngestor()
@@ -0,0 +1,189 @@
+"""
+Course Catalog - Materialised read model for the public course marketplace
+Each published course is stored as a denormalised summary (preview modules and
+lessons included) that is rebuilt whenever the course, its modules or lessons change.
+Enrollment and completion counters are applied to the summary in place.
+Public reads are served from an in-process cache of encoded pages.
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from database import (
+    courses_collection,
+    course_modules_collection,
+    course_lessons_collection,
+    course_catalog_collection
+)
+from http_cache import make_etag
+from hydration import hydrate
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Other workers pick up catalog changes after at most this many seconds
+CATALOG_CACHE_TTL = int(os.getenv('COURSE_CATALOG_CACHE_TTL', 30))
+MAX_CACHED_PAGES = 256
+
+
+class CourseCatalog:
+    def __init__(self, ttl: int = CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = None
+        self._loaded_at = 0.0
+        self._pages = {}
+
+    # ---------- Write side ----------
+
+    def _build_summary(self, course_id: str) -> Optional[dict]:
+        """Compose the public summary for a published course"""
+        course = courses_collection.find_one(
+            {"id": course_id, "status": "published"},
+            {'_id': 0, 'user_id': 0}  # Don't expose user_id
+        )
+        if not course:
+            return None
+
+        modules = list(course_modules_collection.find(
+            {"course_id": course_id},
+            {'_id': 0, 'user_id': 0}
+        ).sort("order", 1))
+
+        # One query for every preview lesson in the course, grouped by module
+        hydrate(modules, 'id', course_lessons_collection, 'preview_lessons',
+                projection={'content': 0},  # Don't expose full content
+                key='module_id', many=True, filters={"is_preview": True}, sort=[("order", 1)])
+
+        course['preview_modules'] = modules
+        return course
+
+    def refresh(self, course_id: str):
+        """Rebuild (or drop) the catalog entry for a course after a write"""
+        summary = self._build_summary(course_id)
+
+        if summary is None:
+            course_catalog_collection.delete_one({"course_id": course_id})
+        else:
+            course_catalog_collection.replace_one(
+                {"course_id": course_id},
+                {
+                    'course_id': course_id,
+                    'created_at': summary.get('created_at'),
+                    'summary': summary,
+                    'updated_at': datetime.utcnow()
+                },
+                upsert=True
+            )
+
+        self.invalidate()
+
+    def update_counters(
+        self,
+        course_id: str,
+        increments: Optional[Dict[str, int]] = None,
+        values: Optional[dict] = None
+    ):
+        """
+        Apply counter changes (students, completions) to a course's entry without rebuilding it
+
+        Args:
+            course_id: Course whose counters changed
+            increments: Summary fields to increment, e.g. {"total_students": 1}
+            values: Summary fields to set, e.g. {"completion_rate": 42.5}
+        """
+        update = {}
+        if increments:
+            update['$inc'] = {f'summary.{field}': delta for field, delta in increments.items()}
+        if values:
+            update['$set'] = {f'summary.{field}': value for field, value in values.items()}
+        # Only published courses have an entry
+        result = course_catalog_collection.update_one({"course_id": course_id}, update)
+        if not result.matched_count or self._entries is None:
+            return
+
+        entry = next((e for e in self._entries if e.get('id') == course_id), None)
+        if entry is None:
+            return
+        for field, delta in (increments or {}).items():
+            entry[field] = (entry.get(field) or 0) + delta
+        entry.update(jsonable_encoder(values or {}))
+        # Only pages that can list this course are re-encoded
+        self._pages = {
+            key: page for key, page in self._pages.items()
+            if (key[0] and key[0] != entry.get('category')) or (key[1] and key[1] != entry.get('level'))
+        }
+
+    def remove(self, course_id: str):
+        """Drop a deleted course from the catalog"""
+        course_catalog_collection.delete_one({"course_id": course_id})
+        self.invalidate()
+
+    def rebuild_all(self) -> int:
+        """Materialise every published course (used to backfill on startup)"""
+        course_ids = [c['id'] for c in courses_collection.find({"status": "published"}, {'id': 1})]
+        for course_id in course_ids:
+            self.refresh(course_id)
+        return len(course_ids)
+
+    def invalidate(self):
+        """Drop the in-process cache; the next read reloads the catalog"""
+        self._entries = None
+        self._pages = {}
+
+    # ---------- Read side ----------
+
+    def _load(self):
+        if self._entries is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+
+        docs = course_catalog_collection.find({}, {'_id': 0, 'summary': 1}).sort("created_at", -1)
+        self._entries = [jsonable_encoder(doc['summary']) for doc in docs]
+        self._loaded_at = time.monotonic()
+        self._pages = {}
+
+    def get_page(
+        self,
+        category: Optional[str] = None,
+        level: Optional[str] = None,
+        page: int = 1,
+        limit: int = 20
+    ) -> Tuple[bytes, str]:
+        """
+        Get an encoded catalog page
+
+        Returns:
+            (JSON body bytes, ETag)
+        """
+        self._load()
+
+        key = (category, level, page, limit)
+        cached = self._pages.get(key)
+        if cached:
+            return cached
+
+        courses = [
+            course for course in self._entries
+            if (not category or course.get('category') == category)
+            and (not level or course.get('level') == level)
+        ]
+        total = len(courses)
+        skip = (page - 1) * limit
+
+        body = json.dumps({
+            "courses": courses[skip:skip + limit],
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": (total + limit - 1) // limit
+        }).encode('utf-8')
+
+        if len(self._pages) >= MAX_CACHED_PAGES:
+            self._pages = {}
+        self._pages[key] = (body, make_etag(body))
+        return self._pages[key]
+
+
+course_catalog = CourseCatalog()
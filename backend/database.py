@@ -1,4 +1,5 @@
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 import os
 from dotenv import load_dotenv
 
@@ -28,6 +29,7 @@ course_progress_collection = db['course_progress']
 certificates_collection = db['certificates']
 membership_tiers_collection = db['membership_tiers']
 membership_subscriptions_collection = db['membership_subscriptions']
+course_catalog_collection = db['course_catalog']
 
 # Affiliate collections (Phase 10)
 affiliate_programs_collection = db['affiliate_programs']
@@ -38,6 +40,7 @@ affiliate_conversions_collection = db['affiliate_conversions']
 affiliate_commissions_collection = db['affiliate_commissions']
 affiliate_payouts_collection = db['affiliate_payouts']
 affiliate_resources_collection = db['affiliate_resources']
+affiliate_leaderboards_collection = db['affiliate_leaderboards']
 
 # Payment & E-commerce collections (Phase 11)
 products_collection = db['products']
@@ -57,6 +60,7 @@ webinar_registrations_collection = db['webinar_registrations']
 webinar_chat_messages_collection = db['webinar_chat_messages']
 webinar_qa_collection = db['webinar_qa']
 webinar_polls_collection = db['webinar_polls']
+webinar_poll_votes_collection = db['webinar_poll_votes']
 webinar_recordings_collection = db['webinar_recordings']
 
 workflows_collection = db['workflows']
@@ -71,12 +75,16 @@ surveys_collection = db['surveys']
 survey_responses_collection = db['survey_responses']
 files_collection = db['files']
 settings_collection = db['settings']
+scheduler_leases_collection = db['scheduler_leases']
+id_counters_collection = db['id_counters']
+ai_response_cache_collection = db['ai_response_cache']
 
 # Create indexes
 users_collection.create_index('email', unique=True)
+contacts_collection.create_index('id')
 contacts_collection.create_index('email')
 contacts_collection.create_index('user_id')
-contacts_collection.create_index([('user_id', 1), ('email', 1)])
+# Unique (user_id, email) index: built at startup by contact_ingest.ensure_unique_contact_email
 contact_activities_collection.create_index('contact_id')
 contact_activities_collection.create_index('user_id')
 tags_collection.create_index([('user_id', 1), ('name', 1)], unique=True)
@@ -121,6 +129,7 @@ workflow_executions_collection.create_index('workflow_id')
 workflow_executions_collection.create_index('contact_id')
 
 # Course & Membership indexes
+courses_collection.create_index('id')
 courses_collection.create_index('user_id')
 courses_collection.create_index('status')
 courses_collection.create_index('category')
@@ -129,6 +138,7 @@ course_modules_collection.create_index('user_id')
 course_lessons_collection.create_index('course_id')
 course_lessons_collection.create_index('module_id')
 course_lessons_collection.create_index('user_id')
+course_enrollments_collection.create_index('id')
 course_enrollments_collection.create_index('user_id')
 course_enrollments_collection.create_index('course_id')
 course_enrollments_collection.create_index('course_owner_id')
@@ -137,6 +147,7 @@ course_progress_collection.create_index('enrollment_id')
 course_progress_collection.create_index('user_id')
 course_progress_collection.create_index('course_id')
 course_progress_collection.create_index('lesson_id')
+course_progress_collection.create_index([('enrollment_id', 1), ('lesson_id', 1)])
 certificates_collection.create_index('user_id')
 certificates_collection.create_index('course_id')
 certificates_collection.create_index('certificate_number', unique=True)
@@ -146,6 +157,8 @@ membership_subscriptions_collection.create_index('user_id')
 membership_subscriptions_collection.create_index('tier_id')
 membership_subscriptions_collection.create_index('tier_owner_id')
 membership_subscriptions_collection.create_index('status')
+course_catalog_collection.create_index('course_id', unique=True)
+course_catalog_collection.create_index('created_at')
 
 workflow_executions_collection.create_index('user_id')
 workflow_executions_collection.create_index('status')
@@ -177,6 +190,7 @@ blog_comments_collection.create_index('user_id')
 blog_comments_collection.create_index('status')
 blog_post_views_collection.create_index('post_id')
 blog_post_views_collection.create_index('user_id')
+blog_post_views_collection.create_index('id', unique=True)
 website_pages_collection.create_index('user_id')
 website_pages_collection.create_index('status')
 website_pages_collection.create_index([('user_id', 1), ('slug', 1)], unique=True)
@@ -186,6 +200,7 @@ navigation_menus_collection.create_index('user_id')
 navigation_menus_collection.create_index([('user_id', 1), ('location', 1)])
 website_page_views_collection.create_index('page_id')
 website_page_views_collection.create_index('user_id')
+website_page_views_collection.create_index('id', unique=True)
 
 # Webinar indexes (Phase 9)
 webinars_collection.create_index('user_id')
@@ -195,12 +210,22 @@ webinar_registrations_collection.create_index('webinar_id')
 webinar_registrations_collection.create_index('email')
 webinar_registrations_collection.create_index([('webinar_id', 1), ('email', 1)], unique=True)
 webinar_registrations_collection.create_index('status')
+webinar_registrations_collection.create_index([('webinar_id', 1), ('status', 1)])
+webinar_chat_messages_collection.create_index('id', unique=True)
 webinar_chat_messages_collection.create_index('webinar_id')
 webinar_chat_messages_collection.create_index('created_at')
+webinar_chat_messages_collection.create_index([('webinar_id', 1), ('created_at', -1)])
 webinar_qa_collection.create_index('webinar_id')
 webinar_qa_collection.create_index('is_answered')
 webinar_polls_collection.create_index('webinar_id')
 webinar_polls_collection.create_index('is_active')
+webinar_poll_votes_collection.create_index(
+    [('poll_id', 1), ('voter_id', 1)],
+    unique=True,
+    partialFilterExpression={'voter_id': {'$type': 'string'}}
+)
+webinar_poll_votes_collection.create_index('id', unique=True)
+webinar_poll_votes_collection.create_index('webinar_id')
 webinar_recordings_collection.create_index('webinar_id')
 webinar_recordings_collection.create_index('is_public')
 
@@ -212,6 +237,8 @@ affiliates_collection.create_index('email')
 affiliates_collection.create_index('affiliate_code', unique=True)
 affiliates_collection.create_index('status')
 affiliates_collection.create_index([('program_id', 1), ('status', 1)])
+affiliates_collection.create_index([('program_id', 1), ('status', 1), ('total_revenue', -1)])
+affiliate_leaderboards_collection.create_index('owner_id')
 affiliate_links_collection.create_index('affiliate_id')
 affiliate_links_collection.create_index('program_id')
 affiliate_links_collection.create_index('short_code', unique=True)
@@ -233,6 +260,7 @@ affiliate_resources_collection.create_index('program_id')
 affiliate_resources_collection.create_index('resource_type')
 
 # Payment & E-commerce indexes (Phase 11)
+products_collection.create_index('id')
 products_collection.create_index('user_id')
 products_collection.create_index('status')
 products_collection.create_index('product_type')
@@ -250,6 +278,8 @@ orders_collection.create_index('order_number', unique=True)
 orders_collection.create_index('status')
 orders_collection.create_index('created_at')
 orders_collection.create_index([('user_id', 1), ('status', 1)])
+orders_collection.create_index([('user_id', 1), ('payment_status', 1), ('created_at', 1)])
+orders_collection.create_index([('user_id', 1), ('created_at', -1)])
 order_items_collection.create_index('order_id')
 order_items_collection.create_index('product_id')
 subscriptions_collection.create_index('user_id')
@@ -269,4 +299,35 @@ invoices_collection.create_index('customer_email')
 payment_transactions_collection.create_index('user_id')
 payment_transactions_collection.create_index('order_id')
 payment_transactions_collection.create_index('transaction_id')
-payment_transactions_collection.create_index('status')
\ No newline at end of file
+payment_transactions_collection.create_index('status')
+scheduler_leases_collection.create_index('expires_at')
+
+# AI response cache entries are dropped by Mongo once they expire
+ai_response_cache_collection.create_index('expires_at', expireAfterSeconds=0)
+
+
+# Transactions need a replica set or mongos; a standalone server reports IllegalOperation
+ILLEGAL_OPERATION = 20
+_transactions_supported = None
+
+
+def run_transaction(callback):
+    """
+    Run callback(session) in a multi-document transaction
+
+    On a standalone server, which can't run transactions, the callback
+    runs once with session=None instead.
+    """
+    global _transactions_supported
+    if _transactions_supported is not False:
+        try:
+            with client.start_session() as session:
+                result = session.with_transaction(callback)
+            _transactions_supported = True
+            return result
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION or _transactions_supported:
+                raise
+            _transactions_supported = False
+
+    return callback(None)
@@ -0,0 +1,72 @@
+"""
+HTTP Cache Helpers - ETag and conditional GET support for cached read endpoints
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+
+def make_etag(payload: bytes) -> str:
+    """Build a strong ETag from response bytes"""
+    return f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header against an ETag (weak comparison)"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    bare_etag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == bare_etag:
+            return True
+    return False
+
+
+def http_date(value: datetime) -> str:
+    """Format a (naive UTC) datetime as an HTTP date"""
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def not_modified_since(request: Request, last_modified: datetime) -> bool:
+    """Check the If-Modified-Since header (only consulted without If-None-Match)"""
+    header = request.headers.get('if-modified-since')
+    if not header or request.headers.get('if-none-match'):
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def cached_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    media_type: str = "application/json",
+    cache_control: str = "public, max-age=60",
+    headers: Optional[dict] = None,
+    last_modified: Optional[datetime] = None
+) -> Response:
+    """Return the body, or a bodiless 304 if the client already has this ETag (or version)"""
+    response_headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if last_modified is not None:
+        response_headers['Last-Modified'] = http_date(last_modified)
+    if headers:
+        response_headers.update(headers)
+
+    if etag_matches(request, etag) or (last_modified is not None and not_modified_since(request, last_modified)):
+        return Response(status_code=304, headers=response_headers)
+
+    return Response(content=body, media_type=media_type, headers=response_headers)
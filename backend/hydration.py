@@ -0,0 +1,71 @@
+"""
+Hydration Helpers - Batched foreign-key joins for paged query results
+Collects the foreign keys from a page of documents, fetches the referenced
+documents with one $in query and stitches them back onto each row.
+"""
+
+from typing import Callable, List, Optional
+
+
+def hydrate(
+    docs: List[dict],
+    foreign_key: str,
+    collection,
+    target_field: str,
+    projection: Optional[dict] = None,
+    key: str = "id",
+    many: bool = False,
+    filters: Optional[dict] = None,
+    sort: Optional[list] = None,
+    transform: Optional[Callable[[dict], dict]] = None
+) -> List[dict]:
+    """
+    Attach referenced documents to a list of documents in a single query
+
+    Args:
+        docs: Documents to hydrate (modified in place)
+        foreign_key: Field on each doc holding the referenced key
+        collection: Collection the referenced documents live in
+        target_field: Field on each doc the result is written to
+        projection: Fields to fetch from the referenced documents
+        key: Field on the referenced documents matched against foreign_key
+        many: Attach a list of every match (one-to-many) instead of a single document
+        filters: Extra conditions the referenced documents must match
+        sort: Sort spec for the referenced documents (useful with many=True)
+        transform: Optional callable that shapes each referenced document
+
+    Returns:
+        The same list of documents
+    """
+    keys = list({doc[foreign_key] for doc in docs if doc.get(foreign_key)})
+    if not keys:
+        if many:
+            for doc in docs:
+                doc[target_field] = []
+        return docs
+
+    fields = dict(projection) if projection else {}
+    if fields and all(fields.values()):
+        fields[key] = 1
+    fields['_id'] = 0
+
+    cursor = collection.find({**(filters or {}), key: {"$in": keys}}, fields)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    related = {}
+    for ref in cursor:
+        ref_key = ref.get(key)
+        value = transform(ref) if transform else ref
+        if many:
+            related.setdefault(ref_key, []).append(value)
+        else:
+            related.setdefault(ref_key, value)
+
+    for doc in docs:
+        if many:
+            doc[target_field] = related.get(doc.get(foreign_key), [])
+        elif doc.get(foreign_key) in related:
+            doc[target_field] = related[doc[foreign_key]]
+
+    return docs
@@ -0,0 +1,158 @@
+"""
+ID Generator - Collision-free, database-free identifiers and short codes
+Order/invoice numbers come from time-ordered Snowflake-style ids (millisecond
+timestamp, worker id, per-millisecond sequence). Affiliate and link codes come
+from numbers reserved in blocks from a Mongo counter, so only one call in
+SEQUENCE_BLOCK_SIZE touches the database.
+"""
+
+import time
+import threading
+from datetime import datetime
+from pymongo import ReturnDocument
+from database import id_counters_collection
+
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"  # ASCII order, so padded codes sort
+BASE36_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Snowflake layout: 41 bits of milliseconds since EPOCH_MS, 10 bits of worker id, 12 bits of sequence
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKERS = 1 << WORKER_BITS
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+SNOWFLAKE_LENGTH = 11  # base62 digits in a 63-bit id
+
+SEQUENCE_BLOCK_SIZE = 100
+# One longer than the legacy random 8-character codes, so the two never collide
+SHORT_CODE_LENGTH = 9
+# Spreads consecutive sequence numbers across the short code space (about the
+# golden ratio of 62 ** 9); coprime with it, so distinct numbers give distinct codes
+SHORT_CODE_MULTIPLIER = 8_366_379_594_239_805
+SHORT_CODE_OFFSET = 1_000_000_007
+
+
+def encode(value: int, alphabet: str = BASE62_ALPHABET, length: int = 0) -> str:
+    """Encode a non-negative integer, left-padded to at least `length` digits"""
+    base = len(alphabet)
+    digits = []
+    while value:
+        value, remainder = divmod(value, base)
+        digits.append(alphabet[remainder])
+    return ''.join(reversed(digits)).rjust(length, alphabet[0])
+
+
+class SequenceBlocks:
+    """Globally unique, increasing numbers reserved from a Mongo counter in blocks"""
+
+    def __init__(self, name: str, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                counter = id_counters_collection.find_one_and_update(
+                    {'_id': self.name},
+                    {'$inc': {'value': self.block_size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                self._end = counter['value']
+                self._next = self._end - self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+
+class SnowflakeGenerator:
+    """Time-ordered 63-bit ids, unique across up to MAX_WORKERS live processes"""
+
+    def __init__(self):
+        self._worker_id = None
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _claim_worker_id(self) -> int:
+        # One counter round-trip per process lifetime
+        counter = id_counters_collection.find_one_and_update(
+            {'_id': 'snowflake_workers'},
+            {'$inc': {'value': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['value'] % MAX_WORKERS
+
+    def next(self) -> int:
+        with self._lock:
+            if self._worker_id is None:
+                self._worker_id = self._claim_worker_id()
+
+            now_ms = int(time.time() * 1000)
+            if now_ms < self._last_ms:
+                # Clock moved backwards; keep issuing ids from the last timestamp
+                now_ms = self._last_ms
+
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond; wait for the next one
+                    while now_ms <= self._last_ms:
+                        now_ms = int(time.time() * 1000)
+            else:
+                self._sequence = 0
+
+            self._last_ms = now_ms
+            return (
+                ((now_ms - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS))
+                | (self._worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+
+snowflake = SnowflakeGenerator()
+affiliate_code_sequence = SequenceBlocks('affiliate_codes')
+short_code_sequence = SequenceBlocks('short_codes')
+
+
+def next_id() -> str:
+    """Sortable base62 id"""
+    return encode(snowflake.next(), length=SNOWFLAKE_LENGTH)
+
+
+def order_number() -> str:
+    """Order number, e.g. ORD-20240115-0Ab3xYz9Qk1"""
+    return f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{next_id()}"
+
+
+def invoice_number() -> str:
+    """Invoice number, e.g. INV-20240115-0Ab3xYz9Qk1"""
+    return f"INV-{datetime.utcnow().strftime('%Y%m%d')}-{next_id()}"
+
+
+def transaction_id() -> str:
+    return f"TXN-{next_id()}"
+
+
+def affiliate_code(first_name: str, last_name: str) -> str:
+    """
+    Readable affiliate code: name prefix, unique base36 number and a check letter, e.g. JOHDOE00A7K
+
+    Legacy codes end in four random digits; these always end in a letter, so
+    the two never collide.
+    """
+    base = f"{first_name[:3]}{last_name[:3]}".upper()
+    number = encode(affiliate_code_sequence.next(), BASE36_ALPHABET, 4)
+    check = BASE36_ALPHABET[10 + sum(i * BASE36_ALPHABET.index(c) for i, c in enumerate(number, 1)) % 26]
+    return f"{base}{number}{check}"
+
+
+def short_code() -> str:
+    """Unique, non-sequential 9-character base62 code"""
+    space = len(BASE62_ALPHABET) ** SHORT_CODE_LENGTH
+    scrambled = (short_code_sequence.next() * SHORT_CODE_MULTIPLIER + SHORT_CODE_OFFSET) % space
+    return encode(scrambled, length=SHORT_CODE_LENGTH)
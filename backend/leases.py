@@ -0,0 +1,50 @@
+"""
+Leases - Mongo-backed lock documents for work shared between several workers
+A lease is held by one owner until it is released or its expiry passes, so a
+crashed worker never blocks a job for longer than the lease TTL.
+"""
+
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from database import scheduler_leases_collection
+
+# Identifies this process as a lease owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(name: str, ttl_seconds: int = 300, owner: str = WORKER_ID) -> bool:
+    """
+    Acquire (or renew) a named lease
+
+    Returns:
+        True if this owner now holds the lease
+    """
+    now = datetime.utcnow()
+    try:
+        scheduler_leases_collection.update_one(
+            {
+                '_id': name,
+                '$or': [
+                    {'expires_at': {'$lte': now}},
+                    {'owner': owner}
+                ]
+            },
+            {'$set': {
+                'owner': owner,
+                'acquired_at': now,
+                'expires_at': now + timedelta(seconds=ttl_seconds)
+            }},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Another owner holds an unexpired lease
+        return False
+
+
+def release_lease(name: str, owner: str = WORKER_ID):
+    """Release a lease held by this owner"""
+    scheduler_leases_collection.delete_one({'_id': name, 'owner': owner})
@@ -0,0 +1,147 @@
+"""
+Merge Duplicate Contacts - One-off migration before the unique contact email index
+Contacts sharing a (user_id, email) are folded into the oldest one: empty
+fields are filled from the duplicates, tags and segments are unioned, custom
+fields merged, notes appended and engagement counters summed. Every record
+pointing at a duplicate by contact_id is repointed to the surviving contact
+before the duplicates are deleted. Then the unique index is built.
+
+This deletes data, so it never runs on its own:
+
+    python merge_duplicate_contacts.py            # report what would be merged
+    python merge_duplicate_contacts.py --apply    # merge and build the index
+"""
+
+import sys
+import logging
+from typing import List
+from database import (
+    contacts_collection,
+    contact_activities_collection,
+    course_enrollments_collection,
+    email_logs_collection,
+    form_submissions_collection,
+    funnel_conversions_collection,
+    workflow_executions_collection,
+    affiliates_collection,
+    orders_collection,
+    webinar_registrations_collection
+)
+from contact_ingest import ensure_unique_contact_email
+
+logger = logging.getLogger(__name__)
+
+# Collections whose documents point at a contact by contact_id
+CONTACT_REFERENCES = (
+    contact_activities_collection,
+    course_enrollments_collection,
+    email_logs_collection,
+    form_submissions_collection,
+    funnel_conversions_collection,
+    workflow_executions_collection,
+    affiliates_collection,
+    orders_collection,
+    webinar_registrations_collection
+)
+
+# Fields merged specially; everything else is filled in when the survivor lacks it
+IDENTITY_FIELDS = {'_id', 'id', 'user_id', 'email', 'created_at'}
+SUMMED_FIELDS = ('engagement_count',)
+LATEST_FIELDS = ('updated_at', 'last_contacted', 'last_contact_date')
+
+
+def _empty(value) -> bool:
+    return value is None or value == '' or value == [] or value == {}
+
+
+def merge_contacts(contacts: List[dict]) -> dict:
+    """
+    The update that folds contacts (oldest first) into the first one
+
+    Args:
+        contacts: Full contact documents sharing a (user_id, email), oldest first
+    """
+    keep, duplicates = contacts[0], contacts[1:]
+    updates = {}
+
+    # Newer duplicates fill gaps first
+    for duplicate in reversed(duplicates):
+        for field, value in duplicate.items():
+            if field in IDENTITY_FIELDS or field in SUMMED_FIELDS or field in LATEST_FIELDS:
+                continue
+            if field in ('tags', 'segments', 'custom_fields', 'notes', 'score'):
+                continue
+            if _empty(keep.get(field)) and field not in updates and not _empty(value):
+                updates[field] = value
+
+    for field in ('tags', 'segments'):
+        merged = list(dict.fromkeys(v for c in contacts for v in (c.get(field) or [])))
+        if merged != (keep.get(field) or []):
+            updates[field] = merged
+
+    custom_fields = {}
+    for contact in reversed(contacts):
+        custom_fields.update(contact.get('custom_fields') or {})
+    if custom_fields != (keep.get('custom_fields') or {}):
+        updates['custom_fields'] = custom_fields
+
+    notes = list(dict.fromkeys(c['notes'] for c in contacts if not _empty(c.get('notes'))))
+    if len(notes) > 1:
+        updates['notes'] = '\n\n'.join(notes)
+
+    scores = [c['score'] for c in contacts if isinstance(c.get('score'), (int, float))]
+    if scores and max(scores) != keep.get('score'):
+        updates['score'] = max(scores)
+
+    for field in SUMMED_FIELDS:
+        total = sum(c.get(field) or 0 for c in contacts)
+        if total != (keep.get(field) or 0):
+            updates[field] = total
+
+    for field in LATEST_FIELDS:
+        values = [c[field] for c in contacts if c.get(field) is not None]
+        if values and max(values) != keep.get(field):
+            updates[field] = max(values)
+
+    return updates
+
+
+def merge_duplicate_contacts(apply: bool = False) -> int:
+    """Fold contacts sharing a (user_id, email) into the oldest one; returns how many are (or would be) merged away"""
+    merged = 0
+    for group in contacts_collection.aggregate([
+        {'$match': {'email': {'$type': 'string'}}},
+        {'$group': {'_id': {'user_id': '$user_id', 'email': '$email'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True):
+        contacts = list(contacts_collection.find(
+            {'user_id': group['_id']['user_id'], 'email': group['_id']['email']}
+        ).sort([('created_at', 1), ('_id', 1)]))
+        keep, duplicates = contacts[0]['id'], [c['id'] for c in contacts[1:]]
+        merged += len(duplicates)
+        logger.info(f"{group['_id']['email']}: merging {len(duplicates)} duplicates into {keep}")
+        if not apply:
+            continue
+
+        updates = merge_contacts(contacts)
+        if updates:
+            contacts_collection.update_one({'id': keep}, {'$set': updates})
+        for collection in CONTACT_REFERENCES:
+            collection.update_many({'contact_id': {'$in': duplicates}}, {'$set': {'contact_id': keep}})
+        contacts_collection.delete_many({'id': {'$in': duplicates}})
+    return merged
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    apply = '--apply' in sys.argv[1:]
+    count = merge_duplicate_contacts(apply=apply)
+    if not apply:
+        print(f"{count} duplicate contacts would be merged; run with --apply to merge them")
+        sys.exit(0)
+
+    print(f"Merged {count} duplicate contacts")
+    if ensure_unique_contact_email():
+        print("Unique (user_id, email) contact index is in place")
+    else:
+        sys.exit(1)
@@ -791,6 +791,8 @@ class Course(CourseBase):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     published_at: Optional[datetime] = None
     
+    total_lessons: int = 0  # Maintained on lesson create/delete
+    
     # Analytics
     total_students: int = 0
     total_completions: int = 0
@@ -814,6 +816,7 @@ class CourseEnrollment(CourseEnrollmentBase):
     enrollment_date: datetime = Field(default_factory=datetime.utcnow)
     completed_date: Optional[datetime] = None
     progress_percentage: float = 0.0
+    completed_lesson_ids: List[str] = []
     current_module_id: Optional[str] = None
     current_lesson_id: Optional[str] = None
     payment_status: str = "completed"  # pending, completed, failed
@@ -1271,6 +1274,8 @@ class WebinarRegistration(WebinarRegistrationBase):
     attended_at: Optional[datetime] = None
     left_at: Optional[datetime] = None
     watch_time_minutes: int = 0
+    reminder_24h_sent_at: Optional[datetime] = None
+    reminder_1h_sent_at: Optional[datetime] = None
 
 class WebinarChatMessageBase(BaseModel):
     message: str
@@ -1332,6 +1337,7 @@ class WebinarPollVote(BaseModel):
     poll_id: str
     option_indices: List[int]
     voter_name: Optional[str] = None
+    voter_id: Optional[str] = None  # Registration or client id; one vote per voter when given
 
 class WebinarRecordingBase(BaseModel):
     title: str
@@ -0,0 +1,210 @@
+"""
+Page View Tracking - Buffered, bot- and duplicate-aware views for public pages
+Public blog posts and website pages record views in memory only: crawlers are
+filtered by user agent, repeat views from the same visitor within a dedup
+window are ignored, and very hot pages are sampled. A background job writes
+hourly rollups ({views: n} per page and hour) and the pages' total_views with
+one bulk_write per collection per flush; a failed write retries only the
+updates that didn't apply.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import Request
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from database import (
+    blog_posts_collection,
+    blog_post_views_collection,
+    website_pages_collection,
+    website_page_views_collection
+)
+
+logger = logging.getLogger(__name__)
+
+PAGE_VIEW_FLUSH_INTERVAL = float(os.getenv('PAGE_VIEW_FLUSH_INTERVAL_SECONDS', 5))
+# Views of the same page by the same visitor within this window count once
+PAGE_VIEW_DEDUP_SECONDS = int(os.getenv('PAGE_VIEW_DEDUP_SECONDS', 1800))
+MAX_TRACKED_VISITS = 200000
+# Past this many views of one page per flush interval, only a sample is tracked and weighted up
+PAGE_VIEW_HOT_THRESHOLD = int(os.getenv('PAGE_VIEW_HOT_THRESHOLD', 1000))
+PAGE_VIEW_SAMPLE_RATE = float(os.getenv('PAGE_VIEW_SAMPLE_RATE', 0.1))
+
+BOT_USER_AGENT = re.compile(
+    r'bot|crawl|spider|slurp|scrape|fetch|preview|monitor|headless|lighthouse|pingdom|'
+    r'facebookexternalhit|embedly|curl|wget|python-requests|httpclient|go-http-client|java/',
+    re.IGNORECASE
+)
+
+# kind -> (page collection, rollup collection, page id field in the rollup)
+TARGETS = {
+    'blog_post': (blog_posts_collection, blog_post_views_collection, 'post_id'),
+    'website_page': (website_pages_collection, website_page_views_collection, 'page_id')
+}
+
+
+def is_bot(user_agent: Optional[str]) -> bool:
+    return not user_agent or bool(BOT_USER_AGENT.search(user_agent))
+
+
+def visitor_key(request: Request) -> str:
+    """Anonymous visitor identity: client address and user agent"""
+    forwarded = request.headers.get('x-forwarded-for', '')
+    address = forwarded.split(',')[0].strip() or (request.client.host if request.client else '')
+    raw = f"{address}|{request.headers.get('user-agent', '')}"
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class PageViewTracker:
+    def __init__(self):
+        # (kind, page_id, owner user_id, hour) -> views not yet written (fractional when sampled)
+        self._pending: Dict[Tuple[str, str, str, datetime], float] = {}
+        self._recent: Dict[Tuple[str, str, str], float] = {}  # (kind, page_id, visitor) -> seen at
+        self._interval_hits: Dict[Tuple[str, str], int] = {}
+        # (kind, page_id) -> views already in the rollups but not yet in the page's total_views
+        self._unwritten_totals: Dict[Tuple[str, str], int] = {}
+        self.counters = {'recorded': 0, 'bots': 0, 'duplicates': 0, 'sampled_out': 0}
+
+    def record(self, kind: str, page_id: str, user_id: str, request: Request):
+        """Count a view of a public page; never touches the database"""
+        if is_bot(request.headers.get('user-agent')):
+            self.counters['bots'] += 1
+            return
+
+        weight = 1.0
+        hits = self._interval_hits[(kind, page_id)] = self._interval_hits.get((kind, page_id), 0) + 1
+        if hits > PAGE_VIEW_HOT_THRESHOLD:
+            if random.random() >= PAGE_VIEW_SAMPLE_RATE:
+                self.counters['sampled_out'] += 1
+                return
+            weight = 1 / PAGE_VIEW_SAMPLE_RATE
+
+        now = time.monotonic()
+        visit = (kind, page_id, visitor_key(request))
+        seen_at = self._recent.get(visit)
+        if seen_at is not None and now - seen_at < PAGE_VIEW_DEDUP_SECONDS:
+            self.counters['duplicates'] += 1
+            return
+        if len(self._recent) >= MAX_TRACKED_VISITS:
+            self._recent = {v: t for v, t in self._recent.items() if now - t < PAGE_VIEW_DEDUP_SECONDS}
+            if len(self._recent) >= MAX_TRACKED_VISITS:
+                self._recent = {}
+        self._recent[visit] = now
+
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        key = (kind, page_id, user_id, hour)
+        self._pending[key] = self._pending.get(key, 0) + weight
+        self.counters['recorded'] += 1
+
+    def discard(self, kind: str, page_id: str):
+        """Drop unwritten views of a deleted page"""
+        self._pending = {key: n for key, n in self._pending.items() if key[:2] != (kind, page_id)}
+        self._unwritten_totals.pop((kind, page_id), None)
+
+    def _take_batch(self) -> Dict[Tuple[str, str, str, datetime], int]:
+        """Whole views to write; fractions from sampling carry over to the next flush"""
+        batch = {}
+        pending = {}
+        for key, views in self._pending.items():
+            whole = int(views)
+            if whole:
+                batch[key] = whole
+            if views - whole:
+                pending[key] = views - whole
+        self._pending = pending
+        self._interval_hits = {}
+        return batch
+
+    @staticmethod
+    def _bulk(collection, keys: list, operations: List[UpdateOne]) -> list:
+        """Apply unordered updates; returns the keys whose update failed"""
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return [keys[error['index']] for error in e.details.get('writeErrors', [])]
+        return []
+
+    @classmethod
+    def _write_rollups(cls, kind: str, rollups: Dict[Tuple[str, str, str, datetime], int]) -> list:
+        _, views_collection, id_field = TARGETS[kind]
+        keys = list(rollups)
+        operations = []
+        for key in keys:
+            _, page_id, user_id, hour = key
+            operations.append(UpdateOne(
+                {'id': f"{page_id}:{hour:%Y%m%d%H}"},
+                {
+                    '$inc': {'views': rollups[key]},
+                    '$setOnInsert': {id_field: page_id, 'user_id': user_id, 'created_at': hour}
+                },
+                upsert=True
+            ))
+        return cls._bulk(views_collection, keys, operations)
+
+    @classmethod
+    def _write_totals(cls, kind: str, totals: Dict[Tuple[str, str], int]) -> list:
+        pages, _, _ = TARGETS[kind]
+        keys = list(totals)
+        return cls._bulk(pages, keys, [
+            UpdateOne({'id': page_id}, {'$inc': {'total_views': totals[(kind, page_id)]}})
+            for _, page_id in keys
+        ])
+
+    async def flush(self):
+        """Write rollups, then page totals; each step only retries what it failed to write"""
+        batch = self._take_batch()
+        for kind in TARGETS:
+            rollups = {key: views for key, views in batch.items() if key[0] == kind}
+            if not rollups:
+                continue
+            try:
+                # Blocking database calls, keep them off the event loop
+                failed = set(await asyncio.to_thread(self._write_rollups, kind, rollups))
+            except Exception as e:
+                logger.error(f"Error writing page view rollups: {str(e)}")
+                failed = set(rollups)
+            for key, views in rollups.items():
+                if key in failed:
+                    self._pending[key] = self._pending.get(key, 0) + views
+                else:
+                    self._unwritten_totals[key[:2]] = self._unwritten_totals.get(key[:2], 0) + views
+
+        for kind in TARGETS:
+            totals = {key: views for key, views in self._unwritten_totals.items() if key[0] == kind}
+            if not totals:
+                continue
+            for key in totals:
+                del self._unwritten_totals[key]
+            try:
+                failed = set(await asyncio.to_thread(self._write_totals, kind, totals))
+            except Exception as e:
+                logger.error(f"Error writing page view totals: {str(e)}")
+                failed = set(totals)
+            for key in failed:
+                self._unwritten_totals[key] = self._unwritten_totals.get(key, 0) + totals[key]
+
+    async def run_flusher(self, interval_seconds: float = PAGE_VIEW_FLUSH_INTERVAL):
+        """Write buffered views every interval until cancelled"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.flush()
+
+
+def count_views(kind: str, query: dict) -> int:
+    """Views matching a filter over rollups (and older one-row-per-view documents)"""
+    _, views_collection, _ = TARGETS[kind]
+    rows = list(views_collection.aggregate([
+        {'$match': query},
+        {'$group': {'_id': None, 'views': {'$sum': {'$ifNull': ['$views', 1]}}}}
+    ]))
+    return rows[0]['views'] if rows else 0
+
+
+page_view_tracker = PageViewTracker()
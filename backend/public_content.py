@@ -0,0 +1,146 @@
+"""
+Public Content Cache - Published blog posts and website pages served from memory
+Public lookups by (user_id, slug) are answered from an LRU of pre-encoded
+response bodies with strong ETags, so repeat visitors get a 304 and hot pages
+never touch the database. Concurrent misses for the same slug share one load,
+edits and deletes invalidate the owner's entries, and a short TTL picks up
+changes made on other workers.
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from database import blog_posts_collection, website_pages_collection
+from template_registry import EncodedPayload
+
+# Edits made on other workers are picked up after at most this many seconds
+PUBLIC_CONTENT_CACHE_TTL = float(os.getenv('PUBLIC_CONTENT_CACHE_TTL_SECONDS', 30))
+# Unknown slugs are remembered for a shorter time
+PUBLIC_CONTENT_MISS_TTL = float(os.getenv('PUBLIC_CONTENT_MISS_TTL_SECONDS', 5))
+PUBLIC_CONTENT_CACHE_SIZE = int(os.getenv('PUBLIC_CONTENT_CACHE_SIZE', 1000))
+PUBLIC_CONTENT_CACHE_MAX_BYTES = int(os.getenv('PUBLIC_CONTENT_CACHE_MAX_MB', 64)) * 1024 * 1024
+# Browsers revalidate every time; unchanged content costs a 304
+CACHE_CONTROL = "public, no-cache"
+
+COLLECTIONS = {
+    'blog_post': blog_posts_collection,
+    'website_page': website_pages_collection
+}
+
+Key = Tuple[str, str, str]  # (kind, user_id, slug)
+
+
+class PublicContent:
+    __slots__ = ('id', 'payload', 'loaded_at')
+
+    def __init__(self, content_id: Optional[str], payload: Optional[EncodedPayload]):
+        self.id = content_id
+        self.payload = payload  # None when nothing is published under the slug
+        self.loaded_at = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return self.payload.size if self.payload is not None else 0
+
+    def fresh(self) -> bool:
+        ttl = PUBLIC_CONTENT_CACHE_TTL if self.payload is not None else PUBLIC_CONTENT_MISS_TTL
+        return time.monotonic() - self.loaded_at < ttl
+
+
+def load(kind: str, user_id: str, slug: str) -> PublicContent:
+    """Read and encode the published document for a slug"""
+    document = COLLECTIONS[kind].find_one({
+        'slug': slug,
+        'user_id': user_id,
+        'status': 'published'
+    })
+    # Private website pages are never served publicly
+    if not document or document.get('visibility', 'public') == 'private':
+        return PublicContent(None, None)
+
+    document['_id'] = str(document['_id'])
+    return PublicContent(document['id'], EncodedPayload(document, cache_control=CACHE_CONTROL))
+
+
+class PublicContentCache:
+    def __init__(self, max_entries: int = PUBLIC_CONTENT_CACHE_SIZE, max_bytes: int = PUBLIC_CONTENT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Key, PublicContent]" = OrderedDict()
+        self._bytes = 0
+        self._loading: Dict[Key, asyncio.Future] = {}
+        # Bumped per owner on every invalidation, so loads that started earlier aren't stored
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+    async def get(self, kind: str, user_id: str, slug: str) -> Optional[PublicContent]:
+        """The published content for a slug, or None if there is none"""
+        key = (kind, user_id, slug)
+        entry = self._entries.get(key)
+        if entry is not None and entry.fresh():
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry if entry.payload is not None else None
+
+        loading = self._loading.get(key)
+        if loading is not None:
+            self.counters['coalesced'] += 1
+            entry = await asyncio.shield(loading)
+            return entry if entry.payload is not None else None
+
+        self.counters['misses'] += 1
+        future = self._loading[key] = asyncio.get_running_loop().create_future()
+        version = self._versions.get((kind, user_id), 0)
+        try:
+            # Blocking read and encoding, keep them off the event loop
+            entry = await asyncio.to_thread(load, kind, user_id, slug)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't log it as never retrieved
+            raise
+        else:
+            future.set_result(entry)
+            if self._versions.get((kind, user_id), 0) == version:
+                self._store(key, entry)
+        finally:
+            self._loading.pop(key, None)
+        return entry if entry.payload is not None else None
+
+    def _store(self, key: Key, entry: PublicContent):
+        self._remove(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def _remove(self, key: Key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def invalidate(self, kind: str, user_id: str, content_id: Optional[str] = None, slugs: Iterable[str] = ()):
+        """
+        Drop cached content after a create, edit, publish or delete
+
+        Args:
+            kind: "blog_post" or "website_page"
+            user_id: Owner of the content
+            content_id: Document id; its entry is dropped whichever slug it was cached under
+            slugs: Slugs the change affects (e.g. a new slug that was cached as not found)
+        """
+        owner = (kind, user_id)
+        slugs = set(slugs)
+        self._versions[owner] = self._versions.get(owner, 0) + 1
+        for key in [
+            key for key, entry in self._entries.items()
+            if key[:2] == owner and (key[2] in slugs or (content_id and entry.id == content_id))
+        ]:
+            self._remove(key)
+
+
+public_content = PublicContentCache()
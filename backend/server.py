@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Query, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 from typing import Optional
 import io
 import csv
@@ -9,7 +9,26 @@ import os
 import re
 import pandas as pd
 from email_service import EmailService, AIEmailGenerator, convert_blocks_to_html
-from webinar_email_service import webinar_email_service
+from webinar_email_service import webinar_email_service, REMINDER_INTERVAL_SECONDS
+from course_catalog import course_catalog
+from http_cache import cached_response
+from hydration import hydrate
+from template_registry import template_registry
+from ai_helper import AIHelper
+from ai_admission import ai_admission, AIError
+from sse import format_sse, sse_response
+from webinar_events import webinar_events
+from webinar_chat import chat_store
+from webinar_polls import poll_votes, PollVoteError
+import webinar_stats
+from exports import stream_export
+from contact_ingest import contact_ingestor, upsert_contact, ensure_unique_contact_email
+from page_views import page_view_tracker, count_views
+from public_content import public_content
+from blog_feeds import blog_feeds
+from cart_pricing import price_cart, coupon_cache
+import id_generator
+import affiliate_analytics
 import asyncio
 from models import (
     UserCreate, UserLogin, User, Token, UserUpdate, GoogleLogin,
@@ -56,7 +75,7 @@ from models import (
     ProductCategoryCreate, ProductCategoryUpdate, ProductCategory,
     ProductCreate, ProductUpdate, Product,
     ProductVariantCreate, ProductVariantUpdate, ProductVariant,
-    ShoppingCartCreate, ShoppingCartUpdate, ShoppingCart, CartItem,
+    ShoppingCartCreate, ShoppingCartUpdate, ShoppingCart,
     CouponCreate, CouponUpdate, Coupon,
     OrderCreate, OrderUpdate, Order, OrderItemCreate, OrderItem,
     SubscriptionCreate, SubscriptionUpdate, Subscription,
@@ -83,23 +102,25 @@ from database import (
     workflows_collection, workflow_executions_collection, workflow_templates_collection,
     courses_collection, course_modules_collection, course_lessons_collection,
     course_enrollments_collection, course_progress_collection, certificates_collection,
-    membership_tiers_collection, membership_subscriptions_collection,
+    course_catalog_collection, membership_tiers_collection, membership_subscriptions_collection,
     blog_posts_collection, blog_categories_collection, blog_tags_collection,
     blog_comments_collection, blog_post_views_collection,
     website_pages_collection, website_themes_collection, navigation_menus_collection,
     website_page_views_collection, website_assets_collection,
     webinars_collection, webinar_registrations_collection, webinar_chat_messages_collection,
-    webinar_qa_collection, webinar_polls_collection, webinar_recordings_collection,
+    webinar_qa_collection, webinar_polls_collection, webinar_poll_votes_collection, webinar_recordings_collection,
     affiliate_programs_collection, affiliates_collection, affiliate_links_collection,
     affiliate_clicks_collection, affiliate_conversions_collection, affiliate_commissions_collection,
     affiliate_payouts_collection, affiliate_resources_collection,
     products_collection, product_categories_collection, product_variants_collection,
     shopping_carts_collection, orders_collection, order_items_collection,
     subscriptions_collection, coupons_collection, invoices_collection,
-    payment_transactions_collection
+    payment_transactions_collection,
+    run_transaction
 )
 import uuid
-from typing import List
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 
 app = FastAPI(title="eFunnels API", version="1.0.0")
 
@@ -252,6 +273,7 @@ async def update_profile(user_update: UserUpdate, current_user: dict = Depends(g
     )
     
     updated_user = users_collection.find_one({"email": current_user['email']})
+    blog_feeds.invalidate(updated_user['id'])
     updated_user.pop('password', None)
     updated_user['_id'] = str(updated_user['_id'])
     
@@ -345,7 +367,14 @@ async def create_contact(contact: ContactCreate, current_user: dict = Depends(ge
     contact_dict['last_contacted'] = None
     contact_dict['engagement_count'] = 0
     
-    contacts_collection.insert_one(contact_dict)
+    try:
+        contacts_collection.insert_one(contact_dict)
+    except DuplicateKeyError:
+        # Created concurrently since the check above
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Contact with this email already exists"
+        )
     contact_dict.pop('_id')
     
     return contact_dict
@@ -393,10 +422,16 @@ async def update_contact(
     update_data = contact_update.model_dump(exclude_unset=True)
     update_data['updated_at'] = datetime.utcnow()
     
-    contacts_collection.update_one(
-        {"id": contact_id},
-        {"$set": update_data}
-    )
+    try:
+        contacts_collection.update_one(
+            {"id": contact_id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Contact with this email already exists"
+        )
     
     updated_contact = contacts_collection.find_one({"id": contact_id})
     updated_contact.pop('_id', None)
@@ -1817,48 +1852,22 @@ async def submit_funnel_form(
     
     contact_id = None
     if contact_email:
-        # Check if contact already exists
-        existing_contact = contacts_collection.find_one({
-            "user_id": funnel['user_id'],
-            "email": contact_email
-        })
-        
-        if existing_contact:
-            contact_id = existing_contact['id']
-            # Update contact with new form data
-            contacts_collection.update_one(
-                {"id": contact_id},
-                {"$set": {
-                    "first_name": contact_data.get('first_name', existing_contact.get('first_name')),
-                    "last_name": contact_data.get('last_name', existing_contact.get('last_name')),
-                    "phone": contact_data.get('phone', existing_contact.get('phone')),
-                    "company": contact_data.get('company', existing_contact.get('company')),
-                    "updated_at": datetime.utcnow()
-                }}
-            )
-        else:
-            # Create new contact
-            contact = {
-                'id': str(uuid.uuid4()),
-                'user_id': funnel['user_id'],
-                'first_name': contact_data.get('first_name', 'Unknown'),
-                'last_name': contact_data.get('last_name'),
-                'email': contact_email,
-                'phone': contact_data.get('phone'),
-                'company': contact_data.get('company'),
-                'source': f"Funnel: {funnel['name']}",
-                'status': 'lead',
-                'score': 0,
-                'tags': [f"funnel-{funnel['name'].lower().replace(' ', '-')}"],
-                'segments': [],
-                'custom_fields': {k: v for k, v in contact_data.items() 
-                                 if k not in ['email', 'first_name', 'last_name', 'phone', 'company']},
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow(),
-                'engagement_count': 0
-            }
-            contacts_collection.insert_one(contact)
-            contact_id = contact['id']
+        # Create or update the contact; extra form fields are merged into its custom fields
+        contact_fields = ['first_name', 'last_name', 'phone', 'company']
+        contact_id = await contact_ingestor.ingest(
+            funnel['user_id'],
+            contact_email,
+            fields={k: contact_data[k] for k in contact_fields if k in contact_data},
+            on_insert={
+                'first_name': 'Unknown',
+                'last_name': None,
+                'phone': None,
+                'company': None,
+                'source': f"Funnel: {funnel['name']}"
+            },
+            tags=[f"funnel-{funnel['name'].lower().replace(' ', '-')}"],
+            custom_fields={k: v for k, v in contact_data.items() if k not in ['email', *contact_fields]}
+        )
     
     # Create conversion record
     conversion = {
@@ -2091,55 +2100,21 @@ async def submit_form(
     submission_data = submission_dict['submission_data']
     
     if 'email' in submission_data:
-        email = submission_data['email']
-        
-        # Check if contact exists
-        existing_contact = contacts_collection.find_one({
-            "user_id": form['user_id'],
-            "email": email
-        })
-        
-        if existing_contact:
-            contact_id = existing_contact['id']
-            # Update contact with any new data
-            update_data = {}
-            if 'first_name' in submission_data:
-                update_data['first_name'] = submission_data['first_name']
-            if 'last_name' in submission_data:
-                update_data['last_name'] = submission_data['last_name']
-            if 'phone' in submission_data:
-                update_data['phone'] = submission_data['phone']
-            if 'company' in submission_data:
-                update_data['company'] = submission_data['company']
-            
-            if update_data:
-                update_data['updated_at'] = datetime.utcnow()
-                contacts_collection.update_one(
-                    {"id": contact_id},
-                    {"$set": update_data}
-                )
-        else:
-            # Create new contact
-            contact = {
-                'id': str(uuid.uuid4()),
-                'user_id': form['user_id'],
-                'first_name': submission_data.get('first_name', 'Unknown'),
-                'last_name': submission_data.get('last_name'),
-                'email': email,
-                'phone': submission_data.get('phone'),
-                'company': submission_data.get('company'),
-                'source': f"Form: {form['name']}",
-                'status': 'lead',
-                'score': 0,
-                'tags': [f"form-{form['name'].lower().replace(' ', '-')}"],
-                'segments': [],
-                'custom_fields': {},
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow(),
-                'engagement_count': 0
-            }
-            contacts_collection.insert_one(contact)
-            contact_id = contact['id']
+        # Create the contact, or update it with any new data
+        contact_fields = ['first_name', 'last_name', 'phone', 'company']
+        contact_id = await contact_ingestor.ingest(
+            form['user_id'],
+            submission_data['email'],
+            fields={k: submission_data[k] for k in contact_fields if k in submission_data},
+            on_insert={
+                'first_name': 'Unknown',
+                'last_name': None,
+                'phone': None,
+                'company': None,
+                'source': f"Form: {form['name']}"
+            },
+            tags=[f"form-{form['name'].lower().replace(' ', '-')}"]
+        )
     
     submission_dict['contact_id'] = contact_id
     
@@ -2263,6 +2238,7 @@ async def get_form_analytics(
 @app.get("/api/forms/{form_id}/export")
 async def export_form_submissions(
     form_id: str,
+    request: Request,
     format: str = Query("csv", regex="^(csv|excel)$"),
     current_user: dict = Depends(get_current_user)
 ):
@@ -2276,45 +2252,46 @@ async def export_form_submissions(
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
     
-    submissions = list(form_submissions_collection.find({"form_id": form_id}))
+    query = {"form_id": form_id}
     
-    if not submissions:
+    if not form_submissions_collection.find_one(query, {"_id": 1}):
         raise HTTPException(status_code=404, detail="No submissions to export")
     
-    # Prepare data for export
-    export_data = []
-    for submission in submissions:
-        row = {
-            'submission_id': submission.get('id', ''),
-            'submitted_at': submission.get('created_at', '').isoformat() if submission.get('created_at') else '',
-            'contact_id': submission.get('contact_id', ''),
-            **submission.get('submission_data', {})
-        }
-        export_data.append(row)
-    
-    df = pd.DataFrame(export_data)
+    # Submission field names, in order of first appearance, collected in the database
+    data_fields = [
+        row["_id"] for row in form_submissions_collection.aggregate([
+            {"$match": query},
+            {"$sort": {"created_at": 1}},
+            {"$project": {"_id": 0, "created_at": 1, "field": {"$objectToArray": {"$ifNull": ["$submission_data", {}]}}}},
+            {"$unwind": {"path": "$field", "includeArrayIndex": "position"}},
+            {"$group": {"_id": "$field.k", "created_at": {"$first": "$created_at"}, "position": {"$first": "$position"}}},
+            {"$sort": {"created_at": 1, "position": 1}}
+        ])
+    ]
+    base_fields = ['submission_id', 'submitted_at', 'contact_id']
+    data_fields = [f for f in data_fields if f not in base_fields]
     
-    if format == 'csv':
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=form_{form_id}_submissions.csv"}
-        )
-    else:  # excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Submissions')
-        output.seek(0)
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=form_{form_id}_submissions.xlsx"}
+    def rows():
+        cursor = form_submissions_collection.find(
+            query, {"_id": 0, "id": 1, "created_at": 1, "contact_id": 1, "submission_data": 1}
         )
+        for submission in cursor:
+            data = submission.get('submission_data') or {}
+            yield [
+                submission.get('id', ''),
+                submission.get('created_at'),
+                submission.get('contact_id', ''),
+                *(data.get(f) for f in data_fields)
+            ]
+    
+    return await stream_export(
+        request,
+        base_fields + data_fields,
+        rows(),
+        format,
+        f"form_{form_id}_submissions",
+        sheet_name='Submissions'
+    )
 
 # ==================== FORM TEMPLATES ROUTES ====================
 
@@ -2583,6 +2560,9 @@ async def get_survey_analytics(
     }
 
 
+# Long-running asyncio tasks started on startup
+background_jobs = []
+
 @app.on_event("startup")
 async def startup_event():
     """Create demo user on startup"""
@@ -3074,6 +3054,43 @@ async def startup_event():
         
         form_templates_collection.insert_many(form_templates)
         print("✅ Form templates created")
+    
+    # Backfill the public course catalog read model
+    if course_catalog_collection.count_documents({}) == 0:
+        materialised = course_catalog.rebuild_all()
+        if materialised:
+            print(f"✅ Course catalog materialised ({materialised} courses)")
+    
+    # One contact per (user_id, email); warns if existing duplicates need merge_duplicate_contacts.py
+    ensure_unique_contact_email()
+    
+    # Start the webinar reminder scheduler (set WEBINAR_REMINDER_INTERVAL_SECONDS=0 to disable)
+    if REMINDER_INTERVAL_SECONDS > 0:
+        background_jobs.append(asyncio.create_task(
+            webinar_email_service.run_reminder_scheduler(REMINDER_INTERVAL_SECONDS)
+        ))
+    
+    # Write-behind persistence for webinar chat
+    background_jobs.append(asyncio.create_task(chat_store.run_flusher()))
+    
+    # Buffered page-view rollups for public blog posts and website pages
+    background_jobs.append(asyncio.create_task(page_view_tracker.run_flusher()))
+    
+    # Coalesced poll vote writes (set WEBINAR_POLL_FLUSH_INTERVAL_SECONDS=0 to write each vote)
+    if poll_votes.flush_interval > 0:
+        background_jobs.append(asyncio.create_task(poll_votes.run_flusher()))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background jobs"""
+    for job in background_jobs:
+        job.cancel()
+    
+    # Write chat messages that are still buffered
+    await chat_store.flush()
+    await poll_votes.flush()
+    await page_view_tracker.flush()
 
 
 
@@ -3940,6 +3957,7 @@ async def create_course(
     course_dict['user_id'] = current_user['id']
     course_dict['status'] = 'draft'
     course_dict['modules'] = []
+    course_dict['total_lessons'] = 0
     course_dict['created_at'] = datetime.utcnow()
     course_dict['updated_at'] = datetime.utcnow()
     course_dict['total_students'] = 0
@@ -3970,14 +3988,9 @@ async def get_course(
     course.pop('_id', None)
     
     # Get all modules with lessons
-    modules = list(course_modules_collection.find({"course_id": course_id}).sort("order", 1))
-    for module in modules:
-        module.pop('_id', None)
-        # Get lessons for this module
-        lessons = list(course_lessons_collection.find({"module_id": module['id']}).sort("order", 1))
-        for lesson in lessons:
-            lesson.pop('_id', None)
-        module['lessons'] = lessons
+    modules = list(course_modules_collection.find({"course_id": course_id}, {'_id': 0}).sort("order", 1))
+    hydrate(modules, 'id', course_lessons_collection, 'lessons',
+            key='module_id', many=True, sort=[("order", 1)])
     
     course['modules'] = modules
     
@@ -4009,6 +4022,7 @@ async def update_course(
         {"id": course_id},
         {"$set": update_data}
     )
+    course_catalog.refresh(course_id)
     
     updated = courses_collection.find_one({"id": course_id})
     updated.pop('_id', None)
@@ -4033,6 +4047,7 @@ async def delete_course(
     course_lessons_collection.delete_many({"course_id": course_id})
     course_enrollments_collection.delete_many({"course_id": course_id})
     course_progress_collection.delete_many({"course_id": course_id})
+    course_catalog.remove(course_id)
     
     return {"message": "Course deleted successfully"}
 
@@ -4084,15 +4099,19 @@ async def create_module(
     course_modules_collection.insert_one(module_dict)
     module_dict.pop('_id')
     
-    # Update course modules summary
+    # Update course modules summary and lesson count
     courses_collection.update_one(
         {"id": course_id},
-        {"$push": {"modules": {
-            "id": module_dict['id'],
-            "title": module_dict['title'],
-            "order": module_dict['order']
-        }}}
+        {
+            "$push": {"modules": {
+                "id": module_dict['id'],
+                "title": module_dict['title'],
+                "order": module_dict['order']
+            }}
+        }
     )
+    adjust_course_lesson_count(course_id, len(module_dict['lessons']))
+    course_catalog.refresh(course_id)
     
     return module_dict
 
@@ -4113,17 +4132,11 @@ async def get_course_modules(
     modules = list(course_modules_collection.find({
         "course_id": course_id,
         "user_id": current_user['id']
-    }).sort("order", 1))
+    }, {'_id': 0}).sort("order", 1))
     
-    for module in modules:
-        module.pop('_id', None)
-        # Get lessons for each module
-        lessons = list(course_lessons_collection.find({
-            "module_id": module['id']
-        }).sort("order", 1))
-        for lesson in lessons:
-            lesson.pop('_id', None)
-        module['lessons'] = lessons
+    # Get lessons for every module in one query
+    hydrate(modules, 'id', course_lessons_collection, 'lessons',
+            key='module_id', many=True, sort=[("order", 1)])
     
     return modules
 
@@ -4162,6 +4175,7 @@ async def update_module(
                 "modules.$.order": updated_module['order']
             }}
         )
+    course_catalog.refresh(course_id)
     
     updated = course_modules_collection.find_one({"id": module_id})
     updated.pop('_id', None)
@@ -4184,13 +4198,23 @@ async def delete_module(
         raise HTTPException(status_code=404, detail="Module not found")
     
     # Delete all lessons in this module
+    lesson_ids = course_lessons_collection.distinct("id", {"module_id": module_id})
     course_lessons_collection.delete_many({"module_id": module_id})
     
-    # Remove from course modules summary
+    # Remove from course modules summary and lesson count
     courses_collection.update_one(
         {"id": course_id},
-        {"$pull": {"modules": {"id": module_id}}}
+        {
+            "$pull": {"modules": {"id": module_id}}
+        }
     )
+    adjust_course_lesson_count(course_id, -len(lesson_ids))
+    if lesson_ids:
+        course_enrollments_collection.update_many(
+            {"course_id": course_id},
+            {"$pull": {"completed_lesson_ids": {"$in": lesson_ids}}}
+        )
+    course_catalog.refresh(course_id)
     
     return {"message": "Module deleted successfully"}
 
@@ -4235,6 +4259,8 @@ async def create_lesson(
             "order": lesson_dict['order']
         }}}
     )
+    adjust_course_lesson_count(course_id, 1)
+    course_catalog.refresh(course_id)
     
     return lesson_dict
 
@@ -4323,6 +4349,7 @@ async def update_lesson(
                 "lessons.$.order": updated_lesson['order']
             }}
         )
+    course_catalog.refresh(course_id)
     
     updated = course_lessons_collection.find_one({"id": lesson_id})
     updated.pop('_id', None)
@@ -4351,6 +4378,12 @@ async def delete_lesson(
         {"id": module_id},
         {"$pull": {"lessons": {"id": lesson_id}}}
     )
+    adjust_course_lesson_count(course_id, -1)
+    course_enrollments_collection.update_many(
+        {"course_id": course_id},
+        {"$pull": {"completed_lesson_ids": lesson_id}}
+    )
+    course_catalog.refresh(course_id)
     
     return {"message": "Lesson deleted successfully"}
 
@@ -4358,48 +4391,15 @@ async def delete_lesson(
 
 @app.get("/api/courses/public/list")
 async def get_public_courses(
+    request: Request,
     category: str = Query(None),
     level: str = Query(None),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100)
 ):
-    """Get published courses (public endpoint)"""
-    query = {"status": "published"}
-    
-    if category:
-        query["category"] = category
-    if level:
-        query["level"] = level
-    
-    total = courses_collection.count_documents(query)
-    skip = (page - 1) * limit
-    
-    courses = list(courses_collection.find(query, {
-        'user_id': 0  # Don't expose user_id
-    }).skip(skip).limit(limit).sort("created_at", -1))
-    
-    for course in courses:
-        course.pop('_id', None)
-        # Only show preview lessons
-        modules = list(course_modules_collection.find({"course_id": course['id']}))
-        for module in modules:
-            module.pop('_id', None)
-            preview_lessons = list(course_lessons_collection.find({
-                "module_id": module['id'],
-                "is_preview": True
-            }, {'content': 0}))  # Don't expose full content
-            for lesson in preview_lessons:
-                lesson.pop('_id', None)
-            module['preview_lessons'] = preview_lessons
-        course['preview_modules'] = modules
-    
-    return {
-        "courses": courses,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": (total + limit - 1) // limit
-    }
+    """Get published courses (public endpoint, served from the materialised catalog)"""
+    body, etag = course_catalog.get_page(category=category, level=level, page=page, limit=limit)
+    return cached_response(request, body, etag)
 
 @app.get("/api/courses/{course_id}/public/preview")
 async def get_course_preview(course_id: str):
@@ -4416,20 +4416,12 @@ async def get_course_preview(course_id: str):
     course.pop('user_id', None)
     
     # Get modules with preview lessons only
-    modules = list(course_modules_collection.find({"course_id": course_id}).sort("order", 1))
-    for module in modules:
-        module.pop('_id', None)
-        module.pop('user_id', None)
-        # Get preview lessons
-        lessons = list(course_lessons_collection.find({
-            "module_id": module['id'],
-            "is_preview": True
-        }, {
-            'id': 1, 'title': 1, 'description': 1, 'content_type': 1, 'duration': 1, 'order': 1
-        }))
-        for lesson in lessons:
-            lesson.pop('_id', None)
-        module['preview_lessons'] = lessons
+    modules = list(course_modules_collection.find(
+        {"course_id": course_id}, {'_id': 0, 'user_id': 0}
+    ).sort("order", 1))
+    hydrate(modules, 'id', course_lessons_collection, 'preview_lessons',
+            projection={'id': 1, 'title': 1, 'description': 1, 'content_type': 1, 'duration': 1, 'order': 1},
+            key='module_id', many=True, filters={"is_preview": True})
     
     course['modules_preview'] = modules
     
@@ -4474,34 +4466,17 @@ async def enroll_in_course(
         payment_amount = 0.0
     
     # Create or find contact
-    contact_id = None
-    existing_contact = contacts_collection.find_one({
-        "user_id": course['user_id'],
-        "email": enrollment_data.student_email
-    })
-    
-    if existing_contact:
-        contact_id = existing_contact['id']
-    else:
-        # Create new contact
-        contact = {
-            'id': str(uuid.uuid4()),
-            'user_id': course['user_id'],
-            'first_name': enrollment_data.student_name.split()[0],
-            'last_name': ' '.join(enrollment_data.student_name.split()[1:]) if len(enrollment_data.student_name.split()) > 1 else None,
-            'email': enrollment_data.student_email,
-            'source': f"Course Enrollment: {course['title']}",
-            'status': 'lead',
-            'score': 0,
-            'tags': ['course-student'],
-            'segments': [],
-            'custom_fields': {},
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-            'engagement_count': 0
-        }
-        contacts_collection.insert_one(contact)
-        contact_id = contact['id']
+    name_parts = enrollment_data.student_name.split()
+    contact_id = await contact_ingestor.ingest(
+        course['user_id'],
+        enrollment_data.student_email,
+        on_insert={
+            'first_name': name_parts[0] if name_parts else '',
+            'last_name': ' '.join(name_parts[1:]) if len(name_parts) > 1 else None,
+            'source': f"Course Enrollment: {course['title']}"
+        },
+        tags=['course-student']
+    )
     
     # Create enrollment
     enrollment = {
@@ -4513,6 +4488,7 @@ async def enroll_in_course(
         'enrollment_date': datetime.utcnow(),
         'completed_date': None,
         'progress_percentage': 0.0,
+        'completed_lesson_ids': [],
         'current_module_id': None,
         'current_lesson_id': None,
         'payment_status': payment_status,
@@ -4531,6 +4507,7 @@ async def enroll_in_course(
         {"id": course_id},
         {"$inc": {"total_students": 1}}
     )
+    course_catalog.update_counters(course_id, increments={"total_students": 1})
     
     return enrollment
 
@@ -4539,21 +4516,18 @@ async def get_my_enrollments(current_user: dict = Depends(get_current_user)):
     """Get user's course enrollments"""
     enrollments = list(course_enrollments_collection.find({
         "user_id": current_user['id']
-    }).sort("enrollment_date", -1))
+    }, {'_id': 0}).sort("enrollment_date", -1))
     
-    for enrollment in enrollments:
-        enrollment.pop('_id', None)
-        # Get course details
-        course = courses_collection.find_one({"id": enrollment['course_id']})
-        if course:
-            course.pop('_id', None)
-            enrollment['course'] = {
+    # Get course details for all enrollments in one query
+    hydrate(enrollments, 'course_id', courses_collection, 'course',
+            projection={'id': 1, 'title': 1, 'description': 1, 'thumbnail': 1, 'level': 1},
+            transform=lambda course: {
                 'id': course['id'],
                 'title': course['title'],
                 'description': course['description'],
                 'thumbnail': course.get('thumbnail'),
                 'level': course.get('level')
-            }
+            })
     
     return enrollments
 
@@ -4578,21 +4552,18 @@ async def get_course_students(
     total = course_enrollments_collection.count_documents(query)
     skip = (page - 1) * limit
     
-    enrollments = list(course_enrollments_collection.find(query)
+    enrollments = list(course_enrollments_collection.find(query, {'_id': 0})
                       .skip(skip)
                       .limit(limit)
                       .sort("enrollment_date", -1))
     
-    for enrollment in enrollments:
-        enrollment.pop('_id', None)
-        # Get contact details
-        if enrollment.get('contact_id'):
-            contact = contacts_collection.find_one({"id": enrollment['contact_id']})
-            if contact:
-                enrollment['student'] = {
-                    'name': f"{contact['first_name']} {contact.get('last_name', '')}".strip(),
-                    'email': contact['email']
-                }
+    # Get contact details for the whole page in one query
+    hydrate(enrollments, 'contact_id', contacts_collection, 'student',
+            projection={'first_name': 1, 'last_name': 1, 'email': 1},
+            transform=lambda contact: {
+                'name': f"{contact['first_name']} {contact.get('last_name') or ''}".strip(),
+                'email': contact['email']
+            })
     
     return {
         "students": enrollments,
@@ -4604,6 +4575,58 @@ async def get_course_students(
 
 # ==================== COURSE PROGRESS ROUTES ====================
 
+def get_course_lesson_count(course_id: str) -> int:
+    """Get the cached lesson count for a course, backfilling it for older courses"""
+    course = courses_collection.find_one({"id": course_id}, {'total_lessons': 1})
+    if not course:
+        return 0
+    
+    if 'total_lessons' not in course:
+        total_lessons = course_lessons_collection.count_documents({"course_id": course_id})
+        courses_collection.update_one(
+            {"id": course_id, "total_lessons": {"$exists": False}},
+            {"$set": {"total_lessons": total_lessons}}
+        )
+        return total_lessons
+    
+    return course['total_lessons']
+
+def adjust_course_lesson_count(course_id: str, delta: int):
+    """Apply a lesson count change; older courses without the count are recounted instead"""
+    result = courses_collection.update_one(
+        {"id": course_id, "total_lessons": {"$exists": True}},
+        {"$inc": {"total_lessons": delta}}
+    )
+    if result.matched_count == 0:
+        # The lessons are already written, so the recount includes this change
+        get_course_lesson_count(course_id)
+
+def backfill_completed_lessons(enrollment: dict, lesson_id: str, total_lessons: int, now: datetime) -> set:
+    """
+    Seed completed_lesson_ids for enrollments created before it was tracked
+    
+    The atomic progress update only saw this lesson for such enrollments, so
+    progress and completion are recomputed here from the recorded lesson
+    progress. Returns the lessons completed before this one.
+    """
+    previously_completed = set(course_progress_collection.distinct("lesson_id", {
+        "enrollment_id": enrollment['id'],
+        "completed": True
+    }))
+    completed_ids = previously_completed | {lesson_id}
+    progress_percentage = min(len(completed_ids) / total_lessons * 100, 100) if total_lessons > 0 else 0
+    updates = {"progress_percentage": round(progress_percentage, 2)}
+    if total_lessons > 0 and len(completed_ids) >= total_lessons and not enrollment.get('completed_date'):
+        updates["completed_date"] = now
+    course_enrollments_collection.update_one(
+        {"id": enrollment['id']},
+        {
+            "$addToSet": {"completed_lesson_ids": {"$each": list(completed_ids)}},
+            "$set": updates
+        }
+    )
+    return previously_completed
+
 @app.post("/api/courses/{course_id}/lessons/{lesson_id}/complete")
 async def mark_lesson_complete(
     course_id: str,
@@ -4612,102 +4635,102 @@ async def mark_lesson_complete(
     current_user: dict = Depends(get_current_user)
 ):
     """Mark a lesson as complete"""
-    # Get enrollment
-    enrollment = course_enrollments_collection.find_one({
-        "user_id": current_user['id'],
-        "course_id": course_id
-    })
-    
-    if not enrollment:
-        raise HTTPException(status_code=404, detail="Enrollment not found")
-    
     # Get lesson
-    lesson = course_lessons_collection.find_one({"id": lesson_id, "course_id": course_id})
+    lesson = course_lessons_collection.find_one(
+        {"id": lesson_id, "course_id": course_id},
+        {'module_id': 1}
+    )
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
     
-    # Check if already completed
-    existing_progress = course_progress_collection.find_one({
-        "enrollment_id": enrollment['id'],
-        "lesson_id": lesson_id
-    })
+    total_lessons = get_course_lesson_count(course_id)
+    now = datetime.utcnow()
     
-    if existing_progress:
-        # Update existing progress
-        course_progress_collection.update_one(
-            {"id": existing_progress['id']},
+    # Add the lesson to the completed set and recompute progress in one atomic update
+    completed_count = {"$size": "$completed_lesson_ids"}
+    enrollment = course_enrollments_collection.find_one_and_update(
+        {"user_id": current_user['id'], "course_id": course_id},
+        [
             {"$set": {
-                "completed": True,
-                "completed_at": datetime.utcnow(),
-                "time_spent": progress_data.time_spent,
-                "quiz_score": progress_data.quiz_score,
-                "quiz_passed": progress_data.quiz_passed,
-                "updated_at": datetime.utcnow()
+                "completed_lesson_ids": {"$setUnion": [
+                    {"$ifNull": ["$completed_lesson_ids", []]}, [lesson_id]
+                ]},
+                "current_lesson_id": lesson_id,
+                "current_module_id": lesson['module_id'],
+                "last_accessed": now,
+                "total_time_spent": {"$add": [
+                    {"$ifNull": ["$total_time_spent", 0]}, progress_data.time_spent or 0
+                ]}
+            }},
+            {"$set": {
+                "progress_percentage": {"$round": [{"$min": [100, {"$multiply": [
+                    {"$divide": [completed_count, max(total_lessons, 1)]}, 100
+                ]}]}, 2]},
+                "completed_date": {"$cond": [
+                    {"$and": [{"$gt": [total_lessons, 0]}, {"$gte": [completed_count, total_lessons]}]},
+                    {"$ifNull": ["$completed_date", now]},
+                    "$completed_date"
+                ]}
             }}
-        )
-        progress = course_progress_collection.find_one({"id": existing_progress['id']})
-    else:
-        # Create new progress record
-        progress = {
-            'id': str(uuid.uuid4()),
-            'enrollment_id': enrollment['id'],
-            'user_id': current_user['id'],
-            'course_id': course_id,
-            'module_id': lesson['module_id'],
-            'lesson_id': lesson_id,
-            'completed': True,
-            'completed_at': datetime.utcnow(),
-            'time_spent': progress_data.time_spent,
-            'quiz_score': progress_data.quiz_score,
-            'quiz_passed': progress_data.quiz_passed,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
-        course_progress_collection.insert_one(progress)
-    
-    progress.pop('_id', None)
+        ],
+        projection={'id': 1, 'completed_lesson_ids': 1, 'completed_date': 1},
+        return_document=ReturnDocument.BEFORE
+    )
     
-    # Update enrollment progress
-    total_lessons = course_lessons_collection.count_documents({"course_id": course_id})
-    completed_lessons = course_progress_collection.count_documents({
-        "enrollment_id": enrollment['id'],
-        "completed": True
-    })
+    if not enrollment:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
     
-    progress_percentage = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
+    previously_completed = set(enrollment.get('completed_lesson_ids', []))
+    if 'completed_lesson_ids' not in enrollment:
+        previously_completed = backfill_completed_lessons(enrollment, lesson_id, total_lessons, now)
     
-    course_enrollments_collection.update_one(
-        {"id": enrollment['id']},
-        {"$set": {
-            "progress_percentage": round(progress_percentage, 2),
-            "current_lesson_id": lesson_id,
-            "current_module_id": lesson['module_id'],
-            "last_accessed": datetime.utcnow()
+    # Record per-lesson details (idempotent per enrollment and lesson)
+    progress = course_progress_collection.find_one_and_update(
+        {"enrollment_id": enrollment['id'], "lesson_id": lesson_id},
+        {
+            "$set": {
+                "completed": True,
+                "completed_at": now,
+                "time_spent": progress_data.time_spent,
+                "quiz_score": progress_data.quiz_score,
+                "quiz_passed": progress_data.quiz_passed,
+                "updated_at": now
+            },
+            "$setOnInsert": {
+                'id': str(uuid.uuid4()),
+                'user_id': current_user['id'],
+                'course_id': course_id,
+                'module_id': lesson['module_id'],
+                'created_at': now
+            }
         },
-        "$inc": {"total_time_spent": progress_data.time_spent}
-        }
+        projection={'_id': 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
     
-    # Check if course is complete
-    if progress_percentage >= 100:
-        course_enrollments_collection.update_one(
-            {"id": enrollment['id']},
-            {"$set": {"completed_date": datetime.utcnow()}}
-        )
-        
-        # Update course completions
-        courses_collection.update_one(
-            {"id": course_id},
-            {"$inc": {"total_completions": 1}}
-        )
-        
-        # Recalculate completion rate
-        course = courses_collection.find_one({"id": course_id})
-        completion_rate = (course['total_completions'] / course['total_students'] * 100) if course['total_students'] > 0 else 0
-        courses_collection.update_one(
+    # Count the course completion once, on the lesson that finishes it
+    if (
+        lesson_id not in previously_completed
+        and not enrollment.get('completed_date')
+        and total_lessons > 0
+        and len(previously_completed) + 1 >= total_lessons
+    ):
+        counters = courses_collection.find_one_and_update(
             {"id": course_id},
-            {"$set": {"completion_rate": round(completion_rate, 2)}}
+            [
+                {"$set": {"total_completions": {"$add": [{"$ifNull": ["$total_completions", 0]}, 1]}}},
+                {"$set": {"completion_rate": {"$cond": [
+                    {"$gt": ["$total_students", 0]},
+                    {"$round": [{"$multiply": [{"$divide": ["$total_completions", "$total_students"]}, 100]}, 2]},
+                    0
+                ]}}}
+            ],
+            projection={'_id': 0, 'total_completions': 1, 'completion_rate': 1},
+            return_document=ReturnDocument.AFTER
         )
+        if counters:
+            course_catalog.update_counters(course_id, values=counters)
     
     return progress
 
@@ -5041,6 +5064,7 @@ async def subscribe_to_tier(
                         'enrollment_date': datetime.utcnow(),
                         'completed_date': None,
                         'progress_percentage': 0.0,
+                        'completed_lesson_ids': [],
                         'current_module_id': None,
                         'current_lesson_id': None,
                         'payment_status': 'completed',
@@ -5057,6 +5081,7 @@ async def subscribe_to_tier(
                         {"id": course_id},
                         {"$inc": {"total_students": 1}}
                     )
+                    course_catalog.update_counters(course_id, increments={"total_students": 1})
     
     return subscription
 
@@ -5284,6 +5309,8 @@ async def create_blog_post(
     
     blog_posts_collection.insert_one(post_dict)
     post_dict.pop('_id', None)
+    public_content.invalidate('blog_post', current_user['id'], slugs=[post_dict['slug']])
+    blog_feeds.invalidate(current_user['id'])
     
     return post_dict
 
@@ -5343,6 +5370,8 @@ async def update_blog_post(
         {'id': post_id, 'user_id': current_user['id']},
         {'$set': update_data}
     )
+    public_content.invalidate('blog_post', current_user['id'], post_id, slugs=[update_data.get('slug', post['slug'])])
+    blog_feeds.invalidate(current_user['id'])
     
     updated_post = blog_posts_collection.find_one({'id': post_id})
     updated_post['_id'] = str(updated_post['_id'])
@@ -5367,9 +5396,13 @@ async def delete_blog_post(
             detail="Blog post not found"
         )
     
+    public_content.invalidate('blog_post', current_user['id'], post_id)
+    blog_feeds.invalidate(current_user['id'])
+    
     # Also delete associated comments and views
     blog_comments_collection.delete_many({'post_id': post_id})
     blog_post_views_collection.delete_many({'post_id': post_id})
+    page_view_tracker.discard('blog_post', post_id)
     
     return {"message": "Blog post deleted"}
 
@@ -5639,6 +5672,7 @@ async def create_website_page(
     
     website_pages_collection.insert_one(page_dict)
     page_dict.pop('_id', None)
+    public_content.invalidate('website_page', current_user['id'], slugs=[page_dict['slug']])
     
     return page_dict
 
@@ -5692,6 +5726,7 @@ async def update_website_page(
         )
     
     updated_page = website_pages_collection.find_one({'id': page_id})
+    public_content.invalidate('website_page', current_user['id'], page_id, slugs=[updated_page['slug']])
     updated_page['_id'] = str(updated_page['_id'])
     
     return updated_page
@@ -5714,8 +5749,11 @@ async def delete_website_page(
             detail="Page not found"
         )
     
+    public_content.invalidate('website_page', current_user['id'], page_id)
+    
     # Also delete associated views
     website_page_views_collection.delete_many({'page_id': page_id})
+    page_view_tracker.discard('website_page', page_id)
     
     return {"message": "Page deleted"}
 
@@ -5990,14 +6028,12 @@ async def public_list_blog_posts(
 @app.get("/api/public/blog/posts/{slug}")
 async def public_get_blog_post(
     slug: str,
+    request: Request,
     user_id: str = Query(...)
 ):
     """Public endpoint to get a published blog post by slug"""
-    post = blog_posts_collection.find_one({
-        'slug': slug,
-        'user_id': user_id,
-        'status': 'published'
-    })
+    # Served from the pre-encoded content cache (ETag / If-None-Match aware)
+    post = await public_content.get('blog_post', user_id, slug)
     
     if not post:
         raise HTTPException(
@@ -6005,23 +6041,10 @@ async def public_get_blog_post(
             detail="Blog post not found"
         )
     
-    # Track view
-    view_data = {
-        'id': str(uuid.uuid4()),
-        'post_id': post['id'],
-        'user_id': user_id,
-        'created_at': datetime.utcnow()
-    }
-    blog_post_views_collection.insert_one(view_data)
-    
-    # Increment view count
-    blog_posts_collection.update_one(
-        {'id': post['id']},
-        {'$inc': {'total_views': 1}}
-    )
+    # Track view (buffered; written as hourly rollups with the post's total_views)
+    page_view_tracker.record('blog_post', post.id, user_id, request)
     
-    post['_id'] = str(post['_id'])
-    return post
+    return post.payload.respond(request)
 
 
 @app.post("/api/public/blog/posts/{post_id}/comments", status_code=status.HTTP_201_CREATED)
@@ -6068,14 +6091,12 @@ async def public_create_blog_comment(
 @app.get("/api/public/website/pages/{slug}")
 async def public_get_website_page(
     slug: str,
+    request: Request,
     user_id: str = Query(...)
 ):
     """Public endpoint to get a published website page by slug"""
-    page = website_pages_collection.find_one({
-        'slug': slug,
-        'user_id': user_id,
-        'status': 'published'
-    })
+    # Served from the pre-encoded content cache; private pages are cached as not found
+    page = await public_content.get('website_page', user_id, slug)
     
     if not page:
         raise HTTPException(
@@ -6083,31 +6104,10 @@ async def public_get_website_page(
             detail="Page not found"
         )
     
-    # Check visibility - only allow public pages
-    page_visibility = page.get('visibility', 'public')
-    if page_visibility == 'private':
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Page not found"
-        )
-    
-    # Track view
-    view_data = {
-        'id': str(uuid.uuid4()),
-        'page_id': page['id'],
-        'user_id': user_id,
-        'created_at': datetime.utcnow()
-    }
-    website_page_views_collection.insert_one(view_data)
-    
-    # Increment view count
-    website_pages_collection.update_one(
-        {'id': page['id']},
-        {'$inc': {'total_views': 1}}
-    )
+    # Track view (buffered; written as hourly rollups with the page's total_views)
+    page_view_tracker.record('website_page', page.id, user_id, request)
     
-    page['_id'] = str(page['_id'])
-    return page
+    return page.payload.respond(request)
 
 
 # ==================== BLOG & WEBSITE ANALYTICS ROUTES ====================
@@ -6289,50 +6289,19 @@ async def delete_navigation_menu(
 
 @app.get("/api/public/blog/rss")
 async def generate_rss_feed(
-    user_id: str = Query(...)
+    request: Request,
+    user_id: str = Query(...),
+    format: str = Query("rss", regex="^(rss|atom)$")
 ):
-    """Generate RSS feed for blog posts"""
-    # Get user info
-    user = users_collection.find_one({'id': user_id})
-    if not user:
+    """RSS (or Atom) feed of the latest blog posts, rebuilt only after posts change"""
+    feed = await blog_feeds.get(user_id, format)
+    if not feed:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Get published posts
-    posts = list(blog_posts_collection.find({
-        'user_id': user_id,
-        'status': 'published'
-    }).sort('published_at', -1).limit(20))
-    
-    # Generate RSS XML
-    rss_items = []
-    for post in posts:
-        item = f"""
-        <item>
-            <title>{post.get('title', '')}</title>
-            <link>https://yourblog.com/blog/{post.get('slug', '')}</link>
-            <description>{post.get('excerpt', '')}</description>
-            <pubDate>{post.get('published_at', '').strftime('%a, %d %b %Y %H:%M:%S GMT') if post.get('published_at') else ''}</pubDate>
-            <guid>https://yourblog.com/blog/{post.get('slug', '')}</guid>
-        </item>
-        """
-        rss_items.append(item)
-    
-    rss_xml = f"""<?xml version="1.0" encoding="UTF-8" ?>
-    <rss version="2.0">
-        <channel>
-            <title>{user.get('full_name', '')}'s Blog</title>
-            <link>https://yourblog.com</link>
-            <description>Latest blog posts</description>
-            <language>en-us</language>
-            {''.join(rss_items)}
-        </channel>
-    </rss>
-    """
-    
-    return JSONResponse(content=rss_xml, media_type="application/rss+xml")
+    return feed.respond(request)
 
 
 # ==================== WEBINAR ROUTES (PHASE 9) ====================
@@ -6371,6 +6340,8 @@ async def create_webinar(
     webinar_dict['status'] = 'draft'
     webinar_dict['registration_count'] = 0
     webinar_dict['attendee_count'] = 0
+    webinar_dict['stats'] = webinar_stats.empty_stats()
+    webinar_dict['stats_since'] = datetime.utcnow()
     webinar_dict['created_at'] = datetime.utcnow()
     webinar_dict['updated_at'] = datetime.utcnow()
     
@@ -6416,6 +6387,7 @@ async def update_webinar(
         {"id": webinar_id},
         {"$set": update_data}
     )
+    chat_store.set_status(webinar_id, None)
     
     updated = webinars_collection.find_one({"id": webinar_id})
     return updated
@@ -6436,9 +6408,12 @@ async def delete_webinar(
     
     # Also delete related data
     webinar_registrations_collection.delete_many({"webinar_id": webinar_id})
+    chat_store.drop(webinar_id)
+    poll_votes.drop([p["id"] for p in webinar_polls_collection.find({"webinar_id": webinar_id}, {"_id": 0, "id": 1})])
     webinar_chat_messages_collection.delete_many({"webinar_id": webinar_id})
     webinar_qa_collection.delete_many({"webinar_id": webinar_id})
     webinar_polls_collection.delete_many({"webinar_id": webinar_id})
+    webinar_poll_votes_collection.delete_many({"webinar_id": webinar_id})
     
     return None
 
@@ -6492,6 +6467,7 @@ async def start_webinar(
             "updated_at": datetime.utcnow()
         }}
     )
+    chat_store.set_status(webinar_id, "live")
     
     return {"message": "Webinar started"}
 
@@ -6517,6 +6493,7 @@ async def end_webinar(
             "updated_at": datetime.utcnow()
         }}
     )
+    chat_store.set_status(webinar_id, "ended")
     
     return {"message": "Webinar ended"}
 
@@ -6558,84 +6535,76 @@ async def register_for_webinar(
     background_tasks: BackgroundTasks
 ):
     """Public endpoint for webinar registration"""
-    webinar = webinars_collection.find_one({"id": webinar_id})
+    seat = {
+        "registration_count": 1,
+        "stats.registrations_total": 1,
+        "stats.registrations.registered": 1
+    }
     
-    if not webinar:
-        raise HTTPException(status_code=404, detail="Webinar not found")
-    
-    # Check if already registered
-    existing = webinar_registrations_collection.find_one({
-        "webinar_id": webinar_id,
-        "email": registration.email
-    })
-    
-    if existing:
-        raise HTTPException(status_code=400, detail="Already registered for this webinar")
-    
-    # Check max attendees
-    if webinar.get('max_attendees'):
-        current_count = webinars_collection.find_one({"id": webinar_id}).get('registration_count', 0)
-        if current_count >= webinar['max_attendees']:
-            raise HTTPException(status_code=400, detail="Webinar is full")
-    
-    # Create registration
-    registration_dict = registration.model_dump()
-    registration_dict['id'] = str(uuid.uuid4())
-    registration_dict['webinar_id'] = webinar_id
-    registration_dict['status'] = 'registered'
-    registration_dict['registered_at'] = datetime.utcnow()
-    registration_dict['watch_time_minutes'] = 0
+    # Reserve a seat atomically; webinars without max_attendees are unlimited
+    webinar = webinars_collection.find_one_and_update(
+        {
+            "id": webinar_id,
+            "$or": [
+                {"max_attendees": {"$in": [None, 0]}},
+                {"$expr": {"$lt": [{"$ifNull": ["$registration_count", 0]}, "$max_attendees"]}}
+            ]
+        },
+        {"$inc": seat},
+        return_document=ReturnDocument.AFTER
+    )
     
-    webinar_registrations_collection.insert_one(registration_dict)
+    if not webinar:
+        if not webinars_collection.find_one({"id": webinar_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Webinar not found")
+        raise HTTPException(status_code=400, detail="Webinar is full")
     
-    # Update registration count
-    webinars_collection.update_one(
-        {"id": webinar_id},
-        {"$inc": {"registration_count": 1}}
-    )
+    def release_seat():
+        webinars_collection.update_one({"id": webinar_id}, {"$inc": {k: -v for k, v in seat.items()}})
     
-    # Create contact in CRM
-    user_id = webinar.get('user_id')
-    if user_id:
-        contact_data = {
-            'id': str(uuid.uuid4()),
-            'user_id': user_id,
-            'first_name': registration.first_name,
-            'last_name': registration.last_name,
-            'email': registration.email,
-            'phone': registration.phone or '',
-            'company': registration.company or '',
-            'source': f'Webinar Registration: {webinar.get("title", "")}',
-            'status': 'lead',
-            'score': 0,
-            'tags': ['webinar-registrant'],
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        }
-        
-        # Check if contact already exists
-        existing_contact = contacts_collection.find_one({
-            'user_id': user_id,
-            'email': registration.email
-        })
-        
-        if existing_contact:
-            # Update existing contact
-            contacts_collection.update_one(
-                {'id': existing_contact['id']},
-                {'$addToSet': {'tags': 'webinar-registrant'}}
+    # Anything failing past this point gives the seat back, so capped webinars don't drift to full
+    try:
+        now = datetime.utcnow()
+        registration_dict = registration.model_dump()
+        registration_dict['id'] = str(uuid.uuid4())
+        registration_dict['webinar_id'] = webinar_id
+        registration_dict['status'] = 'registered'
+        registration_dict['registered_at'] = now
+        registration_dict['watch_time_minutes'] = 0
+        
+        # Upsert the contact in CRM first so the registration is written with its contact_id
+        user_id = webinar.get('user_id')
+        if user_id:
+            registration_dict['contact_id'] = await contact_ingestor.ingest(
+                user_id,
+                registration.email,
+                on_insert={
+                    'first_name': registration.first_name,
+                    'last_name': registration.last_name,
+                    'phone': registration.phone or '',
+                    'company': registration.company or '',
+                    'source': f'Webinar Registration: {webinar.get("title", "")}'
+                },
+                tags=['webinar-registrant']
             )
-            registration_dict['contact_id'] = existing_contact['id']
-        else:
-            # Create new contact
-            contacts_collection.insert_one(contact_data)
-            registration_dict['contact_id'] = contact_data['id']
         
-        # Update registration with contact_id
-        webinar_registrations_collection.update_one(
-            {"id": registration_dict['id']},
-            {"$set": {"contact_id": registration_dict.get('contact_id')}}
-        )
+        # Create the registration unless this email already has one (unique on webinar_id + email)
+        try:
+            result = webinar_registrations_collection.update_one(
+                {"webinar_id": webinar_id, "email": registration.email},
+                {"$setOnInsert": {k: v for k, v in registration_dict.items() if k not in ("webinar_id", "email")}},
+                upsert=True
+            )
+            already_registered = result.upserted_id is None
+        except DuplicateKeyError:
+            already_registered = True
+    except BaseException:  # Including cancellation of the request
+        release_seat()
+        raise
+    
+    if already_registered:
+        release_seat()
+        raise HTTPException(status_code=400, detail="Already registered for this webinar")
     
     # Send confirmation email
     background_tasks.add_task(
@@ -6679,6 +6648,7 @@ async def get_webinar_registrations(
 @app.get("/api/webinars/{webinar_id}/registrations/export")
 async def export_webinar_registrations(
     webinar_id: str,
+    request: Request,
     current_user: dict = Depends(get_current_user),
     format: str = Query("csv", regex="^(csv|excel)$")
 ):
@@ -6691,46 +6661,58 @@ async def export_webinar_registrations(
     if not webinar:
         raise HTTPException(status_code=404, detail="Webinar not found")
     
-    registrations = list(webinar_registrations_collection.find({"webinar_id": webinar_id}))
+    query = {"webinar_id": webinar_id}
     
-    if not registrations:
+    if not webinar_registrations_collection.find_one(query, {"_id": 1}):
         raise HTTPException(status_code=404, detail="No registrations found")
     
-    # Convert to DataFrame
-    df_data = []
-    for reg in registrations:
-        df_data.append({
-            'First Name': reg.get('first_name', ''),
-            'Last Name': reg.get('last_name', ''),
-            'Email': reg.get('email', ''),
-            'Phone': reg.get('phone', ''),
-            'Company': reg.get('company', ''),
-            'Status': reg.get('status', ''),
-            'Registered At': reg.get('registered_at', '').isoformat() if reg.get('registered_at') else '',
-            'Attended At': reg.get('attended_at', '').isoformat() if reg.get('attended_at') else '',
-            'Watch Time (minutes)': reg.get('watch_time_minutes', 0)
-        })
+    columns = [
+        ('First Name', 'first_name'),
+        ('Last Name', 'last_name'),
+        ('Email', 'email'),
+        ('Phone', 'phone'),
+        ('Company', 'company'),
+        ('Status', 'status'),
+        ('Registered At', 'registered_at'),
+        ('Attended At', 'attended_at'),
+        ('Watch Time (minutes)', 'watch_time_minutes')
+    ]
     
-    df = pd.DataFrame(df_data)
+    def rows():
+        projection = {"_id": 0, **{field: 1 for _, field in columns}}
+        for reg in webinar_registrations_collection.find(query, projection):
+            row = [reg.get(field) for _, field in columns]
+            row[-1] = row[-1] or 0
+            yield row
+    
+    return await stream_export(
+        request,
+        [title for title, _ in columns],
+        rows(),
+        format,
+        f"webinar_registrations_{webinar_id}"
+    )
+
+# ==================== WEBINAR LIVE EVENTS ====================
+
+@app.get("/api/webinars/{webinar_id}/events")
+async def stream_webinar_events(webinar_id: str):
+    """
+    Live chat, Q&A and poll updates as Server-Sent Events (public)
     
-    if format == "csv":
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=webinar_registrations_{webinar_id}.csv"}
-        )
-    else:  # excel
-        output = io.BytesIO()
-        df.to_excel(output, index=False, engine='openpyxl')
-        output.seek(0)
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=webinar_registrations_{webinar_id}.xlsx"}
-        )
+    Events: chat.message, chat.deleted, qa.created, qa.updated,
+    poll.created, poll.updated, poll.deleted
+    """
+    webinar = webinars_collection.find_one({"id": webinar_id}, {"_id": 0, "id": 1})
+    
+    if not webinar:
+        raise HTTPException(status_code=404, detail="Webinar not found")
+    
+    async def frames():
+        async for event in webinar_events.events(webinar_id):
+            yield format_sse(event["data"], event=event["event"], event_id=str(event["id"]))
+    
+    return sse_response(frames())
 
 # ==================== WEBINAR CHAT ROUTES ====================
 
@@ -6741,22 +6723,19 @@ async def get_chat_messages(
     limit: int = 100
 ):
     """Get chat messages (public during live webinar)"""
-    query = {"webinar_id": webinar_id}
+    since_dt = None
     
     if since:
         try:
             since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-            query["created_at"] = {"$gt": since_dt}
+            if since_dt.tzinfo:
+                # Messages are stored with naive UTC timestamps
+                since_dt = since_dt.astimezone(timezone.utc).replace(tzinfo=None)
         except:
             pass
     
-    messages = list(
-        webinar_chat_messages_collection.find(query)
-        .sort("created_at", -1)
-        .limit(limit)
-    )
-    
-    messages.reverse()  # Return in chronological order
+    # Recent messages come from the in-memory buffer, in chronological order
+    messages = chat_store.messages(webinar_id, since_dt, limit)
     
     return {"messages": messages}
 
@@ -6766,12 +6745,12 @@ async def send_chat_message(
     message: WebinarChatMessageCreate
 ):
     """Send chat message (public during live webinar)"""
-    webinar = webinars_collection.find_one({"id": webinar_id})
+    webinar_status = chat_store.webinar_status(webinar_id)
     
-    if not webinar:
+    if webinar_status is None:
         raise HTTPException(status_code=404, detail="Webinar not found")
     
-    if webinar.get('status') != 'live':
+    if webinar_status != 'live':
         raise HTTPException(status_code=400, detail="Webinar is not live")
     
     message_dict = message.model_dump()
@@ -6780,7 +6759,9 @@ async def send_chat_message(
     message_dict['is_host'] = False
     message_dict['created_at'] = datetime.utcnow()
     
-    webinar_chat_messages_collection.insert_one(message_dict)
+    # Persisted in batches by the chat flusher
+    chat_store.add(message_dict)
+    webinar_events.publish(webinar_id, "chat.message", message_dict)
     
     return message_dict
 
@@ -6799,13 +6780,17 @@ async def delete_chat_message(
     if not webinar:
         raise HTTPException(status_code=404, detail="Webinar not found or unauthorized")
     
-    result = webinar_chat_messages_collection.delete_one({
-        "id": message_id,
-        "webinar_id": webinar_id
-    })
+    if not chat_store.discard_pending(webinar_id, message_id):
+        result = webinar_chat_messages_collection.delete_one({
+            "id": message_id,
+            "webinar_id": webinar_id
+        })
+        
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Message not found")
+        webinar_stats.increment(webinar_id, {"chat_messages": -1})
     
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Message not found")
+    webinar_events.publish(webinar_id, "chat.deleted", {"id": message_id})
     
     return None
 
@@ -6858,6 +6843,8 @@ async def ask_question(
     qa_dict['created_at'] = datetime.utcnow()
     
     webinar_qa_collection.insert_one(qa_dict)
+    webinar_stats.increment(webinar_id, {"questions": 1})
+    webinar_events.publish(webinar_id, "qa.created", qa_dict)
     
     return qa_dict
 
@@ -6877,20 +6864,25 @@ async def answer_question(
     if not webinar:
         raise HTTPException(status_code=404, detail="Webinar not found or unauthorized")
     
-    result = webinar_qa_collection.update_one(
+    previous = webinar_qa_collection.find_one_and_update(
         {"id": question_id, "webinar_id": webinar_id},
         {"$set": {
             "answer": answer_text,
             "answered_by": current_user.get('full_name', 'Host'),
             "is_answered": True,
             "answered_at": datetime.utcnow()
-        }}
+        }},
+        projection={"_id": 0, "is_answered": 1}
     )
     
-    if result.modified_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Question not found")
     
+    if not previous.get("is_answered"):
+        webinar_stats.increment(webinar_id, {"answered_questions": 1})
+    
     updated = webinar_qa_collection.find_one({"id": question_id})
+    webinar_events.publish(webinar_id, "qa.updated", updated)
     return updated
 
 @app.post("/api/webinars/{webinar_id}/qa/{question_id}/upvote")
@@ -6908,6 +6900,7 @@ async def upvote_question(
         raise HTTPException(status_code=404, detail="Question not found")
     
     updated = webinar_qa_collection.find_one({"id": question_id})
+    webinar_events.publish(webinar_id, "qa.updated", updated)
     return updated
 
 @app.put("/api/webinars/{webinar_id}/qa/{question_id}/feature")
@@ -6934,6 +6927,7 @@ async def feature_question(
         raise HTTPException(status_code=404, detail="Question not found")
     
     updated = webinar_qa_collection.find_one({"id": question_id})
+    webinar_events.publish(webinar_id, "qa.updated", updated)
     return updated
 
 # ==================== WEBINAR POLLS ROUTES ====================
@@ -6977,6 +6971,8 @@ async def create_poll(
     poll_dict['created_at'] = datetime.utcnow()
     
     webinar_polls_collection.insert_one(poll_dict)
+    webinar_stats.increment(webinar_id, {"polls": 1})
+    webinar_events.publish(webinar_id, "poll.created", poll_dict)
     
     return poll_dict
 
@@ -6987,34 +6983,17 @@ async def vote_on_poll(
     vote: WebinarPollVote
 ):
     """Vote on a poll"""
-    poll = webinar_polls_collection.find_one({
-        "id": poll_id,
-        "webinar_id": webinar_id
-    })
-    
-    if not poll:
-        raise HTTPException(status_code=404, detail="Poll not found")
-    
-    if not poll.get('is_active', False):
-        raise HTTPException(status_code=400, detail="Poll is not active")
-    
-    # Update votes
-    votes = poll.get('votes', {})
-    for idx in vote.option_indices:
-        key = str(idx)
-        if key in votes:
-            votes[key] = votes.get(key, 0) + 1
-    
-    webinar_polls_collection.update_one(
-        {"id": poll_id},
-        {
-            "$set": {"votes": votes},
-            "$inc": {"total_votes": 1}
-        }
-    )
-    
-    updated = webinar_polls_collection.find_one({"id": poll_id})
-    return updated
+    # Votes are counted in memory and written with $inc in batches; tallies are broadcast per flush
+    try:
+        return await poll_votes.vote(
+            webinar_id,
+            poll_id,
+            vote.option_indices,
+            voter_id=vote.voter_id,
+            voter_name=vote.voter_name
+        )
+    except PollVoteError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 @app.put("/api/webinars/{webinar_id}/polls/{poll_id}")
 async def update_poll(
@@ -7040,7 +7019,10 @@ async def update_poll(
             {"$set": update_data}
         )
     
+    poll_votes.invalidate(poll_id)
+    
     updated = webinar_polls_collection.find_one({"id": poll_id})
+    webinar_events.publish(webinar_id, "poll.updated", updated)
     return updated
 
 @app.delete("/api/webinars/{webinar_id}/polls/{poll_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -7066,6 +7048,11 @@ async def delete_poll(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Poll not found")
     
+    poll_votes.drop([poll_id])
+    webinar_stats.increment(webinar_id, {"polls": -1})
+    webinar_poll_votes_collection.delete_many({"poll_id": poll_id})
+    webinar_events.publish(webinar_id, "poll.deleted", {"id": poll_id})
+    
     return None
 
 # ==================== WEBINAR RECORDINGS ROUTES ====================
@@ -7197,55 +7184,25 @@ async def get_webinar_analytics(
     current_user: dict = Depends(get_current_user)
 ):
     """Get webinar analytics summary"""
-    user_id = current_user["id"]
-    
-    total_webinars = webinars_collection.count_documents({"user_id": user_id})
-    
-    upcoming_webinars = webinars_collection.count_documents({
-        "user_id": user_id,
-        "status": "scheduled",
-        "scheduled_at": {"$gte": datetime.utcnow()}
-    })
-    
-    completed_webinars = webinars_collection.count_documents({
-        "user_id": user_id,
-        "status": "ended"
-    })
-    
-    # Get total registrations
-    user_webinar_ids = [w['id'] for w in webinars_collection.find({"user_id": user_id}, {"id": 1})]
-    total_registrations = webinar_registrations_collection.count_documents({
-        "webinar_id": {"$in": user_webinar_ids}
-    })
-    
-    total_attendees = webinar_registrations_collection.count_documents({
-        "webinar_id": {"$in": user_webinar_ids},
-        "status": "attended"
-    })
+    # One aggregation over the user's webinars and their engagement counters
+    totals = webinar_stats.summary(current_user["id"])
+    total_registrations = totals["total_registrations"]
+    total_attendees = totals["total_attendees"]
     
     # Calculate average attendance rate
     average_attendance_rate = 0.0
     if total_registrations > 0:
         average_attendance_rate = (total_attendees / total_registrations) * 100
     
-    # Get chat and Q&A stats
-    total_chat_messages = webinar_chat_messages_collection.count_documents({
-        "webinar_id": {"$in": user_webinar_ids}
-    })
-    
-    total_questions = webinar_qa_collection.count_documents({
-        "webinar_id": {"$in": user_webinar_ids}
-    })
-    
     return WebinarAnalytics(
-        total_webinars=total_webinars,
-        upcoming_webinars=upcoming_webinars,
-        completed_webinars=completed_webinars,
+        total_webinars=totals["total_webinars"],
+        upcoming_webinars=totals["upcoming_webinars"],
+        completed_webinars=totals["completed_webinars"],
         total_registrations=total_registrations,
         total_attendees=total_attendees,
         average_attendance_rate=round(average_attendance_rate, 2),
-        total_chat_messages=total_chat_messages,
-        total_questions=total_questions
+        total_chat_messages=totals["total_chat_messages"],
+        total_questions=totals["total_questions"]
     )
 
 @app.get("/api/webinars/{webinar_id}/analytics")
@@ -7262,23 +7219,23 @@ async def get_webinar_specific_analytics(
     if not webinar:
         raise HTTPException(status_code=404, detail="Webinar not found")
     
+    # Counters maintained on the webinar as events are written
+    stats = webinar_stats.stats_for(webinar)
+    registration_counts = stats.get('registrations', {})
+    
     # Registration stats
-    total_registrations = webinar_registrations_collection.count_documents({"webinar_id": webinar_id})
-    attended = webinar_registrations_collection.count_documents({"webinar_id": webinar_id, "status": "attended"})
-    no_show = webinar_registrations_collection.count_documents({"webinar_id": webinar_id, "status": "no_show"})
+    total_registrations = stats.get('registrations_total', 0)
+    attended = registration_counts.get('attended', 0)
+    no_show = registration_counts.get('no_show', 0)
     
     # Engagement stats
-    chat_messages = webinar_chat_messages_collection.count_documents({"webinar_id": webinar_id})
-    total_questions = webinar_qa_collection.count_documents({"webinar_id": webinar_id})
-    answered_questions = webinar_qa_collection.count_documents({"webinar_id": webinar_id, "is_answered": True})
-    total_polls = webinar_polls_collection.count_documents({"webinar_id": webinar_id})
+    chat_messages = stats.get('chat_messages', 0)
+    total_questions = stats.get('questions', 0)
+    answered_questions = stats.get('answered_questions', 0)
+    total_polls = stats.get('polls', 0)
     
     # Average watch time
-    registrations = list(webinar_registrations_collection.find({"webinar_id": webinar_id, "status": "attended"}))
-    avg_watch_time = 0
-    if registrations:
-        total_watch_time = sum(r.get('watch_time_minutes', 0) for r in registrations)
-        avg_watch_time = total_watch_time / len(registrations) if len(registrations) > 0 else 0
+    avg_watch_time = stats.get('watch_time_minutes', 0) / attended if attended > 0 else 0
     
     attendance_rate = (attended / total_registrations * 100) if total_registrations > 0 else 0
     
@@ -7308,9 +7265,9 @@ async def get_webinar_specific_analytics(
 async def process_webinar_reminders(current_user: dict = Depends(get_current_user)):
     """
     Manually trigger reminder processing (admin only)
-    In production, this would be a cron job
+    Reminders are also processed periodically by the background scheduler
     """
-    result = webinar_email_service.process_scheduled_reminders()
+    result = await asyncio.to_thread(webinar_email_service.process_scheduled_reminders)
     return result
 
 @app.post("/api/webinars/{webinar_id}/send-thank-you")
@@ -7390,35 +7347,6 @@ async def send_test_reminder(
 
 # ==================== AFFILIATE MANAGEMENT ROUTES (PHASE 10) ====================
 
-# Helper function to generate unique affiliate code
-def generate_affiliate_code(first_name: str, last_name: str) -> str:
-    """Generate unique affiliate code"""
-    import random
-    import string
-    base = f"{first_name[:3]}{last_name[:3]}".upper()
-    suffix = ''.join(random.choices(string.digits, k=4))
-    code = f"{base}{suffix}"
-    
-    # Ensure uniqueness
-    while affiliates_collection.find_one({"affiliate_code": code}):
-        suffix = ''.join(random.choices(string.digits, k=4))
-        code = f"{base}{suffix}"
-    
-    return code
-
-# Helper function to generate short code for links
-def generate_short_code() -> str:
-    """Generate unique short code for affiliate links"""
-    import random
-    import string
-    code = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-    
-    # Ensure uniqueness
-    while affiliate_links_collection.find_one({"short_code": code}):
-        code = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-    
-    return code
-
 # Helper function to calculate commission
 def calculate_commission(program: dict, order_amount: float, affiliate_sales_count: int = 0) -> float:
     """Calculate commission based on program rules"""
@@ -7479,6 +7407,7 @@ async def create_affiliate_program(
     program_dict["updated_at"] = datetime.utcnow()
     
     affiliate_programs_collection.insert_one(program_dict)
+    affiliate_analytics.program_index.invalidate(current_user["id"])
     
     program_dict["_id"] = str(program_dict["_id"])
     program_dict["created_at"] = program_dict["created_at"].isoformat()
@@ -7554,6 +7483,9 @@ async def delete_affiliate_program(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Program not found")
     
+    affiliate_analytics.program_index.invalidate(current_user["id"])
+    affiliate_analytics.invalidate_leaderboards(current_user["id"])
+    
     return {"message": "Program deleted successfully"}
 
 # ==================== AFFILIATE ROUTES ====================
@@ -7580,7 +7512,7 @@ async def register_affiliate(registration: PublicAffiliateRegistrationRequest):
         raise HTTPException(status_code=400, detail="Affiliate already registered for this program")
     
     # Generate unique affiliate code
-    affiliate_code = generate_affiliate_code(registration.first_name, registration.last_name)
+    affiliate_code = id_generator.affiliate_code(registration.first_name, registration.last_name)
     
     # Determine initial status based on program settings
     approval_required = program.get("approval_required", True)
@@ -7614,34 +7546,34 @@ async def register_affiliate(registration: PublicAffiliateRegistrationRequest):
         {"$inc": {"total_affiliates": 1}}
     )
     
-    # Auto-create contact in CRM
+    # Auto-create (or update) the contact in CRM
     try:
-        contact_data = {
-            "id": str(uuid.uuid4()),
-            "user_id": program["user_id"],
-            "first_name": registration.first_name,
-            "last_name": registration.last_name,
-            "email": registration.email,
-            "phone": registration.phone,
-            "company": registration.company,
-            "source": "affiliate_registration",
-            "status": "lead",
-            "score": 0,
-            "custom_fields": {"affiliate_code": affiliate_code},
-            "tags": ["affiliate"],
-            "segments": [],
-            "last_contacted": None,
-            "engagement_count": 0,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        contacts_collection.insert_one(contact_data)
+        contact_id = await contact_ingestor.ingest(
+            program["user_id"],
+            registration.email,
+            fields={
+                field: value for field, value in {
+                    "first_name": registration.first_name,
+                    "last_name": registration.last_name,
+                    "phone": registration.phone,
+                    "company": registration.company
+                }.items() if value is not None
+            },
+            on_insert={
+                "last_name": None,
+                "phone": None,
+                "company": None,
+                "source": "affiliate_registration",
+                "last_contacted": None
+            },
+            tags=["affiliate"],
+            custom_fields={"affiliate_code": affiliate_code}
+        )
         
         # Update affiliate with contact_id
         affiliates_collection.update_one(
             {"id": affiliate_dict["id"]},
-            {"$set": {"contact_id": contact_data["id"]}}
+            {"$set": {"contact_id": contact_id}}
         )
     except Exception as e:
         print(f"Error creating contact: {e}")
@@ -7797,6 +7729,8 @@ async def approve_affiliate(
         }
     )
     
+    affiliate_analytics.invalidate_leaderboards(current_user["id"])
+    
     # TODO: Send approval email
     
     return {"message": "Affiliate approved successfully"}
@@ -7831,6 +7765,8 @@ async def reject_affiliate(
         }
     )
     
+    affiliate_analytics.invalidate_leaderboards(current_user["id"])
+    
     # TODO: Send rejection email
     
     return {"message": "Affiliate rejected"}
@@ -7871,7 +7807,7 @@ async def create_affiliate_link(
         return existing_link
     
     # Generate short code
-    short_code = generate_short_code()
+    short_code = id_generator.short_code()
     
     # Create link
     link_dict = link.dict()
@@ -8062,6 +7998,8 @@ async def create_affiliate_conversion(
         }
     )
     
+    affiliate_analytics.on_conversion(current_user["id"], conversion.program_id)
+    
     # Update click if provided
     if conversion.click_id:
         affiliate_clicks_collection.update_one(
@@ -8485,8 +8423,6 @@ async def get_affiliate_analytics_summary(
     current_user: dict = Depends(get_current_user)
 ):
     """Get affiliate program analytics summary"""
-    query = {}
-    
     if program_id:
         program = affiliate_programs_collection.find_one({
             "id": program_id,
@@ -8494,26 +8430,20 @@ async def get_affiliate_analytics_summary(
         })
         if not program:
             raise HTTPException(status_code=404, detail="Program not found")
-        query["program_id"] = program_id
-    else:
-        # Get all programs owned by user
-        user_programs = list(affiliate_programs_collection.find({"user_id": current_user["id"]}))
-        program_ids = [p["id"] for p in user_programs]
-        query["program_id"] = {"$in": program_ids}
     
-    # Get counts
-    total_affiliates = affiliates_collection.count_documents(query)
-    active_affiliates = affiliates_collection.count_documents({**query, "status": "approved"})
-    pending_affiliates = affiliates_collection.count_documents({**query, "status": "pending"})
+    # Counts per status and counter totals in one aggregation
+    summary = affiliate_analytics.summarize(affiliate_analytics.program_filter(current_user["id"], program_id))
+    status_counts = summary["status_counts"]
+    total_affiliates = sum(status_counts.values())
+    active_affiliates = status_counts.get("approved", 0)
+    pending_affiliates = status_counts.get("pending", 0)
     
-    # Get totals
-    affiliates_list = list(affiliates_collection.find(query))
-    total_clicks = sum(a.get("total_clicks", 0) for a in affiliates_list)
-    total_conversions = sum(a.get("total_conversions", 0) for a in affiliates_list)
-    total_revenue = sum(a.get("total_revenue", 0.0) for a in affiliates_list)
-    total_commissions = sum(a.get("total_commissions", 0.0) for a in affiliates_list)
-    pending_commissions = sum(a.get("pending_commissions", 0.0) for a in affiliates_list)
-    paid_commissions = sum(a.get("paid_commissions", 0.0) for a in affiliates_list)
+    total_clicks = summary["total_clicks"]
+    total_conversions = summary["total_conversions"]
+    total_revenue = summary["total_revenue"]
+    total_commissions = summary["total_commissions"]
+    pending_commissions = summary["pending_commissions"]
+    paid_commissions = summary["paid_commissions"]
     
     # Calculate rates
     conversion_rate = (total_conversions / total_clicks * 100) if total_clicks > 0 else 0
@@ -8540,8 +8470,6 @@ async def get_affiliate_leaderboard(
     current_user: dict = Depends(get_current_user)
 ):
     """Get affiliate leaderboard"""
-    query = {}
-    
     if program_id:
         program = affiliate_programs_collection.find_one({
             "id": program_id,
@@ -8549,30 +8477,9 @@ async def get_affiliate_leaderboard(
         })
         if not program:
             raise HTTPException(status_code=404, detail="Program not found")
-        query["program_id"] = program_id
-    else:
-        # Get all programs owned by user
-        user_programs = list(affiliate_programs_collection.find({"user_id": current_user["id"]}))
-        program_ids = [p["id"] for p in user_programs]
-        query["program_id"] = {"$in": program_ids}
-    
-    query["status"] = "approved"
-    
-    # Get top affiliates by revenue
-    affiliates = list(affiliates_collection.find(query).sort("total_revenue", -1).limit(limit))
     
-    leaderboard = []
-    for i, affiliate in enumerate(affiliates, 1):
-        leaderboard.append({
-            "rank": i,
-            "affiliate_id": affiliate["id"],
-            "name": f"{affiliate['first_name']} {affiliate['last_name']}",
-            "email": affiliate["email"],
-            "total_clicks": affiliate.get("total_clicks", 0),
-            "total_conversions": affiliate.get("total_conversions", 0),
-            "total_revenue": round(affiliate.get("total_revenue", 0.0), 2),
-            "total_commissions": round(affiliate.get("total_commissions", 0.0), 2)
-        })
+    # Top affiliates by revenue, served from the leaderboard snapshot
+    leaderboard = affiliate_analytics.get_leaderboard(current_user["id"], program_id, limit)
     
     return {"leaderboard": leaderboard}
 
@@ -8633,59 +8540,6 @@ async def get_affiliate_performance(
 # PHASE 11: PAYMENT & E-COMMERCE ENDPOINTS
 # ============================================
 
-# Helper functions for Phase 11
-def generate_order_number():
-    """Generate unique order number"""
-    timestamp = datetime.utcnow().strftime('%Y%m%d')
-    random_suffix = ''.join([str(uuid.uuid4().int)[-6:]])
-    return f"ORD-{timestamp}-{random_suffix}"
-
-def generate_invoice_number():
-    """Generate unique invoice number"""
-    timestamp = datetime.utcnow().strftime('%Y%m%d')
-    random_suffix = ''.join([str(uuid.uuid4().int)[-6:]])
-    return f"INV-{timestamp}-{random_suffix}"
-
-def calculate_cart_totals(items: List[CartItem], coupon_code: Optional[str] = None, user_id: str = None):
-    """Calculate cart subtotal, tax, discount, and total"""
-    subtotal = sum(item.price * item.quantity for item in items)
-    tax = subtotal * 0.1  # 10% tax (configurable)
-    discount = 0
-    
-    # Apply coupon if provided
-    if coupon_code and user_id:
-        coupon = coupons_collection.find_one({
-            "code": coupon_code,
-            "user_id": user_id,
-            "status": "active"
-        })
-        
-        if coupon:
-            # Check if expired
-            if coupon.get("expires_at") and coupon["expires_at"] < datetime.utcnow():
-                pass  # Expired, no discount
-            else:
-                # Calculate discount
-                if coupon["discount_type"] == "percentage":
-                    discount = subtotal * (coupon["discount_value"] / 100)
-                    if coupon.get("maximum_discount"):
-                        discount = min(discount, coupon["maximum_discount"])
-                else:  # fixed
-                    discount = coupon["discount_value"]
-                
-                # Check minimum purchase
-                if coupon.get("minimum_purchase") and subtotal < coupon["minimum_purchase"]:
-                    discount = 0
-    
-    total = subtotal + tax - discount
-    
-    return {
-        "subtotal": round(subtotal, 2),
-        "tax": round(tax, 2),
-        "discount": round(discount, 2),
-        "total": round(total, 2)
-    }
-
 # ==================== PRODUCT CATEGORY ENDPOINTS ====================
 
 @app.get("/api/product-categories")
@@ -9016,12 +8870,6 @@ async def add_to_cart(
     current_user: dict = Depends(get_current_user)
 ):
     """Add item to cart"""
-    # Get product
-    product = products_collection.find_one({"id": product_id, "status": "active"})
-    
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
     # Get cart
     cart = shopping_carts_collection.find_one({"user_id": current_user["id"]})
     
@@ -9033,18 +8881,15 @@ async def add_to_cart(
             "created_at": datetime.utcnow()
         }
     
-    # Create cart item
+    # Create cart item (priced from the catalog below)
     cart_item = {
         "product_id": product_id,
         "variant_id": variant_id,
-        "quantity": quantity,
-        "price": product["price"],
-        "product_name": product["name"],
-        "product_image": product.get("featured_image")
+        "quantity": quantity
     }
     
     # Check if item already in cart
-    items = cart.get("items", [])
+    items = [dict(item) for item in cart.get("items", [])]
     existing_item = None
     for i, item in enumerate(items):
         if item["product_id"] == product_id and item.get("variant_id") == variant_id:
@@ -9058,16 +8903,16 @@ async def add_to_cart(
         # Add new item
         items.append(cart_item)
     
-    # Recalculate totals
-    totals = calculate_cart_totals(
-        [CartItem(**item) for item in items],
-        cart.get("coupon_code"),
-        product.get("user_id")
-    )
+    # Price every item and recalculate totals in one pass
+    priced = price_cart(items, cart.get("coupon_code"))
+    product = priced.products.get(product_id)
+    
+    if not product or product.get("status") != "active":
+        raise HTTPException(status_code=404, detail="Product not found")
     
     # Update cart
-    cart["items"] = items
-    cart.update(totals)
+    cart["items"] = priced.items
+    cart.update(priced.totals)
     cart["updated_at"] = datetime.utcnow()
     
     shopping_carts_collection.update_one(
@@ -9103,19 +8948,11 @@ async def update_cart_item(
             break
     
     # Recalculate totals
-    if items:
-        product = products_collection.find_one({"id": items[0]["product_id"]})
-        totals = calculate_cart_totals(
-            [CartItem(**item) for item in items],
-            cart.get("coupon_code"),
-            product.get("user_id") if product else None
-        )
-    else:
-        totals = {"subtotal": 0, "tax": 0, "discount": 0, "total": 0}
+    priced = price_cart(items, cart.get("coupon_code"))
     
     # Update cart
-    cart["items"] = items
-    cart.update(totals)
+    cart["items"] = priced.items
+    cart.update(priced.totals)
     cart["updated_at"] = datetime.utcnow()
     
     shopping_carts_collection.update_one(
@@ -9145,19 +8982,11 @@ async def remove_from_cart(
     )]
     
     # Recalculate totals
-    if items:
-        product = products_collection.find_one({"id": items[0]["product_id"]})
-        totals = calculate_cart_totals(
-            [CartItem(**item) for item in items],
-            cart.get("coupon_code"),
-            product.get("user_id") if product else None
-        )
-    else:
-        totals = {"subtotal": 0, "tax": 0, "discount": 0, "total": 0}
+    priced = price_cart(items, cart.get("coupon_code"))
     
     # Update cart
-    cart["items"] = items
-    cart.update(totals)
+    cart["items"] = priced.items
+    cart.update(priced.totals)
     cart["updated_at"] = datetime.utcnow()
     
     shopping_carts_collection.update_one(
@@ -9178,25 +9007,19 @@ async def apply_coupon(
     if not cart or not cart.get("items"):
         raise HTTPException(status_code=400, detail="Cart is empty")
     
-    # Get product owner (assuming all items from same store)
-    product = products_collection.find_one({"id": cart["items"][0]["product_id"]})
+    # Recalculate with coupon
+    priced = price_cart(cart["items"], coupon_code)
     
-    if not product:
+    if not priced.items:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Recalculate with coupon
-    totals = calculate_cart_totals(
-        [CartItem(**item) for item in cart["items"]],
-        coupon_code,
-        product["user_id"]
-    )
-    
-    if totals["discount"] == 0:
+    if priced.totals["discount"] == 0:
         raise HTTPException(status_code=400, detail="Invalid or expired coupon")
     
     # Update cart
     cart["coupon_code"] = coupon_code
-    cart.update(totals)
+    cart["items"] = priced.items
+    cart.update(priced.totals)
     cart["updated_at"] = datetime.utcnow()
     
     shopping_carts_collection.update_one(
@@ -9259,6 +9082,7 @@ async def create_coupon(
     coupon_data["updated_at"] = datetime.utcnow()
     
     coupons_collection.insert_one(coupon_data)
+    coupon_cache.invalidate(current_user["id"])
     
     return {"message": "Coupon created successfully", "coupon": coupon_data}
 
@@ -9284,6 +9108,7 @@ async def update_coupon(
         {"id": coupon_id},
         {"$set": update_data}
     )
+    coupon_cache.invalidate(current_user["id"])
     
     return {"message": "Coupon updated successfully"}
 
@@ -9301,6 +9126,8 @@ async def delete_coupon(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Coupon not found")
     
+    coupon_cache.invalidate(current_user["id"])
+    
     return {"message": "Coupon deleted successfully"}
 
 # ==================== CHECKOUT & ORDER ENDPOINTS ====================
@@ -9314,21 +9141,19 @@ async def process_checkout(
     if not checkout.items:
         raise HTTPException(status_code=400, detail="Cart is empty")
     
-    # Get product owner (assuming all items from same store)
-    product = products_collection.find_one({"id": checkout.items[0].product_id})
+    # Price every item from the catalog (never trust client-sent prices)
+    priced = price_cart([item.dict() for item in checkout.items], checkout.coupon_code)
     
-    if not product:
+    if priced.missing:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    store_owner_id = product["user_id"]
-    
-    # Calculate totals
-    totals = calculate_cart_totals(checkout.items, checkout.coupon_code, store_owner_id)
+    store_owner_id = priced.store_owner_id
+    totals = priced.totals
     
     # Create order
     order_data = {
         "id": str(uuid.uuid4()),
-        "order_number": generate_order_number(),
+        "order_number": id_generator.order_number(),
         "user_id": store_owner_id,
         "customer_id": current_user.get("id"),
         "customer_name": checkout.customer_name,
@@ -9383,45 +9208,32 @@ async def process_checkout(
         "paid_at": datetime.utcnow() if checkout.payment_method == "mock" else None
     }
     
-    # Create order items
+    # Pre-resolve every document the order writes
+    now = datetime.utcnow()
     order_items = []
-    for item in checkout.items:
-        order_item = {
+    product_stats = {}
+    for item in priced.items:
+        line_total = item["price"] * item["quantity"]
+        order_items.append({
             "id": str(uuid.uuid4()),
             "order_id": order_data["id"],
-            "product_id": item.product_id,
-            "product_name": item.product_name,
-            "variant_id": item.variant_id,
-            "quantity": item.quantity,
-            "price": item.price,
-            "subtotal": item.price * item.quantity,
+            "product_id": item["product_id"],
+            "product_name": item["product_name"],
+            "variant_id": item.get("variant_id"),
+            "quantity": item["quantity"],
+            "price": item["price"],
+            "subtotal": line_total,
             "tax": 0,
-            "total": item.price * item.quantity,
+            "total": line_total,
             "product_type": "physical",
-            "created_at": datetime.utcnow()
-        }
-        order_items.append(order_item)
-        
-        # Update product stats
-        products_collection.update_one(
-            {"id": item.product_id},
-            {
-                "$inc": {
-                    "sales_count": item.quantity,
-                    "revenue": item.price * item.quantity
-                }
-            }
-        )
+            "created_at": now
+        })
+        stats = product_stats.setdefault(item["product_id"], {"sales_count": 0, "revenue": 0})
+        stats["sales_count"] += item["quantity"]
+        stats["revenue"] += line_total
     
     order_data["items"] = order_items
     
-    # Insert order
-    orders_collection.insert_one(order_data)
-    
-    # Insert order items
-    for order_item in order_items:
-        order_items_collection.insert_one(order_item)
-    
     # Create payment transaction
     transaction_data = {
         "id": str(uuid.uuid4()),
@@ -9433,74 +9245,16 @@ async def process_checkout(
         "payment_method": checkout.payment_method,
         "payment_provider": checkout.payment_method,
         "status": "completed" if checkout.payment_method == "mock" else "pending",
-        "transaction_id": f"TXN-{str(uuid.uuid4())[:8]}",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
-        "completed_at": datetime.utcnow() if checkout.payment_method == "mock" else None
+        "transaction_id": id_generator.transaction_id(),
+        "created_at": now,
+        "updated_at": now,
+        "completed_at": now if checkout.payment_method == "mock" else None
     }
     
-    payment_transactions_collection.insert_one(transaction_data)
-    
-    # Create or update contact in CRM
-    contact = contacts_collection.find_one({
-        "email": checkout.customer_email,
-        "user_id": store_owner_id
-    })
-    
-    if not contact:
-        contact_data = {
-            "id": str(uuid.uuid4()),
-            "user_id": store_owner_id,
-            "email": checkout.customer_email,
-            "first_name": checkout.customer_name.split()[0] if checkout.customer_name else "",
-            "last_name": " ".join(checkout.customer_name.split()[1:]) if len(checkout.customer_name.split()) > 1 else "",
-            "phone": checkout.customer_phone,
-            "company": "",
-            "address": checkout.billing_address.get("line1", ""),
-            "city": checkout.billing_address.get("city", ""),
-            "state": checkout.billing_address.get("state", ""),
-            "country": checkout.billing_address.get("country", "US"),
-            "postal_code": checkout.billing_address.get("postal_code", ""),
-            "tags": ["customer"],
-            "status": "customer",
-            "source": "order",
-            "score": 80,
-            "last_contact_date": datetime.utcnow(),
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        contacts_collection.insert_one(contact_data)
-        order_data["contact_id"] = contact_data["id"]
-        orders_collection.update_one(
-            {"id": order_data["id"]},
-            {"$set": {"contact_id": contact_data["id"]}}
-        )
-    else:
-        # Update existing contact
-        contacts_collection.update_one(
-            {"id": contact["id"]},
-            {
-                "$set": {
-                    "status": "customer",
-                    "last_contact_date": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                },
-                "$addToSet": {"tags": "customer"}
-            }
-        )
-        order_data["contact_id"] = contact["id"]
-        orders_collection.update_one(
-            {"id": order_data["id"]},
-            {"$set": {"contact_id": contact["id"]}}
-        )
-    
-    # Clear cart
-    shopping_carts_collection.delete_one({"user_id": current_user["id"]})
-    
     # Generate invoice
     invoice_data = {
         "id": str(uuid.uuid4()),
-        "invoice_number": generate_invoice_number(),
+        "invoice_number": id_generator.invoice_number(),
         "user_id": store_owner_id,
         "order_id": order_data["id"],
         "customer_name": checkout.customer_name,
@@ -9526,7 +9280,48 @@ async def process_checkout(
         "paid_at": datetime.utcnow() if checkout.payment_method == "mock" else None
     }
     
-    invoices_collection.insert_one(invoice_data)
+    # Create or update contact in CRM
+    name_parts = checkout.customer_name.split() if checkout.customer_name else []
+    contact_insert = {
+        "first_name": name_parts[0] if name_parts else "",
+        "last_name": " ".join(name_parts[1:]),
+        "phone": checkout.customer_phone,
+        "company": "",
+        "address": checkout.billing_address.get("line1", ""),
+        "city": checkout.billing_address.get("city", ""),
+        "state": checkout.billing_address.get("state", ""),
+        "country": checkout.billing_address.get("country", "US"),
+        "postal_code": checkout.billing_address.get("postal_code", ""),
+        "source": "order",
+        "score": 80,
+        "created_at": now
+    }
+    
+    def write_order(session):
+        # Upsert the contact first so the order is inserted with its contact_id
+        order_data["contact_id"] = upsert_contact(
+            store_owner_id,
+            checkout.customer_email,
+            session=session,
+            fields={"status": "customer", "last_contact_date": now},
+            tags=["customer"],
+            on_insert=contact_insert
+        )
+        
+        orders_collection.insert_one(dict(order_data), session=session)
+        order_items_collection.insert_many([dict(item) for item in order_items], session=session)
+        products_collection.bulk_write([
+            UpdateOne({"id": product_id}, {"$inc": stats})
+            for product_id, stats in product_stats.items()
+        ], ordered=False, session=session)
+        payment_transactions_collection.insert_one(dict(transaction_data), session=session)
+        invoices_collection.insert_one(dict(invoice_data), session=session)
+        
+        # Clear cart
+        shopping_carts_collection.delete_one({"user_id": current_user["id"]}, session=session)
+    
+    # Write the order, its items, counters, payment, invoice and contact atomically
+    run_transaction(write_order)
     
     return {
         "message": "Order placed successfully",
@@ -9858,36 +9653,65 @@ async def get_invoice(
 @app.get("/api/payment-analytics/summary")
 async def get_payment_analytics(current_user: dict = Depends(get_current_user)):
     """Get payment analytics summary"""
-    # Get all orders
-    all_orders = list(orders_collection.find({"user_id": current_user["id"]}))
+    user_id = current_user["id"]
+    paid_orders = {"user_id": user_id, "payment_status": "paid"}
     
-    # Calculate metrics
-    total_revenue = sum(order.get("total", 0) for order in all_orders if order.get("payment_status") == "paid")
-    total_orders = len([o for o in all_orders if o.get("payment_status") == "paid"])
+    # Revenue and paid order count
+    revenue = next(orders_collection.aggregate([
+        {"$match": paid_orders},
+        {"$group": {"_id": None, "total_revenue": {"$sum": "$total"}, "total_orders": {"$sum": 1}}}
+    ]), {"total_revenue": 0, "total_orders": 0})
+    
+    total_revenue = revenue["total_revenue"]
+    total_orders = revenue["total_orders"]
     average_order_value = total_revenue / total_orders if total_orders > 0 else 0
     
-    # Get subscriptions
-    all_subscriptions = list(subscriptions_collection.find({"user_id": current_user["id"]}))
-    active_subscriptions = len([s for s in all_subscriptions if s.get("status") == "active"])
+    # Subscriptions by status
+    subscription_counts = {
+        row["_id"]: row["count"]
+        for row in subscriptions_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ])
+    }
+    active_subscriptions = subscription_counts.get("active", 0)
     
     # Get products
-    total_products = products_collection.count_documents({"user_id": current_user["id"]})
+    total_products = products_collection.count_documents({"user_id": user_id})
     
     # Get unique customers
-    customer_emails = set(order.get("customer_email") for order in all_orders)
-    total_customers = len(customer_emails)
-    
-    # Revenue by period (last 12 months)
-    revenue_by_period = {}
-    for i in range(12):
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        month_orders = [o for o in all_orders if month_start <= o.get("created_at", datetime.min) < month_end and o.get("payment_status") == "paid"]
-        month_revenue = sum(o.get("total", 0) for o in month_orders)
-        revenue_by_period[month_start.strftime("%Y-%m")] = round(month_revenue, 2)
+    customers = next(orders_collection.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {"_id": "$customer_email"}},
+        {"$count": "total"}
+    ]), {"total": 0})
+    total_customers = customers["total"]
+    
+    # Revenue by calendar month (last 12 months, newest first)
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    months = []
+    year, month = month_start.year, month_start.month
+    for _ in range(12):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    
+    monthly_revenue = {
+        row["_id"]: row["revenue"]
+        for row in orders_collection.aggregate([
+            {"$match": {**paid_orders, "created_at": {"$gte": datetime.strptime(months[-1], "%Y-%m")}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                "revenue": {"$sum": "$total"}
+            }}
+        ])
+    }
+    revenue_by_period = {period: round(monthly_revenue.get(period, 0), 2) for period in months}
     
     # Top products
-    products = list(products_collection.find({"user_id": current_user["id"]}).sort("sales_count", -1).limit(5))
+    products = list(products_collection.find(
+        {"user_id": user_id},
+        {"_id": 0, "id": 1, "name": 1, "sales_count": 1, "revenue": 1}
+    ).sort("sales_count", -1).limit(5))
     top_products = [
         {
             "id": p["id"],
@@ -9899,7 +9723,10 @@ async def get_payment_analytics(current_user: dict = Depends(get_current_user)):
     ]
     
     # Recent orders
-    recent = list(orders_collection.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(10))
+    recent = list(orders_collection.find(
+        {"user_id": user_id},
+        {"_id": 0, "id": 1, "order_number": 1, "customer_name": 1, "total": 1, "status": 1, "created_at": 1}
+    ).sort("created_at", -1).limit(10))
     recent_orders = [
         {
             "id": o["id"],
@@ -9915,7 +9742,7 @@ async def get_payment_analytics(current_user: dict = Depends(get_current_user)):
     return {
         "total_revenue": round(total_revenue, 2),
         "total_orders": total_orders,
-        "total_subscriptions": len(all_subscriptions),
+        "total_subscriptions": sum(subscription_counts.values()),
         "active_subscriptions": active_subscriptions,
         "average_order_value": round(average_order_value, 2),
         "total_products": total_products,
@@ -10034,7 +9861,7 @@ async def get_analytics_dashboard_overview(
             **user_filter,
             "status": "published"
         })
-        blog_views = await blog_post_views_collection.count_documents(combined_filter)
+        blog_views = count_views('blog_post', combined_filter)
         blog_comments = await blog_comments_collection.count_documents(combined_filter)
         
         # === AFFILIATE PROGRAM ===
@@ -10404,7 +10231,7 @@ async def get_engagement_metrics(
         total_clicked = len([log for log in email_logs if log.get("clicked", False)])
         
         # Content engagement
-        blog_views = await blog_post_views_collection.count_documents(combined_filter)
+        blog_views = count_views('blog_post', combined_filter)
         blog_comments = await blog_comments_collection.count_documents(combined_filter)
         
         # Course engagement
@@ -10525,25 +10352,62 @@ async def export_analytics_report(
 
 # ==================== PHASE 12: ADVANCED AI FEATURES ====================
 
+def get_ai_helper(
+    use_cache: bool = Query(True),
+    regenerate: bool = Query(False),
+    current_user: dict = Depends(get_current_user)
+) -> AIHelper:
+    """AI helper honouring the ?use_cache= and ?regenerate= flags, charged to the current user"""
+    return AIHelper(use_cache=use_cache, regenerate=regenerate, tenant_id=current_user['id'])
+
+@app.exception_handler(AIError)
+async def ai_error_handler(request: Request, error: AIError):
+    """Map a typed AI failure to its HTTP status (429, 502, 503 or 504)"""
+    headers = {"Retry-After": str(max(1, round(error.retry_after)))} if error.retry_after else None
+    return JSONResponse(status_code=error.status_code, content={"detail": str(error)}, headers=headers)
+
+async def ai_sse_events(ai_helper: AIHelper, prompt: str, system_message: str, parser=None, build_result=None):
+    """
+    Relay an AI generation as Server-Sent Events
+    
+    Emits a `token` event per chunk, a `section` event per parsed section line
+    (when a parser is given), then `done` with the full result, or `error`.
+    """
+    chunks = []
+    try:
+        async for chunk in ai_helper.stream_text(prompt, system_message):
+            chunks.append(chunk)
+            yield format_sse({"text": chunk}, event="token")
+            if parser:
+                for section, text in parser.feed(chunk):
+                    yield format_sse({"section": section, "text": text}, event="section")
+        
+        if parser:
+            for section, text in parser.close():
+                yield format_sse({"section": section, "text": text}, event="section")
+        
+        content = "".join(chunks)
+        yield format_sse(build_result(content) if build_result else {"content": content}, event="done")
+    except AIError as e:
+        yield format_sse({"status": e.status_code, "detail": str(e), "retry_after": e.retry_after}, event="error")
+    except Exception as e:
+        yield format_sse({"status": 500, "detail": f"Generation failed: {str(e)}"}, event="error")
+
 @app.post("/api/ai/generate/headline")
 async def generate_headline_ai(
     topic: str = Query(...),
     style: str = Query("attention-grabbing"),
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate multiple headline options using AI"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        headlines = await ai_helper.generate_headline(topic, style)
-        
-        return {
-            "topic": topic,
-            "style": style,
-            "headlines": headlines
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate headlines: {str(e)}")
+    headlines = await ai_helper.generate_headline(topic, style)
+    
+    return {
+        "topic": topic,
+        "style": style,
+        "headlines": headlines
+    }
 
 
 @app.post("/api/ai/generate/landing-page")
@@ -10551,241 +10415,218 @@ async def generate_landing_page_copy(
     product: str = Query(...),
     target_audience: str = Query(...),
     benefits: str = Query(...),  # Comma-separated
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate complete landing page copy"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        benefits_list = [b.strip() for b in benefits.split(',')]
-        result = await ai_helper.generate_landing_page_copy(product, target_audience, benefits_list)
-        
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate landing page copy: {str(e)}")
+    benefits_list = [b.strip() for b in benefits.split(',')]
+    result = await ai_helper.generate_landing_page_copy(product, target_audience, benefits_list)
+    
+    return result
+
+
+@app.post("/api/ai/generate/landing-page/stream")
+async def stream_landing_page_copy(
+    product: str = Query(...),
+    target_audience: str = Query(...),
+    benefits: str = Query(...),  # Comma-separated
+    ai_helper: AIHelper = Depends(get_ai_helper),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream landing page copy as Server-Sent Events, section by section"""
+    benefits_list = [b.strip() for b in benefits.split(',')]
+    prompt, system_message = ai_helper.landing_page_prompt(product, target_audience, benefits_list)
+    parser = ai_helper.landing_page_parser()
+    
+    return sse_response(ai_sse_events(
+        ai_helper, prompt, system_message,
+        parser=parser,
+        build_result=lambda content: parser.result
+    ))
 
 
 @app.post("/api/ai/generate/social-posts")
 async def generate_social_posts(
     topic: str = Query(...),
     platforms: str = Query("twitter,facebook,linkedin"),  # Comma-separated
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate social media posts for multiple platforms"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        platforms_list = [p.strip() for p in platforms.split(',')]
-        posts = await ai_helper.generate_social_media_posts(topic, platforms_list)
-        
-        return {
-            "topic": topic,
-            "posts": posts
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate social posts: {str(e)}")
+    platforms_list = [p.strip() for p in platforms.split(',')]
+    posts = await ai_helper.generate_social_media_posts(topic, platforms_list)
+    
+    return {
+        "topic": topic,
+        "posts": posts
+    }
 
 
 @app.post("/api/ai/generate/webinar-outline")
 async def generate_webinar_outline(
     topic: str = Query(...),
     duration: int = Query(60),
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate webinar outline with structure"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        outline = await ai_helper.generate_webinar_outline(topic, duration)
-        
-        return outline
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate webinar outline: {str(e)}")
+    outline = await ai_helper.generate_webinar_outline(topic, duration)
+    
+    return outline
 
 
 @app.post("/api/ai/generate/course-curriculum")
 async def generate_course_curriculum(
     title: str = Query(...),
     level: str = Query("beginner"),
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate course curriculum structure"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        curriculum = await ai_helper.generate_course_curriculum(title, level)
-        
-        return curriculum
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate curriculum: {str(e)}")
+    curriculum = await ai_helper.generate_course_curriculum(title, level)
+    
+    return curriculum
+
+
+@app.post("/api/ai/generate/course-curriculum/stream")
+async def stream_course_curriculum(
+    title: str = Query(...),
+    level: str = Query("beginner"),
+    ai_helper: AIHelper = Depends(get_ai_helper),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream a course curriculum as Server-Sent Events"""
+    prompt, system_message = ai_helper.course_curriculum_prompt(title, level)
+    
+    return sse_response(ai_sse_events(
+        ai_helper, prompt, system_message,
+        build_result=lambda content: {"title": title, "level": level, "curriculum": content}
+    ))
 
 
 @app.post("/api/ai/improve/text")
 async def improve_text_ai(
     text: str = Query(...),
     improvement_type: str = Query("grammar"),
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Improve existing text with AI"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        improved = await ai_helper.improve_text(text, improvement_type)
-        
-        return {
-            "original": text,
-            "improved": improved,
-            "improvement_type": improvement_type
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to improve text: {str(e)}")
+    improved = await ai_helper.improve_text(text, improvement_type)
+    
+    return {
+        "original": text,
+        "improved": improved,
+        "improvement_type": improvement_type
+    }
 
 
 @app.post("/api/ai/analyze/sentiment")
 async def analyze_sentiment(
     text: str = Query(...),
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Analyze text sentiment and tone"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        analysis = await ai_helper.analyze_text_sentiment(text)
-        
-        return {
-            "text": text[:100] + "..." if len(text) > 100 else text,
-            "analysis": analysis
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to analyze sentiment: {str(e)}")
+    analysis = await ai_helper.analyze_text_sentiment(text)
+    
+    return {
+        "text": text[:100] + "..." if len(text) > 100 else text,
+        "analysis": analysis
+    }
 
 
 @app.post("/api/ai/generate/product-description")
 async def generate_product_description_ai(
     product_name: str = Query(...),
     features: str = Query(""),  # Comma-separated
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate product description with AI"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        features_list = [f.strip() for f in features.split(',')] if features else []
-        description = await ai_helper.generate_product_description(product_name, features_list)
-        
-        return {
-            "product_name": product_name,
-            "description": description
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate product description: {str(e)}")
+    features_list = [f.strip() for f in features.split(',')] if features else []
+    description = await ai_helper.generate_product_description(product_name, features_list)
+    
+    return {
+        "product_name": product_name,
+        "description": description
+    }
 
 
 @app.post("/api/ai/generate/blog-post")
 async def generate_blog_post_ai(
     title: str = Query(...),
     keywords: str = Query(""),  # Comma-separated
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate blog post content with AI"""
-    try:
-        from ai_helper import AIHelper
-        ai_helper = AIHelper()
-        
-        keywords_list = [k.strip() for k in keywords.split(',')] if keywords else []
-        content = await ai_helper.generate_blog_post(title, keywords_list)
-        
-        return {
-            "title": title,
-            "content": content,
-            "keywords": keywords_list
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate blog post: {str(e)}")
-        # Write headers and data
-        writer.writerow(['Metric Category', 'Metric', 'Value'])
-        
-        # Revenue
-        writer.writerow(['Revenue', 'Total Revenue', f"${overview_data['total_revenue']}"])
-        writer.writerow(['Revenue', 'Revenue Growth', f"{overview_data['revenue_growth']}%"])
-        
-        # Contacts
-        writer.writerow(['Contacts', 'Total Contacts', overview_data['total_contacts']])
-        writer.writerow(['Contacts', 'New Contacts', overview_data['new_contacts']])
-        writer.writerow(['Contacts', 'Active Contacts', overview_data['active_contacts']])
-        
-        # Email Marketing
-        email = overview_data['email_marketing']
-        writer.writerow(['Email', 'Total Campaigns', email['total_campaigns']])
-        writer.writerow(['Email', 'Emails Sent', email['total_emails_sent']])
-        writer.writerow(['Email', 'Open Rate', f"{email['open_rate']}%"])
-        writer.writerow(['Email', 'Click Rate', f"{email['click_rate']}%"])
-        
-        # Funnels
-        funnels = overview_data['funnels']
-        writer.writerow(['Funnels', 'Total Funnels', funnels['total_funnels']])
-        writer.writerow(['Funnels', 'Total Visits', funnels['total_visits']])
-        writer.writerow(['Funnels', 'Conversions', funnels['conversions']])
-        writer.writerow(['Funnels', 'Conversion Rate', f"{funnels['conversion_rate']}%"])
-        
-        # E-commerce
-        ecommerce = overview_data['ecommerce']
-        writer.writerow(['E-commerce', 'Total Orders', ecommerce['total_orders']])
-        writer.writerow(['E-commerce', 'Completed Orders', ecommerce['completed_orders']])
-        writer.writerow(['E-commerce', 'Average Order Value', f"${ecommerce['average_order_value']}"])
-        
-        output.seek(0)
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=analytics_report_{datetime.utcnow().strftime('%Y%m%d')}.csv"}
-        )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to export report: {str(e)}")
+    keywords_list = [k.strip() for k in keywords.split(',')] if keywords else []
+    content = await ai_helper.generate_blog_post(title, keywords_list)
+    
+    return {
+        "title": title,
+        "content": content,
+        "keywords": keywords_list
+    }
+
 
+@app.post("/api/ai/generate/blog-post/stream")
+async def stream_blog_post_ai(
+    title: str = Query(...),
+    keywords: str = Query(""),  # Comma-separated
+    ai_helper: AIHelper = Depends(get_ai_helper),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream blog post content as Server-Sent Events"""
+    keywords_list = [k.strip() for k in keywords.split(',')] if keywords else []
+    prompt, system_message = ai_helper.blog_post_prompt(title, keywords_list)
+    
+    return sse_response(ai_sse_events(
+        ai_helper, prompt, system_message,
+        build_result=lambda content: {"title": title, "content": content, "keywords": keywords_list}
+    ))
 
 
-# ==================== TEMPLATE MANAGEMENT ROUTES ====================
+@app.get("/api/ai/metrics")
+async def get_ai_metrics(current_user: dict = Depends(get_current_user)):
+    """AI admission-control load and counters for this worker"""
+    return ai_admission.snapshot()
 
-from template_library import get_templates_by_module, get_all_templates
-from ai_helper import AIHelper
+
+# ==================== TEMPLATE MANAGEMENT ROUTES ====================
 
 @app.get("/api/templates")
-async def get_all_available_templates(current_user: dict = Depends(get_current_user)):
+async def get_all_available_templates(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
     """Get all available templates across all modules"""
-    return get_all_templates()
+    return template_registry.get('templates').respond(request)
 
 @app.get("/api/templates/{module}")
 async def get_module_templates(
     module: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get templates for a specific module"""
-    templates = get_templates_by_module(module)
-    return {"module": module, "templates": templates}
+    return template_registry.get_module_templates(module).respond(request)
 
 @app.get("/api/templates/{module}/{template_id}")
 async def get_template_details(
     module: str,
     template_id: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get detailed information about a specific template"""
-    templates = get_templates_by_module(module)
-    template = next((t for t in templates if t.get('id') == template_id), None)
+    payload = template_registry.get_template(module, template_id)
     
-    if not template:
+    if not payload:
         raise HTTPException(status_code=404, detail="Template not found")
     
-    return template
+    return payload.respond(request)
 
 @app.delete("/api/templates/{module}/{template_id}")
 async def delete_template(
@@ -10814,6 +10655,7 @@ async def delete_funnel_template(
 @app.post("/api/ai/generate-content")
 async def ai_generate_content(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -10827,55 +10669,51 @@ async def ai_generate_content(
         "context": {...}
     }
     """
-    try:
-        ai_helper = AIHelper()
-        module = request.get('module', 'general')
-        content_type = request.get('content_type', 'text')
-        prompt = request.get('prompt', '')
-        context = request.get('context', {})
-        
-        if not prompt:
-            raise HTTPException(status_code=400, detail="Prompt is required")
-        
-        # Module-specific generation
-        if module == 'email' and content_type == 'full':
-            result = await ai_helper.generate_email_copy(prompt, context.get('tone', 'professional'))
-        elif module == 'blog':
-            result = await ai_helper.generate_blog_post(prompt, context.get('keywords', []))
-        elif module == 'course' and content_type == 'lesson':
-            result = await ai_helper.generate_course_lesson_content(
-                prompt, 
-                context.get('course_topic', ''),
-                context.get('lesson_number', 1)
-            )
-        elif module == 'funnel' and content_type == 'copy':
-            result = await ai_helper.generate_landing_page_copy(
-                prompt,
-                context.get('target_audience', 'general audience'),
-                context.get('benefits', [])
-            )
-        elif module == 'product' and content_type == 'description':
-            result = await ai_helper.generate_product_description(
-                prompt,
-                context.get('features', [])
-            )
-        else:
-            # General text generation
-            result = await ai_helper.generate_text(prompt)
-        
-        return {
-            "success": True,
-            "content": result,
-            "module": module,
-            "content_type": content_type
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
+    module = request.get('module', 'general')
+    content_type = request.get('content_type', 'text')
+    prompt = request.get('prompt', '')
+    context = request.get('context', {})
+    
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Prompt is required")
+    
+    # Module-specific generation
+    if module == 'email' and content_type == 'full':
+        result = await ai_helper.generate_email_copy(prompt, context.get('tone', 'professional'))
+    elif module == 'blog':
+        result = await ai_helper.generate_blog_post(prompt, context.get('keywords', []))
+    elif module == 'course' and content_type == 'lesson':
+        result = await ai_helper.generate_course_lesson_content(
+            prompt, 
+            context.get('course_topic', ''),
+            context.get('lesson_number', 1)
+        )
+    elif module == 'funnel' and content_type == 'copy':
+        result = await ai_helper.generate_landing_page_copy(
+            prompt,
+            context.get('target_audience', 'general audience'),
+            context.get('benefits', [])
+        )
+    elif module == 'product' and content_type == 'description':
+        result = await ai_helper.generate_product_description(
+            prompt,
+            context.get('features', [])
+        )
+    else:
+        # General text generation
+        result = await ai_helper.generate_text(prompt)
+    
+    return {
+        "success": True,
+        "content": result,
+        "module": module,
+        "content_type": content_type
+    }
 
 @app.post("/api/ai/improve-content")
 async def ai_improve_content(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -10888,32 +10726,28 @@ async def ai_improve_content(
         "target_keywords": [...] (optional, for SEO)
     }
     """
-    try:
-        ai_helper = AIHelper()
-        content = request.get('content', '')
-        improvement_type = request.get('improvement_type', 'grammar')
-        
-        if not content:
-            raise HTTPException(status_code=400, detail="Content is required")
-        
-        if improvement_type == 'seo':
-            target_keywords = request.get('target_keywords', [])
-            result = await ai_helper.improve_seo(content, target_keywords)
-        else:
-            result = await ai_helper.improve_text(content, improvement_type)
-        
-        return {
-            "success": True,
-            "improved_content": result,
-            "improvement_type": improvement_type
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Content improvement failed: {str(e)}")
+    content = request.get('content', '')
+    improvement_type = request.get('improvement_type', 'grammar')
+    
+    if not content:
+        raise HTTPException(status_code=400, detail="Content is required")
+    
+    if improvement_type == 'seo':
+        target_keywords = request.get('target_keywords', [])
+        result = await ai_helper.improve_seo(content, target_keywords)
+    else:
+        result = await ai_helper.improve_text(content, improvement_type)
+    
+    return {
+        "success": True,
+        "improved_content": result,
+        "improvement_type": improvement_type
+    }
 
 @app.post("/api/ai/smart-suggestions")
 async def ai_smart_suggestions(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -10925,164 +10759,135 @@ async def ai_smart_suggestions(
         "context": {...module-specific context}
     }
     """
-    try:
-        ai_helper = AIHelper()
-        module = request.get('module', '')
-        context = request.get('context', {})
-        
-        if not module:
-            raise HTTPException(status_code=400, detail="Module is required")
-        
-        suggestions = await ai_helper.generate_smart_suggestions(module, context)
-        
-        return {
-            "success": True,
-            "module": module,
-            "suggestions": suggestions
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Suggestion generation failed: {str(e)}")
+    module = request.get('module', '')
+    context = request.get('context', {})
+    
+    if not module:
+        raise HTTPException(status_code=400, detail="Module is required")
+    
+    suggestions = await ai_helper.generate_smart_suggestions(module, context)
+    
+    return {
+        "success": True,
+        "module": module,
+        "suggestions": suggestions
+    }
 
 @app.post("/api/ai/generate-headlines")
 async def ai_generate_headlines(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate multiple headline options"""
-    try:
-        ai_helper = AIHelper()
-        topic = request.get('topic', '')
-        style = request.get('style', 'attention-grabbing')
-        
-        if not topic:
-            raise HTTPException(status_code=400, detail="Topic is required")
-        
-        headlines = await ai_helper.generate_headline(topic, style)
-        
-        return {
-            "success": True,
-            "headlines": headlines
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Headline generation failed: {str(e)}")
+    topic = request.get('topic', '')
+    style = request.get('style', 'attention-grabbing')
+    
+    if not topic:
+        raise HTTPException(status_code=400, detail="Topic is required")
+    
+    headlines = await ai_helper.generate_headline(topic, style)
+    
+    return {
+        "success": True,
+        "headlines": headlines
+    }
 
 @app.post("/api/ai/generate-form-fields")
 async def ai_generate_form_fields(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate form fields using AI"""
-    try:
-        ai_helper = AIHelper()
-        form_purpose = request.get('form_purpose', 'contact')
-        target_audience = request.get('target_audience', 'general')
-        
-        fields = await ai_helper.generate_form_fields(form_purpose, target_audience)
-        
-        return {
-            "success": True,
-            "fields": fields
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Form field generation failed: {str(e)}")
+    form_purpose = request.get('form_purpose', 'contact')
+    target_audience = request.get('target_audience', 'general')
+    
+    fields = await ai_helper.generate_form_fields(form_purpose, target_audience)
+    
+    return {
+        "success": True,
+        "fields": fields
+    }
 
 @app.post("/api/ai/generate-survey-questions")
 async def ai_generate_survey_questions(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate survey questions using AI"""
-    try:
-        ai_helper = AIHelper()
-        survey_topic = request.get('survey_topic', '')
-        num_questions = request.get('num_questions', 10)
-        
-        if not survey_topic:
-            raise HTTPException(status_code=400, detail="Survey topic is required")
-        
-        questions = await ai_helper.generate_survey_questions(survey_topic, num_questions)
-        
-        return {
-            "success": True,
-            "questions": questions
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Survey question generation failed: {str(e)}")
+    survey_topic = request.get('survey_topic', '')
+    num_questions = request.get('num_questions', 10)
+    
+    if not survey_topic:
+        raise HTTPException(status_code=400, detail="Survey topic is required")
+    
+    questions = await ai_helper.generate_survey_questions(survey_topic, num_questions)
+    
+    return {
+        "success": True,
+        "questions": questions
+    }
 
 @app.post("/api/ai/optimize-funnel-page")
 async def ai_optimize_funnel_page(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Optimize funnel page using AI"""
-    try:
-        ai_helper = AIHelper()
-        current_content = request.get('current_content', '')
-        page_purpose = request.get('page_purpose', 'landing')
-        
-        if not current_content:
-            raise HTTPException(status_code=400, detail="Current content is required")
-        
-        optimization = await ai_helper.optimize_funnel_page(current_content, page_purpose)
-        
-        return {
-            "success": True,
-            "optimization": optimization
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Page optimization failed: {str(e)}")
+    current_content = request.get('current_content', '')
+    page_purpose = request.get('page_purpose', 'landing')
+    
+    if not current_content:
+        raise HTTPException(status_code=400, detail="Current content is required")
+    
+    optimization = await ai_helper.optimize_funnel_page(current_content, page_purpose)
+    
+    return {
+        "success": True,
+        "optimization": optimization
+    }
 
 @app.post("/api/ai/generate-social-posts")
 async def ai_generate_social_posts(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate social media posts"""
-    try:
-        ai_helper = AIHelper()
-        topic = request.get('topic', '')
-        platforms = request.get('platforms', ['twitter', 'facebook', 'linkedin'])
-        
-        if not topic:
-            raise HTTPException(status_code=400, detail="Topic is required")
-        
-        posts = await ai_helper.generate_social_media_posts(topic, platforms)
-        
-        return {
-            "success": True,
-            "posts": posts
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Social post generation failed: {str(e)}")
+    topic = request.get('topic', '')
+    platforms = request.get('platforms', ['twitter', 'facebook', 'linkedin'])
+    
+    if not topic:
+        raise HTTPException(status_code=400, detail="Topic is required")
+    
+    posts = await ai_helper.generate_social_media_posts(topic, platforms)
+    
+    return {
+        "success": True,
+        "posts": posts
+    }
 
 @app.post("/api/ai/analyze-sentiment")
 async def ai_analyze_sentiment(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Analyze text sentiment"""
-    try:
-        ai_helper = AIHelper()
-        text = request.get('text', '')
-        
-        if not text:
-            raise HTTPException(status_code=400, detail="Text is required")
-        
-        analysis = await ai_helper.analyze_text_sentiment(text)
-        
-        return {
-            "success": True,
-            "analysis": analysis
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Sentiment analysis failed: {str(e)}")
+    text = request.get('text', '')
+    
+    if not text:
+        raise HTTPException(status_code=400, detail="Text is required")
+    
+    analysis = await ai_helper.analyze_text_sentiment(text)
+    
+    return {
+        "success": True,
+        "analysis": analysis
+    }
 
 
 # ==================== WEBSITE BUILDER AI ENDPOINTS ====================
@@ -11090,305 +10895,276 @@ async def ai_analyze_sentiment(
 @app.post("/api/website/ai/generate-complete-website")
 async def generate_complete_website_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate a complete website with AI"""
-    try:
-        ai_helper = AIHelper()
-        business_info = request.get('business_info', {})
-        
-        result = await ai_helper.generate_complete_website(business_info)
-        
-        return {
-            "success": True,
-            "website": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Website generation failed: {str(e)}")
+    business_info = request.get('business_info', {})
+    
+    result = await ai_helper.generate_complete_website(business_info)
+    
+    return {
+        "success": True,
+        "website": result
+    }
+
+
+@app.post("/api/website/ai/generate-complete-website/stream")
+async def stream_complete_website_ai(
+    request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream a complete website generation as Server-Sent Events, one `page` event per finished page"""
+    business_info = request.get('business_info', {})
+    
+    async def events():
+        pages = {}
+        try:
+            async for page, content in ai_helper.iter_website_pages(business_info):
+                pages[page] = content
+                yield format_sse({"page": page, "content": content}, event="page")
+            yield format_sse({
+                "success": True,
+                "website": ai_helper.website_result(business_info, pages)
+            }, event="done")
+        except AIError as e:
+            yield format_sse({"status": e.status_code, "detail": str(e), "retry_after": e.retry_after}, event="error")
+        except Exception as e:
+            yield format_sse({"status": 500, "detail": f"Website generation failed: {str(e)}"}, event="error")
+    
+    return sse_response(events())
 
 
 @app.post("/api/website/ai/generate-section")
 async def generate_website_section_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate a specific website section with AI"""
-    try:
-        ai_helper = AIHelper()
-        section_type = request.get('section_type', 'hero')
-        context = request.get('context', {})
-        
-        result = await ai_helper.generate_website_section(section_type, context)
-        
-        return {
-            "success": True,
-            "section": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Section generation failed: {str(e)}")
+    section_type = request.get('section_type', 'hero')
+    context = request.get('context', {})
+    
+    result = await ai_helper.generate_website_section(section_type, context)
+    
+    return {
+        "success": True,
+        "section": result
+    }
+
+
+@app.post("/api/website/ai/generate-sections")
+async def generate_website_sections_ai(
+    request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
+    current_user: dict = Depends(get_current_user)
+):
+    """Generate several website sections with AI, concurrently"""
+    section_types = request.get('section_types', ['hero'])
+    context = request.get('context', {})
+    
+    sections = await ai_helper.generate_website_sections(section_types, context)
+    
+    return {
+        "success": True,
+        "sections": sections
+    }
 
 
 @app.post("/api/website/ai/generate-color-scheme")
 async def generate_color_scheme_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate a color scheme with AI"""
-    try:
-        ai_helper = AIHelper()
-        brand_info = request.get('brand_info', {})
-        
-        result = await ai_helper.generate_color_scheme(brand_info)
-        
-        return {
-            "success": True,
-            "color_scheme": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Color scheme generation failed: {str(e)}")
+    brand_info = request.get('brand_info', {})
+    
+    result = await ai_helper.generate_color_scheme(brand_info)
+    
+    return {
+        "success": True,
+        "color_scheme": result
+    }
 
 
 @app.post("/api/website/ai/generate-typography")
 async def generate_typography_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate typography recommendations with AI"""
-    try:
-        ai_helper = AIHelper()
-        brand_style = request.get('brand_style', 'modern')
-        website_type = request.get('website_type', 'corporate')
-        
-        result = await ai_helper.generate_typography_suggestions(brand_style, website_type)
-        
-        return {
-            "success": True,
-            "typography": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Typography generation failed: {str(e)}")
+    brand_style = request.get('brand_style', 'modern')
+    website_type = request.get('website_type', 'corporate')
+    
+    result = await ai_helper.generate_typography_suggestions(brand_style, website_type)
+    
+    return {
+        "success": True,
+        "typography": result
+    }
 
 
 @app.post("/api/website/ai/suggest-layout")
 async def suggest_layout_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Get AI layout suggestions"""
-    try:
-        ai_helper = AIHelper()
-        page_type = request.get('page_type', 'home')
-        content_blocks = request.get('content_blocks', [])
-        
-        result = await ai_helper.generate_layout_suggestion(page_type, content_blocks)
-        
-        return {
-            "success": True,
-            "layout": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Layout suggestion failed: {str(e)}")
+    page_type = request.get('page_type', 'home')
+    content_blocks = request.get('content_blocks', [])
+    
+    result = await ai_helper.generate_layout_suggestion(page_type, content_blocks)
+    
+    return {
+        "success": True,
+        "layout": result
+    }
 
 
 @app.post("/api/website/ai/optimize-section")
 async def optimize_section_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Optimize existing section with AI"""
-    try:
-        ai_helper = AIHelper()
-        section_content = request.get('section_content', '')
-        section_type = request.get('section_type', 'general')
-        goals = request.get('goals', ['conversion'])
-        
-        result = await ai_helper.optimize_website_section(section_content, section_type, goals)
-        
-        return {
-            "success": True,
-            "optimization": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Section optimization failed: {str(e)}")
+    section_content = request.get('section_content', '')
+    section_type = request.get('section_type', 'general')
+    goals = request.get('goals', ['conversion'])
+    
+    result = await ai_helper.optimize_website_section(section_content, section_type, goals)
+    
+    return {
+        "success": True,
+        "optimization": result
+    }
 
 
 @app.post("/api/website/ai/responsive-suggestions")
 async def responsive_suggestions_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Get responsive design suggestions"""
-    try:
-        ai_helper = AIHelper()
-        layout_description = request.get('layout_description', '')
-        
-        result = await ai_helper.generate_responsive_design_suggestions(layout_description)
-        
-        return {
-            "success": True,
-            "suggestions": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Responsive suggestions failed: {str(e)}")
+    layout_description = request.get('layout_description', '')
+    
+    result = await ai_helper.generate_responsive_design_suggestions(layout_description)
+    
+    return {
+        "success": True,
+        "suggestions": result
+    }
 
 
 @app.post("/api/website/ai/animation-suggestions")
 async def animation_suggestions_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Get animation suggestions"""
-    try:
-        ai_helper = AIHelper()
-        element_type = request.get('element_type', 'button')
-        context = request.get('context', 'hero')
-        
-        result = await ai_helper.generate_animation_suggestions(element_type, context)
-        
-        return {
-            "success": True,
-            "animations": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Animation suggestions failed: {str(e)}")
+    element_type = request.get('element_type', 'button')
+    context = request.get('context', 'hero')
+    
+    result = await ai_helper.generate_animation_suggestions(element_type, context)
+    
+    return {
+        "success": True,
+        "animations": result
+    }
 
 
 @app.post("/api/website/ai/seo-metadata")
 async def generate_seo_metadata_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Generate SEO metadata with AI"""
-    try:
-        ai_helper = AIHelper()
-        page_info = request.get('page_info', {})
-        
-        result = await ai_helper.generate_seo_metadata(page_info)
-        
-        return {
-            "success": True,
-            "metadata": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"SEO metadata generation failed: {str(e)}")
+    page_info = request.get('page_info', {})
+    
+    result = await ai_helper.generate_seo_metadata(page_info)
+    
+    return {
+        "success": True,
+        "metadata": result
+    }
 
 
 @app.post("/api/website/ai/accessibility-check")
 async def accessibility_check_ai(
     request: dict,
+    ai_helper: AIHelper = Depends(get_ai_helper),
     current_user: dict = Depends(get_current_user)
 ):
     """Get accessibility recommendations"""
-    try:
-        ai_helper = AIHelper()
-        page_structure = request.get('page_structure', '')
-        
-        result = await ai_helper.generate_accessibility_recommendations(page_structure)
-        
-        return {
-            "success": True,
-            "recommendations": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Accessibility check failed: {str(e)}")
+    page_structure = request.get('page_structure', '')
+    
+    result = await ai_helper.generate_accessibility_recommendations(page_structure)
+    
+    return {
+        "success": True,
+        "recommendations": result
+    }
 
 
 # ==================== SECTION TEMPLATES ENDPOINTS ====================
 
 @app.get("/api/website/section-templates")
 async def get_section_templates(
+    request: Request,
     category: str = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Get section templates"""
-    try:
-        from website_templates import get_all_templates, get_templates_by_category
-        
-        if category:
-            templates = get_templates_by_category(category)
-        else:
-            templates = get_all_templates()
-        
-        return {
-            "success": True,
-            "templates": templates,
-            "count": len(templates)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch templates: {str(e)}")
+    return template_registry.get_section_templates(category).respond(request)
 
 
 @app.get("/api/website/section-templates/{template_id}")
 async def get_section_template_by_id(
     template_id: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get a specific section template"""
-    try:
-        from website_templates import get_template_by_id
-        
-        template = get_template_by_id(template_id)
-        
-        if not template:
-            raise HTTPException(status_code=404, detail="Template not found")
-        
-        return {
-            "success": True,
-            "template": template
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch template: {str(e)}")
+    payload = template_registry.get('section-template', template_id)
+    
+    if not payload:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    return payload.respond(request)
 
 
 # ==================== ADVANCED BLOCKS ENDPOINTS ====================
 
 @app.get("/api/website/advanced-blocks")
 async def get_advanced_blocks(
+    request: Request,
     category: str = None,
     current_user: dict = Depends(get_current_user)
 ):
     """Get advanced blocks"""
-    try:
-        from advanced_blocks import get_all_advanced_blocks, get_blocks_by_category
-        
-        if category:
-            blocks = get_blocks_by_category(category)
-        else:
-            blocks = get_all_advanced_blocks()
-        
-        return {
-            "success": True,
-            "blocks": blocks,
-            "count": len(blocks)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch blocks: {str(e)}")
+    return template_registry.get_advanced_blocks(category).respond(request)
 
 
 @app.get("/api/website/advanced-blocks/{block_type}")
 async def get_advanced_block_by_type(
     block_type: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get a specific advanced block"""
-    try:
-        from advanced_blocks import get_block_by_type
-        
-        block = get_block_by_type(block_type)
-        
-        if not block:
-            raise HTTPException(status_code=404, detail="Block not found")
-        
-        return {
-            "success": True,
-            "block": block
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch block: {str(e)}")
+    payload = template_registry.get('advanced-block', block_type)
+    
+    if not payload:
+        raise HTTPException(status_code=404, detail="Block not found")
+    
+    return payload.respond(request)
 
 
 # ==================== ASSET MANAGEMENT ENDPOINTS ====================
@@ -0,0 +1,66 @@
+"""
+Server-Sent Events Helpers - Framing and streaming responses for SSE endpoints
+"""
+
+import json
+import asyncio
+from typing import Any, AsyncIterator, Optional
+from fastapi.responses import StreamingResponse
+
+# Comment frames keep proxies from closing an idle stream
+HEARTBEAT_SECONDS = 15
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no'  # Disable nginx response buffering
+}
+
+
+def format_sse(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Frame one event; non-string data is JSON-encoded"""
+    if not isinstance(data, str):
+        data = json.dumps(data, default=str)
+
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+async def with_heartbeat(frames: AsyncIterator[str], interval: float = HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+    """Send an opening comment at once, then a heartbeat whenever the source goes quiet"""
+    yield ": connected\n\n"
+
+    frames = frames.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(frames.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield ": keepalive\n\n"
+                continue
+            try:
+                frame = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+            yield frame
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def sse_response(frames: AsyncIterator[str], interval: float = HEARTBEAT_SECONDS) -> StreamingResponse:
+    """Stream pre-framed SSE events to the client"""
+    return StreamingResponse(
+        with_heartbeat(frames, interval),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
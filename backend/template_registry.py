@@ -0,0 +1,134 @@
+"""
+Template Registry - Static template catalogs indexed and pre-encoded at startup
+Covers the template library, website section templates and advanced blocks.
+Every response body is JSON-encoded (and compressed) once, with a strong ETag,
+so repeat fetches are a 304 and first fetches a memory copy.
+"""
+
+import gzip
+import json
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from http_cache import make_etag, cached_response
+import template_library
+import website_templates
+import advanced_blocks
+
+try:
+    import brotli
+except ImportError:  # Optional: serve gzip only
+    brotli = None
+
+CACHE_CONTROL = "private, max-age=300"
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+
+class EncodedPayload:
+    """A JSON response body encoded once, with compressed variants"""
+
+    def __init__(self, content, cache_control: str = CACHE_CONTROL):
+        self.cache_control = cache_control
+        self.body = json.dumps(
+            jsonable_encoder(content),
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode('utf-8')
+        self.etag = make_etag(self.body)
+
+        self.variants = {}
+        if len(self.body) >= MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(self.body)
+            self.variants['gzip'] = gzip.compress(self.body, compresslevel=9)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.variants.values())
+
+    def respond(self, request: Request) -> Response:
+        """Serve the best encoding the client accepts, or a 304"""
+        accepted = request.headers.get('accept-encoding', '')
+        for encoding, body in self.variants.items():
+            if encoding in accepted:
+                return cached_response(
+                    request, body, f'{self.etag[:-1]}-{encoding}"',
+                    cache_control=self.cache_control,
+                    headers={'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+                )
+
+        return cached_response(
+            request, self.body, self.etag,
+            cache_control=self.cache_control,
+            headers={'Vary': 'Accept-Encoding'} if self.variants else None
+        )
+
+
+class TemplateRegistry:
+    def __init__(self):
+        # Template library: module -> id -> template
+        library = template_library.get_all_templates()
+        self.library_by_id = {
+            module: {t['id']: t for t in templates if t.get('id')}
+            for module, templates in library.items()
+        }
+        self.section_templates_by_id = {
+            t['id']: t for t in website_templates.get_all_templates()
+        }
+
+        self._payloads = {('templates',): EncodedPayload(library)}
+        for module, templates in library.items():
+            self._payloads[('templates', module)] = EncodedPayload({"module": module, "templates": templates})
+            for template_id, template in self.library_by_id[module].items():
+                self._payloads[('template', module, template_id)] = EncodedPayload(template)
+
+        all_sections = website_templates.get_all_templates()
+        self._payloads[('section-templates', None)] = EncodedPayload(self._list_body("templates", all_sections))
+        for category in website_templates.ALL_TEMPLATES:
+            self._payloads[('section-templates', category)] = EncodedPayload(
+                self._list_body("templates", website_templates.get_templates_by_category(category))
+            )
+        for template_id, template in self.section_templates_by_id.items():
+            self._payloads[('section-template', template_id)] = EncodedPayload(
+                {"success": True, "template": template}
+            )
+
+        all_blocks = advanced_blocks.get_all_advanced_blocks()
+        self._payloads[('advanced-blocks', None)] = EncodedPayload(self._list_body("blocks", all_blocks))
+        for category in {block.get("category") for block in all_blocks.values()}:
+            self._payloads[('advanced-blocks', category)] = EncodedPayload(
+                self._list_body("blocks", advanced_blocks.get_blocks_by_category(category))
+            )
+        for block_type, block in all_blocks.items():
+            self._payloads[('advanced-block', block_type)] = EncodedPayload(
+                {"success": True, "block": block}
+            )
+
+    @staticmethod
+    def _list_body(field: str, items) -> dict:
+        return {"success": True, field: items, "count": len(items)}
+
+    def get(self, *key) -> Optional[EncodedPayload]:
+        """Get the pre-encoded payload for a catalog key"""
+        return self._payloads.get(key)
+
+    def get_module_templates(self, module: str) -> EncodedPayload:
+        """Module listing; unknown or non-canonical module names are encoded on demand"""
+        payload = self.get('templates', module)
+        if payload is None:
+            templates = template_library.get_templates_by_module(module)
+            payload = EncodedPayload({"module": module, "templates": templates})
+        return payload
+
+    def get_template(self, module: str, template_id: str) -> Optional[EncodedPayload]:
+        return self.get('template', module.lower(), template_id)
+
+    def get_section_templates(self, category: Optional[str] = None) -> EncodedPayload:
+        return self.get('section-templates', category or None) or EncodedPayload(self._list_body("templates", []))
+
+    def get_advanced_blocks(self, category: Optional[str] = None) -> EncodedPayload:
+        return self.get('advanced-blocks', category or None) or EncodedPayload(self._list_body("blocks", {}))
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,108 @@
+"""
+AI Streaming Tests - AIHelper.stream_text relays a fake stream_client
+"""
+
+import asyncio
+import pytest
+import ai_helper
+from ai_helper import AIHelper
+from ai_admission import ai_admission
+
+
+class FakeStream:
+    """A stream_client that yields preset chunks, optionally failing after them"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.calls = []
+        self.closed = False
+
+    async def __call__(self, prompt, system_message):
+        self.calls.append((prompt, system_message))
+        try:
+            for chunk in self.chunks:
+                await asyncio.sleep(0)
+                yield chunk
+            if self.error:
+                raise self.error
+        finally:
+            self.closed = True
+
+
+class FakeCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, text, provider, model):
+        self.entries[key] = text
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fake = FakeCache()
+    monkeypatch.setattr(ai_helper, 'ai_response_cache', fake)
+    return fake
+
+
+async def collect(helper, prompt="prompt"):
+    return [chunk async for chunk in helper.stream_text(prompt, "system")]
+
+
+def test_chunks_are_relayed_in_order():
+    stream = FakeStream(["Hello", ", ", "", "world", "!"])
+    helper = AIHelper(use_cache=False, stream_client=stream)
+
+    assert asyncio.run(collect(helper)) == ["Hello", ", ", "world", "!"]
+    assert stream.calls == [("prompt", "system")]
+    assert stream.closed
+    assert ai_admission.in_flight == 0
+
+
+def test_completed_stream_is_cached_and_replayed(cache):
+    stream = FakeStream(["a", "b", "c"])
+    helper = AIHelper(stream_client=stream)
+
+    assert asyncio.run(collect(helper)) == ["a", "b", "c"]
+    assert list(cache.entries.values()) == ["abc"]
+
+    # Served whole from the cache without calling the client again
+    assert asyncio.run(collect(helper)) == ["abc"]
+    assert len(stream.calls) == 1
+
+
+def test_error_after_chunks_propagates_and_is_not_cached(cache):
+    stream = FakeStream(["partial ", "text"], error=RuntimeError("connection reset"))
+    helper = AIHelper(stream_client=stream)
+    received = []
+
+    async def consume():
+        async for chunk in helper.stream_text("prompt", "system"):
+            received.append(chunk)
+
+    with pytest.raises(RuntimeError, match="connection reset"):
+        asyncio.run(consume())
+
+    assert received == ["partial ", "text"]
+    assert stream.closed
+    assert cache.entries == {}
+    assert ai_admission.in_flight == 0
+
+
+def test_closing_early_closes_the_client_stream(cache):
+    stream = FakeStream(["one", "two", "three"])
+    helper = AIHelper(stream_client=stream)
+
+    async def first_chunk():
+        chunks = helper.stream_text("prompt", "system")
+        first = await chunks.__anext__()
+        await chunks.aclose()
+        return first
+
+    assert asyncio.run(first_chunk()) == "one"
+    assert stream.closed
+    assert cache.entries == {}
+    assert ai_admission.in_flight == 0
@@ -0,0 +1,260 @@
+"""
+Webinar Chat Store - Recent chat served from memory, persisted write-behind
+Each webinar keeps its last CHAT_BUFFER_SIZE messages in a ring buffer ordered
+by created_at, so `since=` polls are a binary search instead of a sorted Mongo
+query. New messages are written to Mongo in batched insert_many calls by a
+background flusher; retries skip messages that were already stored, and each
+stored message is counted into the webinar's stats once. Buffers are fed by webinar_events, so with a shared broker
+every worker sees every message.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from database import webinars_collection, webinar_chat_messages_collection
+from webinar_events import webinar_events
+import webinar_stats
+
+logger = logging.getLogger(__name__)
+
+CHAT_BUFFER_SIZE = int(os.getenv('WEBINAR_CHAT_BUFFER_SIZE', 500))
+MAX_BUFFERED_WEBINARS = 200
+CHAT_FLUSH_INTERVAL = float(os.getenv('WEBINAR_CHAT_FLUSH_INTERVAL_SECONDS', 0.5))
+CHAT_FLUSH_BATCH_SIZE = 500
+# Unwritten messages kept while Mongo is failing; beyond this the oldest are dropped
+MAX_PENDING_MESSAGES = 20000
+# Status changes made on other workers are picked up after at most this many seconds
+LIVE_FLAG_TTL = float(os.getenv('WEBINAR_LIVE_FLAG_TTL_SECONDS', 5))
+DUPLICATE_KEY = 11000
+
+
+class ChatBuffer:
+    """The most recent messages of one webinar, oldest first"""
+
+    def __init__(self, messages: List[dict], complete: bool):
+        self.messages = messages
+        self.timestamps = [m['created_at'] for m in messages]
+        self.ids = {m['id'] for m in messages}
+        # True while the buffer holds the webinar's whole history
+        self.complete = complete
+
+    def add(self, message: dict):
+        if message['id'] in self.ids:
+            return
+        # Messages from other workers can arrive slightly out of order
+        index = bisect_right(self.timestamps, message['created_at'])
+        self.messages.insert(index, message)
+        self.timestamps.insert(index, message['created_at'])
+        self.ids.add(message['id'])
+
+        if len(self.messages) > CHAT_BUFFER_SIZE:
+            # Trim in chunks so the list isn't shifted on every message
+            drop = len(self.messages) - CHAT_BUFFER_SIZE + CHAT_BUFFER_SIZE // 10
+            for dropped in self.messages[:drop]:
+                self.ids.discard(dropped['id'])
+            del self.messages[:drop]
+            del self.timestamps[:drop]
+            self.complete = False
+
+    def remove(self, message_id: str):
+        if message_id not in self.ids:
+            return
+        index = next(i for i, m in enumerate(self.messages) if m['id'] == message_id)
+        del self.messages[index]
+        del self.timestamps[index]
+        self.ids.discard(message_id)
+
+    def covers(self, since: Optional[datetime], limit: int) -> bool:
+        """Whether the buffer alone can answer the query"""
+        if self.complete or (since is not None and self.timestamps and since >= self.timestamps[0]):
+            return True
+        # Older history is only in Mongo, but the newest `limit` messages are all buffered
+        return len(self.messages) >= limit
+
+    def after(self, since: Optional[datetime], limit: int) -> List[dict]:
+        """The last `limit` messages created after `since`, oldest first"""
+        start = bisect_right(self.timestamps, since) if since else 0
+        start = max(start, len(self.messages) - limit)
+        return self.messages[start:]
+
+
+class WebinarChatStore:
+    def __init__(self):
+        self._buffers: "OrderedDict[str, ChatBuffer]" = OrderedDict()
+        self._pending: List[dict] = []
+        self._writing: List[dict] = []  # Batch currently being inserted
+        self._unapplied_counts: Dict[str, int] = {}  # webinar_id -> stored messages not yet in stats
+        self._wake = asyncio.Event()
+        self._status: Dict[str, tuple] = {}  # webinar_id -> (loaded_at, status or None)
+
+    # ---------- Live flag ----------
+
+    def webinar_status(self, webinar_id: str) -> Optional[str]:
+        """Cached webinar status, None if the webinar doesn't exist"""
+        now = time.monotonic()
+        entry = self._status.get(webinar_id)
+        if entry is None or now - entry[0] >= LIVE_FLAG_TTL:
+            if len(self._status) >= MAX_BUFFERED_WEBINARS * 10:
+                self._status = {}
+            webinar = webinars_collection.find_one({"id": webinar_id}, {'_id': 0, 'status': 1})
+            entry = self._status[webinar_id] = (now, webinar.get('status') if webinar else None)
+        return entry[1]
+
+    def set_status(self, webinar_id: str, status: Optional[str]):
+        self._status.pop(webinar_id, None)
+        if status is not None:
+            self._status[webinar_id] = (time.monotonic(), status)
+
+    # ---------- Buffers ----------
+
+    def _buffer(self, webinar_id: str) -> ChatBuffer:
+        buffer = self._buffers.get(webinar_id)
+        if buffer is not None:
+            self._buffers.move_to_end(webinar_id)
+            return buffer
+
+        persisted = list(
+            webinar_chat_messages_collection.find({"webinar_id": webinar_id}, {'_id': 0})
+            .sort("created_at", -1)
+            .limit(CHAT_BUFFER_SIZE)
+        )
+        persisted.reverse()
+        buffer = ChatBuffer(persisted, complete=len(persisted) < CHAT_BUFFER_SIZE)
+        # Messages still waiting to be written aren't in Mongo yet
+        for message in self._writing + self._pending:
+            if message['webinar_id'] == webinar_id:
+                buffer.add(message)
+
+        self._buffers[webinar_id] = buffer
+        if len(self._buffers) > MAX_BUFFERED_WEBINARS:
+            self._buffers.popitem(last=False)
+        return buffer
+
+    def _on_event(self, webinar_id: str, event: dict):
+        if event['event'] == 'chat.message':
+            self._buffer(webinar_id).add(event['data'])
+        elif event['event'] == 'chat.deleted' and webinar_id in self._buffers:
+            self._buffers[webinar_id].remove(event['data']['id'])
+
+    def messages(self, webinar_id: str, since: Optional[datetime] = None, limit: int = 100) -> List[dict]:
+        """Messages created after `since` (the last `limit` of them), oldest first"""
+        buffer = self._buffer(webinar_id)
+        if buffer.covers(since, limit):
+            return buffer.after(since, limit)
+
+        query = {"webinar_id": webinar_id}
+        if since:
+            query["created_at"] = {"$gt": since}
+        messages = list(webinar_chat_messages_collection.find(query, {'_id': 0}).sort("created_at", -1).limit(limit))
+        messages.reverse()
+        return messages
+
+    def drop(self, webinar_id: str):
+        """Forget a webinar's buffer and unwritten messages (e.g. when it is deleted)"""
+        self._buffers.pop(webinar_id, None)
+        self._status.pop(webinar_id, None)
+        self._pending = [m for m in self._pending if m['webinar_id'] != webinar_id]
+        self._unapplied_counts.pop(webinar_id, None)
+
+    # ---------- Write-behind ----------
+
+    def add(self, message: dict):
+        """Queue a new message to be written"""
+        self._pending.append(message)
+        if len(self._pending) > MAX_PENDING_MESSAGES:
+            dropped = len(self._pending) - MAX_PENDING_MESSAGES
+            logger.error(f"Chat write backlog full, dropping {dropped} unwritten messages")
+            del self._pending[:dropped]
+        if len(self._pending) >= CHAT_FLUSH_BATCH_SIZE:
+            self._wake.set()
+
+    def discard_pending(self, webinar_id: str, message_id: str) -> bool:
+        """Drop a message that hasn't been written yet; returns whether it was pending"""
+        for i, message in enumerate(self._pending):
+            if message['id'] == message_id and message['webinar_id'] == webinar_id:
+                del self._pending[i]
+                return True
+        return False
+
+    @staticmethod
+    def _insert(batch: List[dict]) -> List[dict]:
+        """Store messages; returns the ones that couldn't be written"""
+        try:
+            # Insert copies so the buffered messages don't pick up an ObjectId
+            webinar_chat_messages_collection.insert_many([dict(m) for m in batch], ordered=False)
+        except BulkWriteError as e:
+            # A duplicate id is a message stored by an earlier attempt whose result was lost
+            return [
+                batch[error['index']] for error in e.details.get('writeErrors', [])
+                if error.get('code') != DUPLICATE_KEY
+            ]
+        return []
+
+    @staticmethod
+    def _apply_counts(counts: Dict[str, int]) -> Dict[str, int]:
+        """Add stored messages to the webinars' stats; returns the counts that weren't applied"""
+        try:
+            webinar_stats.increment_many({webinar_id: {"chat_messages": n} for webinar_id, n in counts.items()})
+        except BulkWriteError as e:
+            # Operations are in counts order; only the failed ones are retried
+            webinar_ids = list(counts)
+            return {
+                webinar_ids[error['index']]: counts[webinar_ids[error['index']]]
+                for error in e.details.get('writeErrors', [])
+            }
+        return {}
+
+    async def flush(self):
+        """Write every pending message, in batches, then count them into the webinars' stats"""
+        while self._pending:
+            batch = self._writing = self._pending[:CHAT_FLUSH_BATCH_SIZE]
+            del self._pending[:len(batch)]
+            try:
+                # Blocking database call, keep it off the event loop
+                failed = await asyncio.to_thread(self._insert, batch)
+            except Exception as e:
+                logger.error(f"Error writing chat messages: {str(e)}")
+                self._pending[:0] = batch  # Retry on the next flush; stored ones come back as duplicates
+                break
+            finally:
+                self._writing = []
+
+            failed_ids = {m['id'] for m in failed}
+            for message in batch:
+                if message['id'] not in failed_ids:
+                    webinar_id = message['webinar_id']
+                    self._unapplied_counts[webinar_id] = self._unapplied_counts.get(webinar_id, 0) + 1
+            if failed:
+                logger.error(f"Error writing {len(failed)} chat messages, retrying on the next flush")
+                self._pending[:0] = failed
+                break
+
+        if self._unapplied_counts:
+            counts, self._unapplied_counts = self._unapplied_counts, {}
+            try:
+                failed_counts = await asyncio.to_thread(self._apply_counts, counts)
+            except Exception as e:
+                logger.error(f"Error updating chat message counts: {str(e)}")
+                failed_counts = counts
+            for webinar_id, n in failed_counts.items():
+                self._unapplied_counts[webinar_id] = self._unapplied_counts.get(webinar_id, 0) + n
+
+    async def run_flusher(self, interval_seconds: float = CHAT_FLUSH_INTERVAL):
+        """Flush pending messages every interval, or sooner once a batch is full, until cancelled"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+chat_store = WebinarChatStore()
+webinar_events.add_listener(chat_store._on_event)
@@ -4,25 +4,159 @@ Integrates with Phase 3 Email Marketing System
 """
 
 import os
+import re
+import asyncio
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import List, Dict
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import escape
 from email_service import EmailService
 from database import (
     webinars_collection,
     webinar_registrations_collection,
     email_logs_collection
 )
+from leases import acquire_lease, release_lease
 import uuid
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Reminders go out when the webinar starts within these offsets from now
+REMINDER_WINDOWS = {
+    '24h': (timedelta(hours=23, minutes=45), timedelta(hours=24, minutes=15)),
+    '1h': (timedelta(minutes=45), timedelta(hours=1, minutes=15))
+}
+REMINDER_BATCH_SIZE = int(os.getenv('WEBINAR_REMINDER_BATCH_SIZE', 500))
+REMINDER_LEASE_SECONDS = 300
+REMINDER_INTERVAL_SECONDS = int(os.getenv('WEBINAR_REMINDER_INTERVAL_SECONDS', 60))
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_templates', 'webinar')
+EMAIL_SUBJECTS = {
+    'registration_confirmation': "Confirmed: You're registered for {title}",
+    'reminder_24h': "🎯 Tomorrow: {title}",
+    'reminder_1h': "🔴 LIVE in 1 Hour: {title}",
+    'thank_you': "Thank you for attending: {title}"
+}
+RECIPIENT_FIELDS = ('first_name', 'email')
+RENDER_CACHE_SIZE = 512
+
+# Recipient fields are rendered as markers and merged in per recipient
+_FIELD_MARKER = re.compile('\x00(' + '|'.join(RECIPIENT_FIELDS) + ')\x00')
+
+
+class RenderedEmail:
+    """A webinar email rendered once per webinar, split around its recipient fields"""
+    
+    def __init__(self, subject: str, html: str):
+        self.subject = subject
+        # Even indexes are literal HTML, odd indexes are recipient field names
+        self.parts = _FIELD_MARKER.split(html)
+        self.placeholder_html = self._join(lambda field: f"{{{{{field}}}}}")
+    
+    def _join(self, value_for) -> str:
+        return ''.join(
+            part if i % 2 == 0 else value_for(part)
+            for i, part in enumerate(self.parts)
+        )
+    
+    @staticmethod
+    def recipient_data(registration: dict) -> dict:
+        """HTML-escaped recipient values for merging"""
+        return {
+            'first_name': str(escape(registration.get('first_name') or 'there')),
+            'email': str(escape(registration.get('email') or ''))
+        }
+    
+    def merge(self, registration: dict) -> str:
+        """Produce the final HTML for one recipient"""
+        data = self.recipient_data(registration)
+        return self._join(data.__getitem__)
+
+
 class WebinarEmailService:
     def __init__(self):
         self.email_service = EmailService()
         self.from_email = os.getenv('EMAIL_FROM', 'noreply@efunnels.com')
         self.from_name = os.getenv('EMAIL_FROM_NAME', 'eFunnels Webinars')
+        
+        # Compile every template once at startup
+        env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            autoescape=select_autoescape(['html'])
+        )
+        self.templates = {
+            email_type: env.get_template(f"{email_type}.html")
+            for email_type in EMAIL_SUBJECTS
+        }
+        self._rendered = OrderedDict()
+    
+    def _webinar_context(self, webinar: dict) -> dict:
+        """Per-webinar template values (formatted once per render)"""
+        scheduled_at = webinar.get('scheduled_at')
+        return {
+            'webinar_title': webinar.get('title', 'Webinar'),
+            'scheduled_date': scheduled_at.strftime('%B %d, %Y at %I:%M %p %Z') if scheduled_at else 'TBD',
+            'duration_minutes': webinar.get('duration_minutes', 60),
+            'presenter_name': webinar.get('presenter_name', 'Presenter'),
+            'signature': webinar.get('presenter_name', 'The Team'),
+            'description': webinar.get('description', 'Join us for an engaging session!'),
+            # Generate join link (in production, this would be a real link)
+            'join_link': f"https://app.efunnels.com/webinar/{webinar.get('id')}/join",
+            'from_name': self.from_name,
+            'recipient': {field: f"\x00{field}\x00" for field in RECIPIENT_FIELDS}
+        }
+    
+    def render(self, email_type: str, webinar: dict, recording_url: str = None) -> RenderedEmail:
+        """Render an email for a webinar, reusing the result across all its registrants"""
+        cache_key = (
+            email_type, webinar.get('id'), webinar.get('updated_at'),
+            webinar.get('scheduled_at'), recording_url
+        )
+        rendered = self._rendered.get(cache_key)
+        if rendered:
+            self._rendered.move_to_end(cache_key)
+            return rendered
+        
+        context = self._webinar_context(webinar)
+        context['recording_url'] = recording_url
+        rendered = RenderedEmail(
+            subject=EMAIL_SUBJECTS[email_type].format(title=context['webinar_title']),
+            html=self.templates[email_type].render(context)
+        )
+        
+        # Test sends and unsaved webinars have no id, so don't keep them
+        if webinar.get('id'):
+            self._rendered[cache_key] = rendered
+            if len(self._rendered) > RENDER_CACHE_SIZE:
+                self._rendered.popitem(last=False)
+        return rendered
+    
+    def _send(self, email_type: str, webinar: dict, registration: dict, recording_url: str = None) -> dict:
+        """Render, send and log a single webinar email"""
+        rendered = self.render(email_type, webinar, recording_url)
+        
+        result = self.email_service.send_email(
+            to_email=registration.get('email'),
+            subject=rendered.subject,
+            html_content=rendered.merge(registration),
+            from_name=self.from_name,
+            from_email=self.from_email
+        )
+        
+        self._log_email(
+            webinar_id=webinar.get('id'),
+            recipient_email=registration.get('email'),
+            subject=rendered.subject,
+            status='sent' if result['success'] else 'failed',
+            email_type=email_type,
+            provider=result.get('provider'),
+            error_message=result.get('error')
+        )
+        
+        return result
     
     def send_registration_confirmation(
         self,
@@ -31,91 +165,7 @@ class WebinarEmailService:
     ) -> dict:
         """Send confirmation email upon registration"""
         try:
-            # Get webinar details
-            webinar_title = webinar.get('title', 'Webinar')
-            scheduled_at = webinar.get('scheduled_at')
-            duration_minutes = webinar.get('duration_minutes', 60)
-            presenter_name = webinar.get('presenter_name', 'Presenter')
-            
-            # Format date
-            scheduled_date = scheduled_at.strftime('%B %d, %Y at %I:%M %p %Z') if scheduled_at else 'TBD'
-            
-            # Create email HTML
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-                    .details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                    .footer {{ text-align: center; color: #888; margin-top: 30px; font-size: 12px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>You're Registered! 🎉</h1>
-                        <p>Your spot is confirmed for {webinar_title}</p>
-                    </div>
-                    <div class="content">
-                        <p>Hi {registration.get('first_name', 'there')},</p>
-                        <p>Thank you for registering! We're excited to have you join us for this webinar.</p>
-                        
-                        <div class="details">
-                            <h3>📅 Webinar Details</h3>
-                            <p><strong>Title:</strong> {webinar_title}</p>
-                            <p><strong>Date & Time:</strong> {scheduled_date}</p>
-                            <p><strong>Duration:</strong> {duration_minutes} minutes</p>
-                            <p><strong>Presenter:</strong> {presenter_name}</p>
-                        </div>
-                        
-                        <p><strong>What to expect:</strong></p>
-                        <p>{webinar.get('description', 'Join us for an engaging session!')}</p>
-                        
-                        <center>
-                            <a href="#" class="button">Add to Calendar</a>
-                        </center>
-                        
-                        <p><strong>Important:</strong> We'll send you reminder emails 24 hours and 1 hour before the webinar. You'll also receive a join link closer to the event.</p>
-                        
-                        <p>See you there!<br>
-                        {presenter_name} and the {self.from_name} Team</p>
-                    </div>
-                    <div class="footer">
-                        <p>This email was sent to {registration.get('email')}</p>
-                        <p>&copy; 2025 eFunnels. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Send email
-            result = self.email_service.send_email(
-                to_email=registration.get('email'),
-                subject=f"Confirmed: You're registered for {webinar_title}",
-                html_content=html_content,
-                from_name=self.from_name,
-                from_email=self.from_email
-            )
-            
-            # Log email
-            self._log_email(
-                webinar_id=webinar.get('id'),
-                recipient_email=registration.get('email'),
-                subject=f"Confirmed: You're registered for {webinar_title}",
-                status='sent' if result['success'] else 'failed',
-                email_type='registration_confirmation',
-                provider=result.get('provider'),
-                error_message=result.get('error')
-            )
-            
-            return result
-            
+            return self._send('registration_confirmation', webinar, registration)
         except Exception as e:
             logger.error(f"Error sending registration confirmation: {str(e)}")
             return {'success': False, 'error': str(e)}
@@ -123,86 +173,7 @@ class WebinarEmailService:
     def send_reminder_24h(self, webinar: dict, registration: dict) -> dict:
         """Send 24-hour reminder email"""
         try:
-            webinar_title = webinar.get('title', 'Webinar')
-            scheduled_at = webinar.get('scheduled_at')
-            
-            scheduled_date = scheduled_at.strftime('%B %d, %Y at %I:%M %p %Z') if scheduled_at else 'TBD'
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-                    .countdown {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; text-align: center; }}
-                    .countdown h2 {{ color: #667eea; font-size: 36px; margin: 10px 0; }}
-                    .footer {{ text-align: center; color: #888; margin-top: 30px; font-size: 12px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>⏰ Tomorrow: {webinar_title}</h1>
-                    </div>
-                    <div class="content">
-                        <p>Hi {registration.get('first_name', 'there')},</p>
-                        
-                        <div class="countdown">
-                            <h2>24 Hours to Go!</h2>
-                            <p>Your webinar starts tomorrow at:</p>
-                            <h3>{scheduled_date}</h3>
-                        </div>
-                        
-                        <p><strong>Quick Reminder:</strong></p>
-                        <ul>
-                            <li>Make sure you have a stable internet connection</li>
-                            <li>Test your audio/video if you plan to participate</li>
-                            <li>Prepare any questions you'd like to ask</li>
-                            <li>Have a notepad ready for key takeaways</li>
-                        </ul>
-                        
-                        <center>
-                            <a href="#" class="button">Join Webinar (Live Tomorrow)</a>
-                        </center>
-                        
-                        <p>We'll send you one more reminder 1 hour before the webinar starts with the join link.</p>
-                        
-                        <p>See you tomorrow!<br>
-                        {webinar.get('presenter_name', 'The Team')}</p>
-                    </div>
-                    <div class="footer">
-                        <p>This email was sent to {registration.get('email')}</p>
-                        <p>&copy; 2025 eFunnels. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            result = self.email_service.send_email(
-                to_email=registration.get('email'),
-                subject=f"🎯 Tomorrow: {webinar_title}",
-                html_content=html_content,
-                from_name=self.from_name,
-                from_email=self.from_email
-            )
-            
-            self._log_email(
-                webinar_id=webinar.get('id'),
-                recipient_email=registration.get('email'),
-                subject=f"🎯 Tomorrow: {webinar_title}",
-                status='sent' if result['success'] else 'failed',
-                email_type='reminder_24h',
-                provider=result.get('provider'),
-                error_message=result.get('error')
-            )
-            
-            return result
-            
+            return self._send('reminder_24h', webinar, registration)
         except Exception as e:
             logger.error(f"Error sending 24h reminder: {str(e)}")
             return {'success': False, 'error': str(e)}
@@ -210,86 +181,7 @@ class WebinarEmailService:
     def send_reminder_1h(self, webinar: dict, registration: dict) -> dict:
         """Send 1-hour reminder email with join link"""
         try:
-            webinar_title = webinar.get('title', 'Webinar')
-            webinar_id = webinar.get('id')
-            
-            # Generate join link (in production, this would be a real link)
-            join_link = f"https://app.efunnels.com/webinar/{webinar_id}/join"
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #10b981 0%, #059669 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .button {{ display: inline-block; background: #10b981; color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; margin: 20px 0; font-weight: bold; font-size: 18px; }}
-                    .urgent {{ background: #fef3c7; border-left: 4px solid #f59e0b; padding: 15px; margin: 20px 0; border-radius: 5px; }}
-                    .footer {{ text-align: center; color: #888; margin-top: 30px; font-size: 12px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>🚀 Starting in 1 Hour!</h1>
-                        <p>{webinar_title}</p>
-                    </div>
-                    <div class="content">
-                        <p>Hi {registration.get('first_name', 'there')},</p>
-                        
-                        <div class="urgent">
-                            <h3>⚡ Your webinar is starting in 1 hour!</h3>
-                            <p>Click the button below to join when it starts:</p>
-                        </div>
-                        
-                        <center>
-                            <a href="{join_link}" class="button">🎥 JOIN WEBINAR NOW</a>
-                        </center>
-                        
-                        <p><strong>Before you join:</strong></p>
-                        <ul>
-                            <li>✅ Close unnecessary browser tabs</li>
-                            <li>✅ Ensure your internet connection is stable</li>
-                            <li>✅ Find a quiet place to join from</li>
-                            <li>✅ Have your questions ready!</li>
-                        </ul>
-                        
-                        <p><strong>Can't make it?</strong> Don't worry! We'll send you a link to the recording after the webinar.</p>
-                        
-                        <p>Looking forward to seeing you there!<br>
-                        {webinar.get('presenter_name', 'The Team')}</p>
-                    </div>
-                    <div class="footer">
-                        <p>This email was sent to {registration.get('email')}</p>
-                        <p>&copy; 2025 eFunnels. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            result = self.email_service.send_email(
-                to_email=registration.get('email'),
-                subject=f"🔴 LIVE in 1 Hour: {webinar_title}",
-                html_content=html_content,
-                from_name=self.from_name,
-                from_email=self.from_email
-            )
-            
-            self._log_email(
-                webinar_id=webinar.get('id'),
-                recipient_email=registration.get('email'),
-                subject=f"🔴 LIVE in 1 Hour: {webinar_title}",
-                status='sent' if result['success'] else 'failed',
-                email_type='reminder_1h',
-                provider=result.get('provider'),
-                error_message=result.get('error')
-            )
-            
-            return result
-            
+            return self._send('reminder_1h', webinar, registration)
         except Exception as e:
             logger.error(f"Error sending 1h reminder: {str(e)}")
             return {'success': False, 'error': str(e)}
@@ -302,94 +194,7 @@ class WebinarEmailService:
     ) -> dict:
         """Send thank you email after webinar with recording link"""
         try:
-            webinar_title = webinar.get('title', 'Webinar')
-            
-            recording_section = ""
-            if recording_url:
-                recording_section = f"""
-                <div class="recording">
-                    <h3>📹 Watch the Recording</h3>
-                    <p>Missed something? Want to review? The full recording is now available:</p>
-                    <center>
-                        <a href="{recording_url}" class="button">Watch Recording</a>
-                    </center>
-                </div>
-                """
-            else:
-                recording_section = """
-                <p>The recording will be available soon. We'll send you an email when it's ready!</p>
-                """
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #8b5cf6 0%, #6d28d9 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .button {{ display: inline-block; background: #8b5cf6; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-                    .recording {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                    .footer {{ text-align: center; color: #888; margin-top: 30px; font-size: 12px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>Thank You for Attending! 🙏</h1>
-                        <p>{webinar_title}</p>
-                    </div>
-                    <div class="content">
-                        <p>Hi {registration.get('first_name', 'there')},</p>
-                        
-                        <p>Thank you for joining us today! We hope you found the session valuable and learned something new.</p>
-                        
-                        {recording_section}
-                        
-                        <p><strong>What's Next?</strong></p>
-                        <ul>
-                            <li>Share what you learned with your team</li>
-                            <li>Implement the strategies we discussed</li>
-                            <li>Join us for our next webinar</li>
-                            <li>Reach out if you have any questions</li>
-                        </ul>
-                        
-                        <p><strong>Stay Connected:</strong><br>
-                        Keep an eye on your inbox for upcoming webinars and exclusive content.</p>
-                        
-                        <p>Thank you again for your time and participation!<br>
-                        {webinar.get('presenter_name', 'The Team')}</p>
-                    </div>
-                    <div class="footer">
-                        <p>This email was sent to {registration.get('email')}</p>
-                        <p>&copy; 2025 eFunnels. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            result = self.email_service.send_email(
-                to_email=registration.get('email'),
-                subject=f"Thank you for attending: {webinar_title}",
-                html_content=html_content,
-                from_name=self.from_name,
-                from_email=self.from_email
-            )
-            
-            self._log_email(
-                webinar_id=webinar.get('id'),
-                recipient_email=registration.get('email'),
-                subject=f"Thank you for attending: {webinar_title}",
-                status='sent' if result['success'] else 'failed',
-                email_type='thank_you',
-                provider=result.get('provider'),
-                error_message=result.get('error')
-            )
-            
-            return result
-            
+            return self._send('thank_you', webinar, registration, recording_url)
         except Exception as e:
             logger.error(f"Error sending thank you email: {str(e)}")
             return {'success': False, 'error': str(e)}
@@ -397,64 +202,158 @@ class WebinarEmailService:
     def process_scheduled_reminders(self):
         """
         Process all scheduled reminders for webinars
-        Should be run as a background job/cron task
+        Runs periodically from the reminder scheduler; safe to run on several workers
+        at once since each webinar's reminders are sent under a lease and every
+        registration records when its reminder went out.
         """
         try:
             now = datetime.utcnow()
-            
-            # Find webinars that need 24h reminders
-            webinars_24h = list(webinars_collection.find({
-                'status': 'scheduled',
-                'send_reminders': True,
-                'scheduled_at': {
-                    '$gte': now + timedelta(hours=23, minutes=45),
-                    '$lte': now + timedelta(hours=24, minutes=15)
-                }
-            }))
-            
-            # Find webinars that need 1h reminders
-            webinars_1h = list(webinars_collection.find({
-                'status': 'scheduled',
-                'send_reminders': True,
-                'scheduled_at': {
-                    '$gte': now + timedelta(minutes=45),
-                    '$lte': now + timedelta(hours=1, minutes=15)
-                }
-            }))
-            
-            logger.info(f"Found {len(webinars_24h)} webinars for 24h reminders")
-            logger.info(f"Found {len(webinars_1h)} webinars for 1h reminders")
-            
-            # Send 24h reminders
-            for webinar in webinars_24h:
-                registrations = list(webinar_registrations_collection.find({
-                    'webinar_id': webinar['id'],
-                    'status': 'registered'
-                }))
+            sent = {}
+            
+            for reminder_type, (window_start, window_end) in REMINDER_WINDOWS.items():
+                # Find webinars whose reminder window is open
+                webinars = webinars_collection.find({
+                    'status': 'scheduled',
+                    'send_reminders': True,
+                    'scheduled_at': {
+                        '$gte': now + window_start,
+                        '$lte': now + window_end
+                    }
+                }, {'_id': 0})
                 
-                for registration in registrations:
-                    self.send_reminder_24h(webinar, registration)
+                sent[reminder_type] = 0
+                for webinar in webinars:
+                    sent[reminder_type] += self._send_due_reminders(reminder_type, webinar)
             
-            # Send 1h reminders
-            for webinar in webinars_1h:
-                registrations = list(webinar_registrations_collection.find({
-                    'webinar_id': webinar['id'],
-                    'status': 'registered'
-                }))
-                
-                for registration in registrations:
-                    self.send_reminder_1h(webinar, registration)
+            logger.info(f"Sent {sent['24h']} 24h reminders and {sent['1h']} 1h reminders")
             
             return {
                 'success': True,
-                '24h_reminders_sent': len(webinars_24h),
-                '1h_reminders_sent': len(webinars_1h)
+                '24h_reminders_sent': sent['24h'],
+                '1h_reminders_sent': sent['1h']
             }
             
         except Exception as e:
             logger.error(f"Error processing reminders: {str(e)}")
             return {'success': False, 'error': str(e)}
     
+    async def run_reminder_scheduler(self, interval_seconds: int = REMINDER_INTERVAL_SECONDS):
+        """Process due reminders every interval until cancelled"""
+        logger.info(f"Webinar reminder scheduler started (every {interval_seconds}s)")
+        while True:
+            # Database and email calls are blocking, keep them off the event loop
+            await asyncio.to_thread(self.process_scheduled_reminders)
+            await asyncio.sleep(interval_seconds)
+    
+    def _send_due_reminders(self, reminder_type: str, webinar: dict) -> int:
+        """Send one reminder type to every registrant of a webinar that hasn't had it yet"""
+        lease_name = f"webinar_reminder:{reminder_type}:{webinar['id']}"
+        if not acquire_lease(lease_name, REMINDER_LEASE_SECONDS):
+            return 0
+        
+        sent_field = f"reminder_{reminder_type}_sent_at"
+        sent_count = 0
+        
+        try:
+            # Render once per webinar; recipients are merged in by the bulk sender
+            rendered = self.render(f"reminder_{reminder_type}", webinar)
+            subject, html_content = rendered.subject, rendered.placeholder_html
+            
+            cursor = webinar_registrations_collection.find({
+                'webinar_id': webinar['id'],
+                'status': 'registered',
+                sent_field: None
+            }, {'_id': 0, 'id': 1, 'email': 1, 'first_name': 1}).batch_size(REMINDER_BATCH_SIZE)
+            
+            batch = []
+            for registration in cursor:
+                batch.append(registration)
+                if len(batch) >= REMINDER_BATCH_SIZE:
+                    sent_count += self._send_reminder_batch(reminder_type, webinar, subject, html_content, batch)
+                    batch = []
+                    # Keep the lease while working through large registrant lists
+                    acquire_lease(lease_name, REMINDER_LEASE_SECONDS)
+            
+            if batch:
+                sent_count += self._send_reminder_batch(reminder_type, webinar, subject, html_content, batch)
+        finally:
+            release_lease(lease_name)
+        
+        return sent_count
+    
+    def _send_reminder_batch(
+        self,
+        reminder_type: str,
+        webinar: dict,
+        subject: str,
+        html_content: str,
+        registrations: List[dict]
+    ) -> int:
+        """Send a batch of reminders through the bulk path and record them as sent"""
+        recipients = [{
+            'email': registration['email'],
+            'data': RenderedEmail.recipient_data(registration)
+        } for registration in registrations]
+        
+        results = self.email_service.send_bulk_emails(
+            recipients=recipients,
+            subject=subject,
+            html_content=html_content,
+            from_name=self.from_name,
+            from_email=self.from_email
+        )
+        
+        now = datetime.utcnow()
+        sent_ids = [
+            registration['id']
+            for registration, result in zip(registrations, results)
+            if result.get('success')
+        ]
+        if sent_ids:
+            webinar_registrations_collection.update_many(
+                {'id': {'$in': sent_ids}},
+                {'$set': {f"reminder_{reminder_type}_sent_at": now}}
+            )
+        
+        self._log_emails([
+            self._build_log_entry(
+                webinar_id=webinar['id'],
+                recipient_email=result['email'],
+                subject=subject,
+                status='sent' if result.get('success') else 'failed',
+                email_type=f"reminder_{reminder_type}",
+                provider=result.get('provider'),
+                error_message=result.get('error')
+            )
+            for result in results
+        ])
+        
+        return len(sent_ids)
+    
+    def _build_log_entry(
+        self,
+        webinar_id: str,
+        recipient_email: str,
+        subject: str,
+        status: str,
+        email_type: str,
+        provider: str = 'mock',
+        error_message: str = None
+    ) -> dict:
+        """Build a webinar email log document"""
+        return {
+            'id': str(uuid.uuid4()),
+            'webinar_id': webinar_id,
+            'recipient_email': recipient_email,
+            'subject': subject,
+            'status': status,
+            'email_type': email_type,  # registration_confirmation, reminder_24h, reminder_1h, thank_you
+            'provider': provider,
+            'error_message': error_message,
+            'sent_at': datetime.utcnow() if status == 'sent' else None,
+            'created_at': datetime.utcnow()
+        }
+    
     def _log_email(
         self,
         webinar_id: str,
@@ -466,22 +365,16 @@ class WebinarEmailService:
         error_message: str = None
     ):
         """Log webinar email for tracking"""
+        self._log_emails([self._build_log_entry(
+            webinar_id, recipient_email, subject, status, email_type, provider, error_message
+        )])
+    
+    def _log_emails(self, log_entries: List[dict]):
+        """Log a batch of webinar emails in one write"""
         try:
-            log_entry = {
-                'id': str(uuid.uuid4()),
-                'webinar_id': webinar_id,
-                'recipient_email': recipient_email,
-                'subject': subject,
-                'status': status,
-                'email_type': email_type,  # registration_confirmation, reminder_24h, reminder_1h, thank_you
-                'provider': provider,
-                'error_message': error_message,
-                'sent_at': datetime.utcnow() if status == 'sent' else None,
-                'created_at': datetime.utcnow()
-            }
-            
-            # Store in email_logs_collection
-            email_logs_collection.insert_one(log_entry)
+            if log_entries:
+                # Store in email_logs_collection
+                email_logs_collection.insert_many(log_entries)
             
         except Exception as e:
             logger.error(f"Error logging email: {str(e)}")
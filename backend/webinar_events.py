@@ -0,0 +1,93 @@
+"""
+Webinar Live Events - In-process pub/sub for webinar chat, Q&A and polls
+Writes publish an event to the webinar's room and every connected attendee
+receives it over one stream, so read load no longer grows with polling
+attendees. Delivery goes through a Broker; the default LocalBroker fans out
+inside this process, and a shared broker can be plugged in with set_broker()
+so several workers serve the same room.
+"""
+
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+# Events buffered per subscriber; a subscriber that falls this far behind loses its oldest events
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class Broker(ABC):
+    """Carries published events to every process serving a room"""
+
+    def start(self, deliver: Callable[[str, dict], None]):
+        """Register the callback that hands events to local subscribers"""
+        self._deliver = deliver
+
+    @abstractmethod
+    def publish(self, webinar_id: str, event: dict):
+        """Send an event to every process's deliver callback (including this one's)"""
+
+
+class LocalBroker(Broker):
+    """Single-process broker: events are delivered immediately"""
+
+    def publish(self, webinar_id: str, event: dict):
+        self._deliver(webinar_id, event)
+
+
+class WebinarEventHub:
+    def __init__(self, broker: Optional[Broker] = None):
+        self._rooms: Dict[str, Set[asyncio.Queue]] = {}
+        self._listeners: List[Callable[[str, dict], None]] = []
+        self._ids = itertools.count(1)
+        self.set_broker(broker or LocalBroker())
+
+    def set_broker(self, broker: Broker):
+        self.broker = broker
+        broker.start(self._deliver)
+
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        """Call listener(webinar_id, event) for every event delivered to this process"""
+        self._listeners.append(listener)
+
+    def publish(self, webinar_id: str, event: str, data: Any):
+        """Publish an event (e.g. chat.message, qa.updated, poll.updated) to a webinar's room"""
+        if isinstance(data, dict):
+            data = {k: v for k, v in data.items() if k != '_id'}
+        self.broker.publish(webinar_id, {"id": next(self._ids), "event": event, "data": data})
+
+    def _deliver(self, webinar_id: str, event: dict):
+        for listener in self._listeners:
+            listener(webinar_id, event)
+        for queue in self._rooms.get(webinar_id, ()):
+            if queue.full():
+                queue.get_nowait()  # Drop the oldest event rather than block the publisher
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, webinar_id: str) -> AsyncIterator[asyncio.Queue]:
+        """Receive the room's events on a queue for the duration of the block"""
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self._rooms.setdefault(webinar_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            room = self._rooms.get(webinar_id)
+            if room is not None:
+                room.discard(queue)
+                if not room:
+                    del self._rooms[webinar_id]
+
+    async def events(self, webinar_id: str) -> AsyncIterator[dict]:
+        """Iterate over the room's events until the consumer stops"""
+        async with self.subscribe(webinar_id) as queue:
+            while True:
+                yield await queue.get()
+
+    def audience(self, webinar_id: str) -> int:
+        """Number of connected subscribers in a room"""
+        return len(self._rooms.get(webinar_id, ()))
+
+
+webinar_events = WebinarEventHub()
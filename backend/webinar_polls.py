@@ -0,0 +1,263 @@
+"""
+Webinar Poll Votes - Exact, coalesced vote counting for live polls
+Votes are validated against a cached copy of the poll, deduplicated per voter,
+and accumulated in memory. Every flush stores the ballots with one insert_many
+(skipping voters that already voted on another worker) and applies all
+accepted votes with $inc updates in one bulk_write, in a single transaction
+so a failed flush can be retried without losing or double-counting votes.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from database import webinar_polls_collection, webinar_poll_votes_collection, run_transaction
+from webinar_events import webinar_events
+
+logger = logging.getLogger(__name__)
+
+# Set to 0 to write every vote as it arrives
+POLL_FLUSH_INTERVAL = float(os.getenv('WEBINAR_POLL_FLUSH_INTERVAL_SECONDS', 0.25))
+# Edits and votes made on other workers are picked up after at most this many seconds
+POLL_CACHE_TTL = float(os.getenv('WEBINAR_POLL_CACHE_TTL_SECONDS', 2))
+MAX_TRACKED_POLLS = 1000
+DUPLICATE_KEY = 11000
+
+
+class PollVoteError(Exception):
+    """Base class for rejected votes"""
+    status_code = 400
+
+
+class PollNotFound(PollVoteError):
+    status_code = 404
+
+
+class PollClosed(PollVoteError):
+    status_code = 400
+
+
+class DuplicateVote(PollVoteError):
+    status_code = 409
+
+
+class PollState:
+    __slots__ = ('poll', 'loaded_at', 'voters')
+
+    def __init__(self, poll: dict, voters: set):
+        self.poll = poll
+        self.loaded_at = time.monotonic()
+        self.voters = voters
+
+
+class PollVoteCounter:
+    def __init__(self, flush_interval: float = POLL_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._polls: "OrderedDict[str, PollState]" = OrderedDict()
+        self._pending: Dict[str, List[dict]] = {}  # poll_id -> ballots not yet written
+        self._writing: Dict[str, List[dict]] = {}  # Ballots of the flush in progress
+
+    def _unwritten(self, poll_id: str) -> List[dict]:
+        return self._writing.get(poll_id, []) + self._pending.get(poll_id, [])
+
+    def _state(self, webinar_id: str, poll_id: str) -> Optional[PollState]:
+        state = self._polls.get(poll_id)
+        if state is not None and time.monotonic() - state.loaded_at < POLL_CACHE_TTL:
+            self._polls.move_to_end(poll_id)
+            return state if state.poll['webinar_id'] == webinar_id else None
+
+        poll = webinar_polls_collection.find_one({"id": poll_id}, {'_id': 0})
+        if not poll:
+            self._polls.pop(poll_id, None)
+            return None
+
+        if state is not None:
+            voters = state.voters
+        else:
+            voters = {
+                ballot['voter_id'] for ballot in webinar_poll_votes_collection.find(
+                    {"poll_id": poll_id, "voter_id": {"$type": "string"}}, {'_id': 0, 'voter_id': 1}
+                )
+            }
+            voters.update(b['voter_id'] for b in self._unwritten(poll_id) if b.get('voter_id'))
+
+        state = self._polls[poll_id] = PollState(poll, voters)
+        self._polls.move_to_end(poll_id)
+        if len(self._polls) > MAX_TRACKED_POLLS:
+            self._polls.popitem(last=False)
+        return state if poll['webinar_id'] == webinar_id else None
+
+    def _tally(self, state: PollState) -> dict:
+        """The poll with votes that haven't been written yet counted in"""
+        poll = dict(state.poll)
+        votes = dict(poll.get('votes', {}))
+        total = poll.get('total_votes', 0)
+        for ballot in self._unwritten(poll['id']):
+            total += 1
+            for index in ballot['option_indices']:
+                votes[str(index)] = votes.get(str(index), 0) + 1
+        poll['votes'] = votes
+        poll['total_votes'] = total
+        return poll
+
+    async def vote(
+        self,
+        webinar_id: str,
+        poll_id: str,
+        option_indices: List[int],
+        voter_id: Optional[str] = None,
+        voter_name: Optional[str] = None
+    ) -> dict:
+        """
+        Count a vote and return the poll with its current tallies
+
+        Raises:
+            PollNotFound, PollClosed or DuplicateVote
+        """
+        state = self._state(webinar_id, poll_id)
+        if state is None:
+            raise PollNotFound("Poll not found")
+        if not state.poll.get('is_active', False):
+            raise PollClosed("Poll is not active")
+        if voter_id:
+            if voter_id in state.voters:
+                raise DuplicateVote("You have already voted on this poll")
+            state.voters.add(voter_id)
+
+        votes = state.poll.get('votes', {})
+        ballot = {
+            'id': str(uuid.uuid4()),
+            'poll_id': poll_id,
+            'webinar_id': webinar_id,
+            'option_indices': sorted({i for i in option_indices if str(i) in votes}),
+            'voter_name': voter_name,
+            'created_at': datetime.utcnow()
+        }
+        if voter_id:
+            ballot['voter_id'] = voter_id
+        self._pending.setdefault(poll_id, []).append(ballot)
+
+        if self.flush_interval <= 0:
+            await self.flush()
+        return self._tally(state)
+
+    @staticmethod
+    def _write(batch: Dict[str, List[dict]]) -> Dict[str, List[dict]]:
+        """Store ballots and apply the accepted ones; returns the accepted ballots per poll"""
+        ballots = [ballot for poll_ballots in batch.values() for ballot in poll_ballots]
+        ids = [ballot['id'] for ballot in ballots]
+
+        def write(session) -> Dict[str, List[dict]]:
+            # Ballots stored by an earlier attempt whose counts were never applied
+            stored = {
+                doc['id'] for doc in webinar_poll_votes_collection.find(
+                    {'id': {'$in': ids}}, {'_id': 0, 'id': 1}, session=session
+                )
+            }
+            # Voters whose vote on the poll was already stored by another worker
+            voted = set()
+            voter_filters = [
+                {'poll_id': poll_id, 'voter_id': {'$in': [b['voter_id'] for b in poll_ballots if b.get('voter_id')]}}
+                for poll_id, poll_ballots in batch.items() if any(b.get('voter_id') for b in poll_ballots)
+            ]
+            if voter_filters:
+                voted = {
+                    (doc['poll_id'], doc['voter_id']) for doc in webinar_poll_votes_collection.find(
+                        {'$or': voter_filters, 'id': {'$nin': ids}},
+                        {'_id': 0, 'poll_id': 1, 'voter_id': 1},
+                        session=session
+                    )
+                }
+
+            rejected = {b['id'] for b in ballots if (b['poll_id'], b.get('voter_id')) in voted}
+            new = [b for b in ballots if b['id'] not in stored and b['id'] not in rejected]
+            if new:
+                try:
+                    # Insert copies so the queued ballots don't pick up an ObjectId
+                    webinar_poll_votes_collection.insert_many([dict(b) for b in new], ordered=False, session=session)
+                except BulkWriteError as e:
+                    # Only reachable without transactions: a voter's ballot stored since the read above
+                    if session is not None:
+                        raise
+                    for error in e.details.get('writeErrors', []):
+                        if error.get('code') != DUPLICATE_KEY:
+                            raise
+                        rejected.add(new[error['index']]['id'])
+
+            accepted = {}
+            operations = []
+            for poll_id, poll_ballots in batch.items():
+                poll_ballots = [b for b in poll_ballots if b['id'] not in rejected]
+                if not poll_ballots:
+                    continue
+                increments = {"total_votes": len(poll_ballots)}
+                for ballot in poll_ballots:
+                    for index in ballot['option_indices']:
+                        key = f"votes.{index}"
+                        increments[key] = increments.get(key, 0) + 1
+                operations.append(UpdateOne({"id": poll_id}, {"$inc": increments}))
+                accepted[poll_id] = poll_ballots
+
+            if operations:
+                webinar_polls_collection.bulk_write(operations, ordered=False, session=session)
+            return accepted
+
+        # Ballots and tallies commit together, so a failed flush can be retried as a whole
+        return run_transaction(write)
+
+    async def flush(self):
+        """Write pending votes and broadcast the new tallies"""
+        if not self._pending:
+            return
+        batch = self._writing = self._pending
+        self._pending = {}
+        started = time.monotonic()
+        try:
+            # Blocking database calls, keep them off the event loop
+            accepted = await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error(f"Error writing poll votes: {str(e)}")
+            for poll_id, ballots in batch.items():
+                self._pending[poll_id] = ballots + self._pending.get(poll_id, [])
+            return
+        finally:
+            self._writing = {}
+
+        for poll_id, ballots in batch.items():
+            state = self._polls.get(poll_id)
+            if state is None:
+                continue
+            # Apply the accepted votes to the cached poll, unless it was reloaded with them already
+            for ballot in accepted.get(poll_id, []) if state.loaded_at < started else []:
+                state.poll['total_votes'] = state.poll.get('total_votes', 0) + 1
+                votes = state.poll.setdefault('votes', {})
+                for index in ballot['option_indices']:
+                    votes[str(index)] = votes.get(str(index), 0) + 1
+            webinar_events.publish(state.poll['webinar_id'], "poll.updated", self._tally(state))
+
+    async def run_flusher(self):
+        """Flush votes every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def invalidate(self, poll_id: str):
+        """Reload a poll on its next vote (e.g. after it is edited)"""
+        state = self._polls.get(poll_id)
+        if state is not None:
+            state.loaded_at = 0
+
+    def drop(self, poll_ids: List[str]):
+        """Forget deleted polls and their unwritten votes"""
+        for poll_id in poll_ids:
+            self._polls.pop(poll_id, None)
+            self._pending.pop(poll_id, None)
+
+
+poll_votes = PollVoteCounter()
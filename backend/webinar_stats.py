@@ -0,0 +1,135 @@
+"""
+Webinar Stats - Engagement counters kept on the webinar document
+Registrations by status, chat messages, questions, answered questions, polls
+and attended watch time are maintained with $inc as they are written, so
+analytics read one document per webinar instead of counting events. Webinars
+created before the counters existed (no `stats_since`) are backfilled on
+first read.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable
+from pymongo import UpdateOne
+from database import (
+    webinars_collection,
+    webinar_registrations_collection,
+    webinar_chat_messages_collection,
+    webinar_qa_collection,
+    webinar_polls_collection
+)
+
+REGISTRATION_STATUSES = ("registered", "attended", "no_show", "cancelled")
+SUMMARY_FIELDS = (
+    "total_webinars",
+    "upcoming_webinars",
+    "completed_webinars",
+    "total_registrations",
+    "total_attendees",
+    "total_chat_messages",
+    "total_questions"
+)
+
+
+def empty_stats() -> dict:
+    return {
+        "registrations_total": 0,
+        "registrations": {status: 0 for status in REGISTRATION_STATUSES},
+        "chat_messages": 0,
+        "questions": 0,
+        "answered_questions": 0,
+        "polls": 0,
+        "watch_time_minutes": 0  # Sum over attended registrations
+    }
+
+
+def _inc(deltas: Dict[str, int]) -> dict:
+    return {"$inc": {f"stats.{field}": delta for field, delta in deltas.items()}}
+
+
+def increment(webinar_id: str, deltas: Dict[str, int]):
+    """Apply counter deltas, e.g. {"questions": 1} or {"registrations.registered": 1}"""
+    webinars_collection.update_one({"id": webinar_id}, _inc(deltas))
+
+
+def increment_many(deltas_by_webinar: Dict[str, Dict[str, int]]):
+    """Apply counter deltas for several webinars in one bulk write"""
+    operations = [
+        UpdateOne({"id": webinar_id}, _inc(deltas))
+        for webinar_id, deltas in deltas_by_webinar.items() if deltas
+    ]
+    if operations:
+        webinars_collection.bulk_write(operations, ordered=False)
+
+
+def rebuild(webinar_id: str) -> dict:
+    """Recount a webinar's counters from its registrations, chat, Q&A and polls"""
+    stats = empty_stats()
+
+    for row in webinar_registrations_collection.aggregate([
+        {"$match": {"webinar_id": webinar_id}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}, "watch_time": {"$sum": "$watch_time_minutes"}}}
+    ]):
+        stats["registrations_total"] += row["count"]
+        stats["registrations"][row["_id"]] = row["count"]
+        if row["_id"] == "attended":
+            stats["watch_time_minutes"] = row["watch_time"]
+
+    for row in webinar_qa_collection.aggregate([
+        {"$match": {"webinar_id": webinar_id}},
+        {"$group": {"_id": "$is_answered", "count": {"$sum": 1}}}
+    ]):
+        stats["questions"] += row["count"]
+        if row["_id"] is True:
+            stats["answered_questions"] = row["count"]
+
+    stats["chat_messages"] = webinar_chat_messages_collection.count_documents({"webinar_id": webinar_id})
+    stats["polls"] = webinar_polls_collection.count_documents({"webinar_id": webinar_id})
+
+    webinars_collection.update_one(
+        {"id": webinar_id},
+        {"$set": {"stats": stats, "stats_since": datetime.utcnow()}}
+    )
+    return stats
+
+
+def stats_for(webinar: dict) -> dict:
+    """A webinar's counters, backfilling them if it predates them"""
+    if 'stats_since' not in webinar:
+        return rebuild(webinar['id'])
+    return webinar.get('stats', {})
+
+
+def backfill(webinar_ids: Iterable[str]):
+    """Build counters for webinars that don't have them yet"""
+    for webinar_id in webinar_ids:
+        rebuild(webinar_id)
+
+
+def summary(user_id: str) -> dict:
+    """Webinar counts and summed engagement counters for a user, in one aggregation"""
+    backfill(
+        w["id"] for w in webinars_collection.find(
+            {"user_id": user_id, "stats_since": {"$exists": False}}, {"_id": 0, "id": 1}
+        )
+    )
+
+    rows = list(webinars_collection.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": None,
+            "total_webinars": {"$sum": 1},
+            "upcoming_webinars": {"$sum": {"$cond": [
+                {"$and": [
+                    {"$eq": ["$status", "scheduled"]},
+                    {"$gte": ["$scheduled_at", datetime.utcnow()]}
+                ]}, 1, 0
+            ]}},
+            "completed_webinars": {"$sum": {"$cond": [{"$eq": ["$status", "ended"]}, 1, 0]}},
+            "total_registrations": {"$sum": "$stats.registrations_total"},
+            "total_attendees": {"$sum": "$stats.registrations.attended"},
+            "total_chat_messages": {"$sum": "$stats.chat_messages"},
+            "total_questions": {"$sum": "$stats.questions"}
+        }}
+    ]))
+
+    return {field: rows[0][field] if rows else 0 for field in SUMMARY_FIELDS}